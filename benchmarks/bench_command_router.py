@@ -0,0 +1,61 @@
+"""
+Routing one incoming message: the old registration (one NewMessage handler
+per command pattern plus a catch-all, every pattern tried on every message)
+against CommandTrie (command split once, one lookup, one handler)
+
+    python benchmarks/bench_command_router.py
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.command_router import CommandTrie, Route, parse_command
+
+COMMANDS = [
+    "/start", "/valide", "/payer une semaine", "/payer un mois", "/payer", "/deposer", "/connect",
+    "/redirection", "/transformation", "/whitelist", "/blacklist", "/chats", "/help", "/admin",
+    "/confirm", "/generate", "/users", "/stats", "/sessions", "/latency", "/logs", "/stop",
+    "/start_continuous", "/keepalive", "/railway", "/railway deploy", "/railway test",
+]
+
+MESSAGES = [
+    "/railway test",
+    "/redirection add g1 on 2759205517",
+    "/help",
+    "Hello there, forwarded message text",
+    "/foo",
+]
+
+def main(number=200000):
+    # Before: NewMessage(pattern=...) per command, plus the surveillance phrase and the catch-all
+    patterns = [re.compile(command).match for command in COMMANDS]
+    patterns.append(re.compile("Kouamé Appolinaire tu es là ?").match)
+    known = sorted({command.split()[0] for command in COMMANDS})
+
+    def handlers(text):
+        hits = [pattern for pattern in patterns if pattern(text)]
+        unknown = text.startswith('/') and not any(text.startswith(command) for command in known)
+        return hits, unknown
+
+    trie = CommandTrie()
+    for command in COMMANDS:
+        trie.add(Route(command, None))
+
+    def router(text):
+        words = parse_command(text)
+        return trie.match(words) if words else None
+
+    print("microseconds per message, handlers run")
+    for text in MESSAGES:
+        before = timeit.timeit(lambda: handlers(text), number=number) / number * 1e6
+        after = timeit.timeit(lambda: router(text), number=number) / number * 1e6
+        # Every matching pattern handler plus the catch-all ran before
+        print(f"  {text[:36]:38s} patterns {before:5.2f}us ({len(handlers(text)[0]) + 1} handlers), "
+              f"trie {after:5.2f}us (1 handler)")
+
+if __name__ == "__main__":
+    main()
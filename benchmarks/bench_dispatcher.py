@@ -0,0 +1,59 @@
+"""
+Routing one update on a client with N redirections: one Telethon handler
+per redirection, each checking its chats= filter (before the dispatcher),
+against the RedirectionDispatcher source index
+
+    python benchmarks/bench_dispatcher.py [RULES...]
+"""
+
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.dispatcher import RedirectionDispatcher, source_peer_ids
+
+UPDATES = 20000
+
+class NullClient:
+    def add_event_handler(self, callback, event):
+        pass
+
+async def callback(event, rule, is_edit):
+    pass
+
+async def per_rule_handlers(rules, events):
+    # What Telethon did with one NewMessage(chats=source) handler per redirection
+    handlers = [(source_peer_ids(source_id), name) for name, source_id in rules]
+    for event in events:
+        for peer_ids, name in handlers:
+            if event.chat_id in peer_ids:
+                await callback(event, name, False)
+
+async def dispatcher_index(rules, events):
+    dispatcher = RedirectionDispatcher(NullClient())
+    for name, source_id in rules:
+        dispatcher.add_rule(name, source_id, -1, callback)
+    for event in events:
+        await dispatcher.dispatch(event)
+
+def timed(func, rules, events):
+    started = time.perf_counter()
+    asyncio.run(func(rules, events))
+    return (time.perf_counter() - started) / len(events) * 1e6
+
+def main(sizes=(10, 100, 1000)):
+    print(f"{UPDATES} updates, microseconds per update")
+    for size in sizes:
+        rules = [(f"r{i}", -1000000000000 - i) for i in range(size)]
+        # Most updates come from chats no redirection reads
+        events = [SimpleNamespace(chat_id=-1000000000000 - (i % (size * 4))) for i in range(UPDATES)]
+        before = timed(per_rule_handlers, rules, events)
+        after = timed(dispatcher_index, rules, events)
+        print(f"  {size:5d} rules: per-rule handlers {before:8.2f}us, dispatcher {after:6.2f}us")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or (10, 100, 1000))
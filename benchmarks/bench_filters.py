@@ -0,0 +1,39 @@
+"""
+Whitelist check of one message against N keywords: a loop over the
+keywords (substring test each) against CompiledFilter (one trie regex)
+
+    python benchmarks/bench_filters.py [KEYWORDS...]
+"""
+
+import os
+import sys
+import random
+import string
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.filters import CompiledFilter
+
+def keyword_loop(keywords, message):
+    text = message.text.lower()
+    return any(keyword in text for keyword in keywords)
+
+def main(sizes=(10, 100, 1000, 5000)):
+    rng = random.Random(1)
+    words = lambda n: ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(n)]
+    # A typical channel post that matches nothing (the common case for a whitelist)
+    message = SimpleNamespace(text=" ".join(words(60)).capitalize() + ".", sender_id=None, sender=None)
+    print("microseconds per message (no match)")
+    for size in sizes:
+        keywords = sorted(set(words(size)))
+        compiled = CompiledFilter({"keywords": keywords})
+        assert keyword_loop(keywords, message) == compiled.matches(message)
+        number = 2000
+        loop = timeit.timeit(lambda: keyword_loop(keywords, message), number=number) / number * 1e6
+        trie = timeit.timeit(lambda: compiled.matches(message), number=number) / number * 1e6
+        print(f"  {size:5d} keywords: loop {loop:8.2f}us, compiled trie {trie:6.2f}us")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or (10, 100, 1000, 5000))
@@ -0,0 +1,72 @@
+"""
+Licence reads / writes for N users: re-reading and re-writing user_data.json
+per call (the old database.py) against JsonStorage (in memory, batched flush)
+
+    python benchmarks/bench_storage.py [USERS]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.storage import JsonStorage, default_data
+
+def naive_read(path, user_id):
+    with open(path) as f:
+        return json.load(f)["licenses"].get(user_id)
+
+def naive_write(path, user_id, record):
+    with open(path) as f:
+        data = json.load(f)
+    data["licenses"][user_id] = record
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+def rate(count, seconds):
+    return f"{count / seconds:,.0f}/s"
+
+def main(users=5000):
+    with tempfile.TemporaryDirectory() as tmp:
+        naive_path = os.path.join(tmp, "naive.json")
+        data = default_data()
+        data["licenses"] = {str(i): {"license": "x" * 30, "active": True} for i in range(users)}
+        with open(naive_path, "w") as f:
+            json.dump(data, f)
+        sample = min(users, 200)  # the naive path is slow: time a sample
+
+        started = time.perf_counter()
+        for i in range(sample):
+            naive_read(naive_path, str(i))
+        naive_reads = rate(sample, time.perf_counter() - started)
+        started = time.perf_counter()
+        for i in range(sample):
+            naive_write(naive_path, str(i), {"license": "y" * 30, "active": True})
+        naive_writes = rate(sample, time.perf_counter() - started)
+
+        storage = JsonStorage(os.path.join(tmp, "store.json"), flush_delay=0.5)
+        storage.data = data
+
+        async def batched():
+            started = time.perf_counter()
+            for i in range(users):
+                storage.get_license(str(i))
+            reads = rate(users, time.perf_counter() - started)
+            started = time.perf_counter()
+            for i in range(users):
+                storage.set_license(str(i), {"license": "y" * 30, "active": True})
+            writes = rate(users, time.perf_counter() - started)
+            await asyncio.sleep(1)
+            return reads, writes
+
+        reads, writes = asyncio.run(batched())
+        print(f"{users} users, licence reads / writes")
+        print(f"  file per call: {naive_reads} reads, {naive_writes} writes")
+        print(f"  JsonStorage:   {reads} reads, {writes} writes ({storage.flush_count} file write)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
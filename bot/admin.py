@@ -34,6 +34,10 @@ async def handle_admin_commands(event, client):
             await handle_stats(event, client)
         elif message_text.startswith("/sessions"):
             await handle_sessions(event, client)
+        elif message_text.startswith("/latency"):
+            await handle_latency(event, client)
+        elif message_text.startswith("/logs"):
+            await handle_logs(event, client)
         else:
             await event.respond("❓ Commande admin non reconnue. Tapez /admin pour voir les commandes disponibles.")
             
@@ -56,6 +60,8 @@ async def show_admin_help(event, client):
 • `/users` - Liste des utilisateurs inscrits
 • `/stats` - Statistiques du bot
 • `/sessions` - Sessions connectées et redirections actives
+• `/latency [NOM]` - Latence des redirections (p50 / p95)
+• `/logs` - Échantillonnage et limitation des logs par message
 
 📝 **Formats d'exemple :**
 • `/confirm 1190237801` - Confirme paiement pour l'utilisateur
@@ -210,6 +216,13 @@ async def handle_stats(event, client):
         total_connections = len(data.get("connections", {}))
         total_redirections = sum(len(redirections) for redirections in data.get("redirections", {}).values())
         
+        from bot.entity_cache import get_cache_stats
+        cache_stats = get_cache_stats()
+        from bot.send_queue import get_send_stats
+        send_stats = get_send_stats()
+        from bot.dedup import dedup_cache
+        dedup_stats = dedup_cache.stats()
+        
         stats_message = f"""
 📊 **STATISTIQUES DU BOT**
 
@@ -224,9 +237,36 @@ async def handle_stats(event, client):
 • Listes blanches : {len(data.get("whitelists", {}))}
 • Listes noires : {len(data.get("blacklists", {}))}
 
+🗂️ **Cache des entités :**
+• Clients : {cache_stats['clients']}
+• Entrées : {cache_stats['size']}
+• Hits / Misses : {cache_stats['hits']} / {cache_stats['misses']} ({cache_stats['hit_rate']:.1f}%)
+
+📤 **File d'envoi :**
+• Comptes : {send_stats['accounts']}
+• En attente : {send_stats['queue_depth']}
+• Envoyés / Échecs : {send_stats['sent']} / {send_stats['failed']}
+• FloodWait : {send_stats['flood_waits']}
+• Doublons ignorés : {dedup_stats['skipped']}
+• Attente file : {send_stats['queue_wait_avg'] * 1000:.0f} ms moy. / {send_stats['queue_wait_max'] * 1000:.0f} ms max
+• Appel API : {send_stats['api_time_avg'] * 1000:.0f} ms moy. / {send_stats['api_time_max'] * 1000:.0f} ms max
+
 🚀 **Statut :** Bot opérationnel
         """
         
+        # With sharding, sending happens in the workers
+        from bot.sharding import shard_coordinator
+        if shard_coordinator.active:
+            stats_message += "\n🧩 **Workers :**\n"
+            for index, worker in (await shard_coordinator.broadcast("stats", timeout=10)).items():
+                if isinstance(worker, Exception):
+                    stats_message += f"• Worker {index} : ❌ {worker}\n"
+                    continue
+                stats_message += (f"• Worker {index} (pid {worker['pid']}) : {worker['accounts']} compte(s), "
+                                  f"{worker['send']['sent']} envoyés / {worker['send']['failed']} échecs, "
+                                  f"{worker['send']['queue_depth']} en attente, "
+                                  f"{worker['dedup']['skipped']} doublons\n")
+        
         await event.respond(stats_message)
         
     except Exception as e:
@@ -237,7 +277,8 @@ async def handle_sessions(event, client):
     """Show active sessions and redirections"""
     try:
         from bot.database import load_data
-        from bot.connection import active_connections
+        from bot.connection import connection_registry
+        from bot.supervisor import client_supervisor, format_duration
         
         data = load_data()
         connections = data.get("connections", {})
@@ -246,16 +287,38 @@ async def handle_sessions(event, client):
         # Build sessions message
         sessions_message = "📱 **SESSIONS ACTIVES**\n\n"
         
-        # Active connection attempts (temporary sessions)
-        if active_connections:
+        # Live clients, one per (user, phone)
+        if len(connection_registry):
             sessions_message += "🔄 **Connexions en cours :**\n"
-            for user_id, conn_data in active_connections.items():
+            for (user_id, _), conn_data in connection_registry.items():
                 phone = conn_data.get('phone', 'Inconnu')
-                sessions_message += f"• Utilisateur {user_id} - {phone}\n"
+                status = "🟢" if conn_data['status'] == 'connected' else "⏳ code envoyé"
+                sessions_message += f"• Utilisateur {user_id} - {phone} {status} ({len(conn_data['handlers'])} redirections)\n"
             sessions_message += "\n"
         else:
             sessions_message += "🔄 **Connexions en cours :** Aucune\n\n"
         
+        # Supervisor health per account (reported by the workers when sharded)
+        supervised = client_supervisor.stats()
+        from bot.sharding import shard_coordinator
+        if shard_coordinator.active:
+            for worker in (await shard_coordinator.broadcast("stats", timeout=10)).values():
+                if not isinstance(worker, Exception):
+                    supervised.extend(worker['supervisor'])
+        if supervised:
+            states = {'up': "🟢", 'reconnecting': "🔄", 'down': "🔴", 'unknown': "⚪"}
+            sessions_message += "🩺 **Santé des clients :**\n"
+            for account in supervised:
+                sessions_message += f"• {account['user_id']} - {account['phone']} {states[account['state']]} "
+                if account['state'] == 'up':
+                    sessions_message += f"en ligne depuis {format_duration(account['uptime'])}"
+                elif account['downtime']:
+                    sessions_message += f"hors ligne depuis {format_duration(account['downtime'])}"
+                sessions_message += f", {account['reconnects']} reconnexion(s)\n"
+                if account['state'] != 'up' and account['last_error']:
+                    sessions_message += f"     ⚠️ {account['last_error'][:80]}\n"
+            sessions_message += "\n"
+        
         # Established connections
         if connections:
             sessions_message += "✅ **Connexions établies :**\n"
@@ -305,7 +368,7 @@ async def handle_sessions(event, client):
         
         # Summary
         total_active_connections = sum(len(conns) for conns in connections.values())
-        total_temp_connections = len(active_connections)
+        total_temp_connections = len(connection_registry)
         total_active_redirections = sum(
             sum(1 for redir in user_redirections.values() if redir.get('active', True))
             for user_redirections in redirections.values()
@@ -321,4 +384,112 @@ async def handle_sessions(event, client):
         
     except Exception as e:
         logger.error(f"Error showing sessions: {e}")
-        await event.respond("❌ Erreur lors de la récupération des sessions.")
\ No newline at end of file
+        await event.respond("❌ Erreur lors de la récupération des sessions.")
+
+async def handle_latency(event, client):
+    """Show forwarding latency percentiles per redirection (optionally only redirections matching a name)"""
+    try:
+        from bot.metrics import collect_snapshots, merge_snapshots
+        
+        parts = event.text.split(maxsplit=1)
+        name_filter = parts[1].strip().lower() if len(parts) > 1 else None
+        
+        histograms = merge_snapshots(*await collect_snapshots())
+        redirections = sorted({(user_id, name) for user_id, name, _ in histograms
+                               if name_filter is None or name_filter in name.lower()})
+        
+        if not redirections:
+            await event.respond("⏱️ **LATENCE DES REDIRECTIONS**\n\nAucune mesure pour le moment.")
+            return
+        
+        def bound(value):
+            return "> 300 s" if value == float('inf') else f"≤ {value:g} s"
+        
+        def percentiles(histogram):
+            if histogram is None or not histogram.count:
+                return "—"
+            return (f"p50 {bound(histogram.quantile(0.5))} · p95 {bound(histogram.quantile(0.95))} · "
+                    f"moy. {histogram.sum / histogram.count:.2f} s")
+        
+        latency_message = "⏱️ **LATENCE DES REDIRECTIONS**\n\n"
+        for user_id, name in redirections[:30]:
+            end_to_end = histograms.get((user_id, name, 'end_to_end'))
+            latency_message += f"🔀 **{name}** (utilisateur {user_id}) - {end_to_end.count if end_to_end else 0} message(s)\n"
+            latency_message += f"  📨 Bout en bout : {percentiles(end_to_end)}\n"
+            latency_message += f"  ⏳ File d'envoi : {percentiles(histograms.get((user_id, name, 'queue_wait')))}\n"
+            latency_message += f"  📡 Appel API : {percentiles(histograms.get((user_id, name, 'api_time')))}\n\n"
+        if len(redirections) > 30:
+            latency_message += f"… et {len(redirections) - 30} autre(s), précisez un nom : `/latency NOM`\n"
+        latency_message += "ℹ️ Les dates Telegram sont à la seconde : la latence de bout en bout est arrondie en conséquence."
+        
+        await event.respond(latency_message)
+        
+    except Exception as e:
+        logger.error(f"Error showing latency: {e}")
+        await event.respond("❌ Erreur lors de la récupération des latences.")
+
+LOGS_USAGE = """📝 **Usage :**
+• `/logs limit N` - N lignes max par redirection et fenêtre (0 = illimité)
+• `/logs window SECONDES` - Durée de la fenêtre
+• `/logs sample TAUX [LOGGER]` - Part des lignes gardées (0 à 1), pour tous ou un logger"""
+
+async def handle_logs(event, client):
+    """Show or change the sampling / rate limiting of per-message log lines (bot and workers)"""
+    try:
+        from bot.log_pipeline import hot_path_filter
+        from bot.sharding import shard_coordinator
+        
+        parts = event.text.split()
+        changes = {}
+        try:
+            if len(parts) == 3 and parts[1] == "limit":
+                changes['limit'] = max(0, int(parts[2]))
+            elif len(parts) == 3 and parts[1] == "window":
+                changes['window'] = max(1.0, float(parts[2]))
+            elif len(parts) in (3, 4) and parts[1] == "sample":
+                changes['sample'] = min(1.0, max(0.0, float(parts[2])))
+                if len(parts) == 4:
+                    changes['logger_name'] = parts[3]
+            elif len(parts) != 1:
+                raise ValueError(event.text)
+        except ValueError:
+            await event.respond(f"❌ Format incorrect.\n\n{LOGS_USAGE}")
+            return
+        
+        if changes:
+            hot_path_filter.configure(**changes)
+            logger.info(f"Hot path logging changed by admin: {changes}")
+        stats = [hot_path_filter.stats()]
+        if shard_coordinator.active:
+            for index, result in (await shard_coordinator.broadcast("log_config", timeout=10, **changes)).items():
+                if isinstance(result, Exception):
+                    logger.warning(f"Log settings of worker {index} unavailable: {result}")
+                else:
+                    stats.append(result)
+        
+        local = stats[0]
+        sample = f"{local['sample']:g}" + "".join(f", {name} : {rate:g}" for name, rate in local['samples'].items())
+        limit = f"{local['limit']} lignes / {local['window']:.0f} s par redirection" if local['limit'] else "aucune"
+        logs_message = f"""
+📝 **LOGS PAR MESSAGE**
+
+⚙️ **Réglages{" (appliqués aux workers)" if len(stats) > 1 else ""} :**
+• Échantillonnage : {sample}
+• Limitation : {limit}
+• Loggers : {", ".join(f"`{name}`" for name in local['loggers']) or "—"}
+
+📊 **Depuis le démarrage :**
+• Lignes écartées par échantillonnage : {sum(s['sampled_out'] for s in stats)}
+• Lignes supprimées par la limitation : {sum(s['suppressed'] for s in stats)}
+"""
+        noisy = sorted((item for s in stats for item in s['noisy']), key=lambda item: item[1], reverse=True)[:5]
+        if noisy:
+            logs_message += "\n🔊 **Plus bruyantes (fenêtre en cours) :**\n"
+            logs_message += "".join(f"• {key} : {count} supprimée(s)\n" for key, count in noisy)
+        logs_message += f"\n{LOGS_USAGE}"
+        
+        await event.respond(logs_message)
+        
+    except Exception as e:
+        logger.error(f"Error in logs command: {e}")
+        await event.respond("❌ Erreur lors de la gestion des logs.")
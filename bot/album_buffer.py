@@ -0,0 +1,112 @@
+"""
+Regroupement des albums (messages partageant un grouped_id) et des rafales
+Les éléments d'un album arrivent en événements séparés : on les attend
+brièvement pour les transférer en un seul appel et garder l'album intact.
+Le même mécanisme regroupe les rafales d'une source en un seul forward_messages
+"""
+
+import logging
+import os
+import time
+import asyncio
+from bot.dedup import dedup_cache, content_fingerprint
+from bot.send_queue import get_send_scheduler
+
+logger = logging.getLogger(__name__)
+
+ALBUM_BUFFER_WINDOW = float(os.getenv("ALBUM_BUFFER_WINDOW", "0.6"))  # seconds of silence that close an album
+FORWARD_BATCH_WINDOW = float(os.getenv("FORWARD_BATCH_WINDOW", "0.3"))  # seconds of silence that close a burst
+FORWARD_BATCH_MAX_DELAY = float(os.getenv("FORWARD_BATCH_MAX_DELAY", "2"))  # longest a burst is held
+
+# Telegram albums hold at most 10 items, forward_messages takes at most 100 ids
+ALBUM_MAX_ITEMS = 10
+FORWARD_BATCH_MAX_ITEMS = 100
+
+class AlbumBuffer:
+    """Collects album items per (source chat, grouped_id, destination), or bursts per (source, destination)"""
+
+    def __init__(self, window=ALBUM_BUFFER_WINDOW, max_items=ALBUM_MAX_ITEMS, max_delay=None):
+        self.window = window
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.groups = {}  # key -> {'messages', 'last', 'full'}
+        self.albums = 0
+        self.items = 0
+
+    async def collect(self, key, message):
+        """Add message to its album
+
+        The first caller of a key waits until no new item arrived for `window`
+        seconds, the group is full or `max_delay` seconds passed, and gets
+        every message, sorted by id; later callers get None and have nothing
+        left to do.
+        """
+        group = self.groups.get(key)
+        if group is not None:
+            group['messages'].append(message)
+            group['last'] = time.monotonic()
+            if len(group['messages']) >= self.max_items:
+                group['full'].set()
+            return None
+
+        started = time.monotonic()
+        group = {'messages': [message], 'last': started, 'full': asyncio.Event()}
+        self.groups[key] = group
+        try:
+            while not group['full'].is_set():
+                remaining = group['last'] + self.window - time.monotonic()
+                if self.max_delay is not None:
+                    remaining = min(remaining, started + self.max_delay - time.monotonic())
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(group['full'].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            del self.groups[key]
+
+        messages = sorted(group['messages'], key=lambda m: m.id)
+        self.albums += 1
+        self.items += len(messages)
+        return messages
+
+def batch_key(event, destination_id):
+    """Buffer key of a burst item for one destination"""
+    return (event.chat_id, int(destination_id))
+
+def album_key(event, destination_id):
+    """Buffer key of an album item for one destination"""
+    return (event.chat_id, event.message.grouped_id, int(destination_id))
+
+def map_album(mapping, source_chat, messages, destination_id, sent_messages):
+    """Record source -> destination ids for every forwarded album item"""
+    if not isinstance(sent_messages, list):
+        sent_messages = [sent_messages]
+    for original, sent in zip(messages, sent_messages):
+        if sent is not None and hasattr(sent, 'id'):
+            mapping.set(source_chat, original.id, destination_id, sent.id)
+
+async def forward_batch(client, source_chat, messages, destination_id, mapping, timings=None):
+    """Forward a burst with one forward_messages call, skipping duplicates; returns the forwarded messages"""
+    kept = []
+    for message in messages:
+        fingerprint = content_fingerprint(message.text, [message])
+        if dedup_cache.claim(destination_id, fingerprint):
+            kept.append((message, fingerprint))
+    if not kept:
+        return []
+    try:
+        sent_messages = await get_send_scheduler(client).forward_messages(int(destination_id), [m for m, _ in kept],
+                                                                          timings=timings)
+    except Exception:
+        for _, fingerprint in kept:
+            dedup_cache.release(destination_id, fingerprint)
+        raise
+    forwarded = [m for m, _ in kept]
+    map_album(mapping, source_chat, forwarded, destination_id, sent_messages)
+    return forwarded
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+album_buffer = AlbumBuffer()
+forward_batch_buffer = AlbumBuffer(FORWARD_BATCH_WINDOW, FORWARD_BATCH_MAX_ITEMS, FORWARD_BATCH_MAX_DELAY)
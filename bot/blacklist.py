@@ -1,4 +1,5 @@
 import logging
+from bot.filters import parse_filter_terms, format_rules
 
 logger = logging.getLogger(__name__)
 
@@ -15,16 +16,22 @@ async def handle_blacklist_command(event, client):
             usage_message = """
 ⛔ **Utilisation de /blacklist :**
 
-`/blacklist add NOM on NUMERO`
+`/blacklist add NOM on NUMERO règles`
 `/blacklist remove NOM on NUMERO`
-`/blacklist change NOM on NUMERO`
+`/blacklist change NOM on NUMERO règles`
 `/blacklist clear on NUMERO`
 
+**Règles** (séparées par des virgules, `\\,` pour une virgule dans une règle, ou une règle par ligne) :
+• `mot` - mot ou expression contenu dans le message
+• `regex:motif` - expression régulière
+• `from:@utilisateur` ou `from:ID` - expéditeur
+• `media:photo` - type de média (photo, video, gif, sticker, voice, audio, document, text)
+
 **Fonctionnalité :**
 La blacklist ignore tous les messages contenant certains mots ou regex.
 
 **Exemple :**
-`/blacklist add motInterdit on 229900112233`
+`/blacklist add maRedirection on 229900112233 pub, promo, from:@spambot`
             """
             await event.respond(usage_message)
             return
@@ -36,12 +43,13 @@ La blacklist ignore tous les messages contenant certains mots ou regex.
             return
         
         # Handle different blacklist actions
-        if parts[1] == "add" and len(parts) == 5 and parts[3] == "on":
-            await add_blacklist(event, client, parts[2], parts[4])
+        terms = message_text.split(None, 5)[5] if len(parts) > 5 else ""
+        if parts[1] == "add" and len(parts) >= 5 and parts[3] == "on":
+            await add_blacklist(event, client, parts[2], parts[4], terms)
         elif parts[1] == "remove" and len(parts) == 5 and parts[3] == "on":
             await remove_blacklist(event, client, parts[2], parts[4])
-        elif parts[1] == "change" and len(parts) == 5 and parts[3] == "on":
-            await change_blacklist(event, client, parts[2], parts[4])
+        elif parts[1] == "change" and len(parts) >= 5 and parts[3] == "on":
+            await change_blacklist(event, client, parts[2], parts[4], terms)
         elif parts[1] == "clear" and len(parts) == 4 and parts[2] == "on":
             await clear_blacklist(event, client, parts[3])
         else:
@@ -51,7 +59,7 @@ La blacklist ignore tous les messages contenant certains mots ou regex.
         logger.error(f"Error in blacklist command: {e}")
         await event.respond("❌ Erreur lors de la gestion de la blacklist. Veuillez réessayer.")
 
-async def add_blacklist(event, client, name, phone_number):
+async def add_blacklist(event, client, name, phone_number, terms):
     """Add a blacklist filter"""
     try:
         user_id = event.sender_id
@@ -61,8 +69,17 @@ async def add_blacklist(event, client, name, phone_number):
             await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.\nUtilisez `/valide` pour activer votre licence.")
             return
         
-        # Store blacklist
-        await store_blacklist(user_id, name, phone_number, "add")
+        # Parse rules, then store blacklist
+        try:
+            rules = parse_filter_terms(terms)
+        except ValueError as e:
+            await event.respond(f"❌ Règle invalide : {e}")
+            return
+        if not any(rules.values()):
+            await event.respond("❌ Indiquez au moins une règle. Tapez `/blacklist` pour voir l'utilisation.")
+            return
+        
+        await store_blacklist(user_id, name, phone_number, "add", rules)
         
         success_message = f"""
 ✅ **Filtre blacklist ajouté**
@@ -70,6 +87,7 @@ async def add_blacklist(event, client, name, phone_number):
 📝 **Nom :** {name}
 📞 **Numéro :** {phone_number}
 🔄 **Action :** Ajout
+🧮 **Règles :** {format_rules(rules)}
 
 Le filtre blacklist est maintenant actif !
 Les messages contenant les mots interdits seront ignorés.
@@ -93,7 +111,9 @@ async def remove_blacklist(event, client, name, phone_number):
             return
         
         # Remove blacklist
-        await store_blacklist(user_id, name, phone_number, "remove")
+        if not await store_blacklist(user_id, name, phone_number, "remove"):
+            await event.respond(f"❌ Aucun filtre blacklist pour **{name}** sur {phone_number}.")
+            return
         
         success_message = f"""
 ✅ **Filtre blacklist supprimé**
@@ -112,7 +132,7 @@ Le filtre blacklist a été désactivé.
         logger.error(f"Error removing blacklist: {e}")
         await event.respond("❌ Erreur lors de la suppression du filtre blacklist.")
 
-async def change_blacklist(event, client, name, phone_number):
+async def change_blacklist(event, client, name, phone_number, terms):
     """Change a blacklist filter"""
     try:
         user_id = event.sender_id
@@ -122,8 +142,17 @@ async def change_blacklist(event, client, name, phone_number):
             await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.")
             return
         
-        # Change blacklist
-        await store_blacklist(user_id, name, phone_number, "change")
+        # Parse rules, then change blacklist
+        try:
+            rules = parse_filter_terms(terms)
+        except ValueError as e:
+            await event.respond(f"❌ Règle invalide : {e}")
+            return
+        if not any(rules.values()):
+            await event.respond("❌ Indiquez au moins une règle. Tapez `/blacklist` pour voir l'utilisation.")
+            return
+        
+        await store_blacklist(user_id, name, phone_number, "change", rules)
         
         success_message = f"""
 ✅ **Filtre blacklist modifié**
@@ -131,6 +160,7 @@ async def change_blacklist(event, client, name, phone_number):
 📝 **Nom :** {name}
 📞 **Numéro :** {phone_number}
 🔄 **Action :** Modification
+🧮 **Règles :** {format_rules(rules)}
 
 Le filtre blacklist a été mis à jour.
         """
@@ -176,14 +206,17 @@ async def is_premium_user(user_id):
     from bot.database import is_user_licensed
     return await is_user_licensed(user_id)
 
-async def store_blacklist(user_id, name, phone_number, action):
-    """Store blacklist in database"""
+async def store_blacklist(user_id, name, phone_number, action, rules=None):
+    """Store blacklist rules of a redirection in database"""
+    from bot.database import store_filter, remove_filter
     logger.info(f"Blacklist {action} for user {user_id}: {name} on {phone_number}")
-    # In real implementation, save to database
-    pass
+    if action == "remove":
+        return await remove_filter(user_id, "blacklists", name, phone_number)
+    await store_filter(user_id, "blacklists", name, phone_number, rules)
+    return True
 
 async def clear_user_blacklist(user_id, phone_number):
     """Clear all blacklist filters for a user and phone number"""
-    logger.info(f"Blacklist cleared for user {user_id} on {phone_number}")
-    # In real implementation, clear from database
-    pass
\ No newline at end of file
+    from bot.database import clear_filters
+    removed = await clear_filters(user_id, "blacklists", phone_number)
+    logger.info(f"Blacklist cleared for user {user_id} on {phone_number}: {removed} filters")
@@ -1,4 +1,5 @@
 import logging
+from telethon import Button
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,7 @@ Utilisez cette commande pour obtenir tous les ID de chats à utiliser avec d'aut
 **Arguments de commande :**
 `/chats NUMERO_TELEPHONE`
 `/chats FILTRE NUMERO_TELEPHONE`
+`/chats FILTRE NUMERO_TELEPHONE PAGE`
 
 **Obtenir tous les chats de 2759205517 :**
 `/chats 2759205517`
@@ -43,13 +45,14 @@ Utilisez cette commande pour obtenir tous les ID de chats à utiliser avec d'aut
         if len(parts) == 2:
             # Show all chats
             await show_all_chats(event, client, parts[1])
-        elif len(parts) == 3:
+        elif len(parts) in (3, 4):
             # Show specific chat type
             chat_type = parts[1]
             phone_number = parts[2]
+            page = int(parts[3]) if len(parts) == 4 and parts[3].isdigit() else 1
             
-            if chat_type in ["user", "bot", "group", "channel"]:
-                await show_chats_by_type(event, client, chat_type, phone_number)
+            if chat_type in TYPE_INFO:
+                await show_chats_by_type(event, client, chat_type, phone_number, page)
             else:
                 await event.respond("❌ Type de chat invalide. Types supportés : user, bot, group, channel")
         else:
@@ -59,8 +62,83 @@ Utilisez cette commande pour obtenir tous les ID de chats à utiliser avec d'aut
         logger.error(f"Error in chats command: {e}")
         await event.respond("❌ Erreur lors de l'affichage des chats. Veuillez réessayer.")
 
+TYPE_INFO = {
+    'user': {'emoji': '👤', 'name': 'Utilisateurs'},
+    'bot': {'emoji': '🤖', 'name': 'Bots'},
+    'group': {'emoji': '👥', 'name': 'Groupes'},
+    'channel': {'emoji': '📢', 'name': 'Canaux'}
+}
+
+# Longest chat name shown, keeps a full page under Telegram's 4096 characters
+MAX_NAME_LENGTH = 40
+
+def render_chats_page(index, chat_type, phone_number, page):
+    """Message text and prev/next buttons for one page of the dialog index"""
+    chats, page, pages = index.page(chat_type, page)
+    loading = index.loading
+    counts = index.counts()
+    
+    if chat_type is None:
+        title = f"📡 **Chats pour {phone_number}**"
+        summary = (
+            f"👤 {counts['user']} · 🤖 {counts['bot']} · 👥 {counts['group']} · 📢 {counts['channel']}\n"
+            f"📊 **Total :** {sum(counts.values())} chat(s)"
+        )
+    else:
+        title = f"{TYPE_INFO[chat_type]['emoji']} **{TYPE_INFO[chat_type]['name']} pour {phone_number}**"
+        summary = f"📊 **Total :** {counts[chat_type]} {chat_type}(s)"
+    if loading:
+        summary += " (chargement en cours…)"
+    
+    if not chats:
+        body = "Aucun chat trouvé pour ce numéro.\n\n💡 **Astuce :** Assurez-vous que le numéro est correctement connecté avec `/connect`."
+    else:
+        lines = []
+        for c in chats:
+            name = c['name'] if len(c['name']) <= MAX_NAME_LENGTH else c['name'][:MAX_NAME_LENGTH - 1] + "…"
+            prefix = f"{TYPE_INFO[c['type']]['emoji']} " if chat_type is None else "• "
+            lines.append(f"{prefix}{name} - ID: `{c['id']}`")
+        body = "\n".join(lines)
+    
+    page_label = f"{page}/{pages}+" if loading else f"{page}/{pages}"
+    message = f"{title} (page {page_label})\n\n{body}\n\n{summary}"
+    
+    # While the first walk is running there may be more pages than counted so far
+    view = chat_type or "all"
+    navigation = []
+    if page > 1:
+        navigation.append(Button.inline("⬅️ Précédent", f"chats:{view}:{phone_number}:{page - 1}".encode()))
+    if page < pages or (loading and len(chats) == index.page_size):
+        navigation.append(Button.inline("Suivant ➡️", f"chats:{view}:{phone_number}:{page + 1}".encode()))
+    return message, ([navigation] if navigation else None)
+
+async def chats_page(user_id, phone_number, chat_type=None, page=1):
+    """(message, buttons) of one /chats page, or None if the number isn't connected
+
+    With sharding, the page is rendered by the worker owning the account.
+    """
+    from bot.sharding import shard_coordinator
+    if shard_coordinator.active:
+        result = await shard_coordinator.call(user_id, "chats_page", phone_number=phone_number,
+                                              chat_type=chat_type, page=page)
+        if result is None:
+            return None
+        buttons = result['buttons'] and [[Button.inline(text, data.encode()) for text, data in row]
+                                         for row in result['buttons']]
+        return result['message'], buttons
+    
+    # Only waits for the dialogs of the requested page, the rest loads in the background
+    index = await get_user_dialog_index(user_id, phone_number, chat_type, page)
+    if not index:
+        return None
+    return render_chats_page(index, chat_type, phone_number, page)
+
 async def show_all_chats(event, client, phone_number):
     """Show all chats for a phone number"""
+    await show_chats_by_type(event, client, None, phone_number)
+
+async def show_chats_by_type(event, client, chat_type, phone_number, page=1):
+    """Show one page of chats (all, or of a specific type) for a phone number"""
     try:
         user_id = event.sender_id
         
@@ -69,180 +147,91 @@ async def show_all_chats(event, client, phone_number):
             await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.\nUtilisez `/valide` pour activer votre licence.")
             return
         
-        # Get real chats from active connection
-        chats = await get_real_user_chats(user_id, phone_number)
-        
-        if not chats:
-            message = f"""
+        result = await chats_page(user_id, phone_number, chat_type, page)
+        if not result:
+            await event.respond(f"""
 📡 **Chats pour {phone_number}**
 
 Aucun chat trouvé pour ce numéro.
 
 💡 **Astuce :** Assurez-vous que le numéro est correctement connecté avec `/connect`.
-            """
-        else:
-            # Group chats by type
-            users = [c for c in chats if c['type'] == 'user']
-            bots = [c for c in chats if c['type'] == 'bot']
-            groups = [c for c in chats if c['type'] == 'group']
-            channels = [c for c in chats if c['type'] == 'channel']
-            
-            message = f"""
-📡 **Chats pour {phone_number}**
-
-👤 **Utilisateurs :** {len(users)}
-🤖 **Bots :** {len(bots)}
-👥 **Groupes :** {len(groups)}
-📢 **Canaux :** {len(channels)}
-
-📊 **Total :** {len(chats)} chat(s)
-
-💡 **Astuce :** Utilisez `/chats TYPE {phone_number}` pour voir les détails avec IDs.
-            """
+            """)
+            return
         
-        await event.respond(message)
-        logger.info(f"All chats shown for user {user_id} on {phone_number}")
+        message, buttons = result
+        await event.respond(message, buttons=buttons)
+        logger.info(f"Chats of type {chat_type or 'all'} shown for user {user_id} on {phone_number} (page {page})")
         
     except Exception as e:
-        logger.error(f"Error showing all chats: {e}")
+        logger.error(f"Error showing chats: {e}")
         await event.respond("❌ Erreur lors de l'affichage des chats.")
 
-async def show_chats_by_type(event, client, chat_type, phone_number):
-    """Show chats of a specific type for a phone number"""
+async def handle_chats_callback(event, client):
+    """Handle the prev/next buttons of a /chats page (data: chats:TYPE:NUMERO:PAGE)"""
     try:
+        _, view, phone_number, page = event.data.decode().split(":")
+        chat_type = None if view == "all" else view
         user_id = event.sender_id
         
-        # Check if user has premium access
         if not await is_premium_user(user_id):
-            await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.")
+            await event.answer("Accès premium requis", alert=True)
             return
         
-        # Get real chats from active connection
-        chats = await get_real_user_chats_by_type(user_id, phone_number, chat_type)
-        logger.info(f"Retrieved {len(chats)} chats of type {chat_type} for user {user_id}")
-        
-        # Get type emoji and name
-        type_info = {
-            'user': {'emoji': '👤', 'name': 'Utilisateurs'},
-            'bot': {'emoji': '🤖', 'name': 'Bots'},
-            'group': {'emoji': '👥', 'name': 'Groupes'},
-            'channel': {'emoji': '📢', 'name': 'Canaux'}
-        }
-        
-        emoji = type_info[chat_type]['emoji']
-        name = type_info[chat_type]['name']
-        
-        if not chats:
-            message = f"""
-{emoji} **{name} pour {phone_number}**
-
-Aucun {chat_type} trouvé pour ce numéro.
-            """
-        else:
-            chat_list = "\n".join([f"• {c['name']} - ID: `{c['id']}` - {c['status']}" for c in chats])
-            message = f"""
-{emoji} **{name} pour {phone_number}**
-
-{chat_list}
-
-📊 **Total :** {len(chats)} {chat_type}(s)
-            """
+        result = await chats_page(user_id, phone_number, chat_type, int(page))
+        if not result:
+            await event.answer("Numéro non connecté", alert=True)
+            return
         
-        await event.respond(message)
-        logger.info(f"Chats of type {chat_type} shown for user {user_id} on {phone_number}")
+        message, buttons = result
+        await event.edit(message, buttons=buttons)
+        await event.answer()
         
     except Exception as e:
-        logger.error(f"Error showing chats by type: {e}")
-        await event.respond("❌ Erreur lors de l'affichage des chats.")
+        logger.error(f"Error in chats pagination: {e}")
+        await event.answer("❌ Erreur lors de l'affichage des chats.")
 
 async def is_premium_user(user_id):
     """Check if user has premium access"""
     from bot.database import is_user_licensed
     return await is_user_licensed(user_id)
 
+async def get_user_dialog_index(user_id, phone_number, chat_type=None, page=None):
+    """Dialog index of the user's active client for this phone, or None
+
+    Without page, waits for the complete dialog list; with page, only until
+    that page of the chat_type view can be shown.
+    """
+    from bot.connection import connection_registry
+    
+    # Check if user has an active connection for this phone
+    connection_data = connection_registry.get(user_id, phone_number)
+    if connection_data is None or connection_data['status'] != 'connected':
+        logger.warning(f"No active connection found for user {user_id}, phone {phone_number}")
+        return None
+        
+    active_client = connection_data.get('client')
+    if not active_client or not active_client.is_connected():
+        logger.warning(f"Client not connected for user {user_id}, phone {phone_number}")
+        return None
+    
+    # Update session activity
+    from bot.session_manager import session_manager
+    await session_manager.update_session_activity(user_id, connection_data.get('phone'))
+    
+    # Walks iter_dialogs only on first use or after DIALOG_CACHE_TTL; updates keep it current
+    from bot.dialog_cache import get_dialog_index
+    index = get_dialog_index(active_client)
+    if page is None:
+        await index.ensure_loaded()
+    else:
+        await index.ready(chat_type, page * index.page_size)
+    return index
+
 async def get_real_user_chats(user_id, phone_number):
     """Get all real chats for a user and phone number from active connection"""
     try:
-        from bot.connection import active_connections
-        
-        # Check if user has an active connection for this phone
-        if user_id not in active_connections:
-            logger.warning(f"No active connection found for user {user_id}")
-            return []
-            
-        connection_data = active_connections[user_id]
-        active_client = connection_data.get('client')
-        connection_phone = connection_data.get('phone', '').replace('+', '')
-        target_phone = phone_number.replace('+', '')
-        
-        if not active_client or not active_client.is_connected():
-            logger.warning(f"Client not connected for user {user_id}")
-            return []
-            
-        # Check if the phone numbers match
-        if connection_phone != target_phone:
-            logger.warning(f"Phone mismatch: connected {connection_phone}, requested {target_phone}")
-            return []
-        
-        # Update session activity
-        from bot.session_manager import session_manager
-        await session_manager.update_session_activity(user_id, connection_data.get('phone'))
-            
-        # Get all dialogs (chats) from the active client
-        chats = []
-        async for dialog in active_client.iter_dialogs():
-            try:
-                chat_entity = dialog.entity
-                chat_type = 'user'
-                
-                # Determine chat type based on entity type
-                entity_type = type(chat_entity).__name__
-                
-                if entity_type == 'User':
-                    if getattr(chat_entity, 'bot', False):
-                        chat_type = 'bot'
-                    else:
-                        chat_type = 'user'
-                elif entity_type == 'Chat':
-                    chat_type = 'group'
-                elif entity_type == 'Channel':
-                    if getattr(chat_entity, 'megagroup', False):
-                        chat_type = 'group'
-                    elif getattr(chat_entity, 'broadcast', False):
-                        chat_type = 'channel'
-                    elif getattr(chat_entity, 'gigagroup', False):
-                        chat_type = 'group'
-                    else:
-                        chat_type = 'channel'
-                
-                # Get chat name safely
-                chat_name = 'Chat inconnu'
-                if hasattr(chat_entity, 'title') and chat_entity.title:
-                    chat_name = chat_entity.title
-                elif hasattr(chat_entity, 'first_name'):
-                    chat_name = chat_entity.first_name
-                    if hasattr(chat_entity, 'last_name') and chat_entity.last_name:
-                        chat_name += f' {chat_entity.last_name}'
-                elif hasattr(chat_entity, 'username') and chat_entity.username:
-                    chat_name = f'@{chat_entity.username}'
-                else:
-                    chat_name = f'Chat {chat_entity.id}'
-                
-                chat_data = {
-                    'id': chat_entity.id,
-                    'name': chat_name,
-                    'type': chat_type,
-                    'username': getattr(chat_entity, 'username', None)
-                }
-                chats.append(chat_data)
-                
-            except Exception as e:
-                logger.error(f"Error processing chat entity: {str(e)}")
-                import traceback
-                logger.error(f"Full traceback: {traceback.format_exc()}")
-                continue
-            
-        return chats
+        index = await get_user_dialog_index(user_id, phone_number)
+        return index.get_chats() if index else []
         
     except Exception as e:
         logger.error(f"Error getting real chats: {e}")
@@ -253,18 +242,11 @@ async def get_real_user_chats(user_id, phone_number):
 async def get_real_user_chats_by_type(user_id, phone_number, chat_type):
     """Get real chats of a specific type for a user and phone number"""
     try:
-        logger.info(f"Getting chats of type '{chat_type}' for user {user_id}")
-        all_chats = await get_real_user_chats(user_id, phone_number)
-        logger.info(f"Retrieved {len(all_chats)} total chats")
-        
-        filtered_chats = []
-        for chat in all_chats:
-            if chat.get('type') == chat_type:
-                filtered_chats.append(chat)
-        
-        logger.info(f"Filtered to {len(filtered_chats)} chats of type '{chat_type}'")
-        return filtered_chats
+        index = await get_user_dialog_index(user_id, phone_number)
+        chats = index.get_chats(chat_type) if index else []
+        logger.info(f"Retrieved {len(chats)} chats of type '{chat_type}' for user {user_id}")
+        return chats
         
     except Exception as e:
         logger.error(f"Error in get_real_user_chats_by_type: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,178 @@
+"""
+Routage des commandes du bot
+Un seul handler NewMessage : la commande est découpée une fois, retrouvée dans
+un trie de mots (« /payer un mois » avant « /payer ») puis confiée à un seul
+handler, après les middlewares communs (activité, licence, limite de débit)
+"""
+
+import logging
+import os
+import time
+from telethon import events
+
+logger = logging.getLogger(__name__)
+
+COMMAND_RATE_LIMIT = int(os.getenv("COMMAND_RATE_LIMIT", "20"))  # commands per window and user, 0 disables
+COMMAND_RATE_WINDOW = float(os.getenv("COMMAND_RATE_WINDOW", "60"))  # seconds
+
+PREMIUM_REQUIRED = ("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.\n"
+                    "Utilisez `/valide` pour activer votre licence.")
+ADMIN_REQUIRED = "❌ Accès refusé. Commande réservée aux administrateurs."
+
+def parse_command(text):
+    """Words of a command ('/payer@TeleFeedBot un mois' -> ['/payer', 'un', 'mois']), None for plain text"""
+    if not text or text[0] != '/':
+        return None
+    words = text.split()
+    # Commands sent in groups may carry the bot username
+    words[0] = words[0].partition('@')[0]
+    return words
+
+class Route:
+    """A command path and its handler"""
+
+    __slots__ = ('path', 'depth', 'handler', 'licensed', 'admin_only')
+
+    def __init__(self, path, handler, licensed=False, admin_only=False):
+        self.path = path
+        self.depth = len(path.split())
+        self.handler = handler
+        self.licensed = licensed  # arguments need a licence (the bare command shows public usage)
+        self.admin_only = admin_only
+
+class CommandTrie:
+    """Routes by command words; match() returns the longest registered path"""
+
+    __slots__ = ('children', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+    def add(self, route):
+        node = self
+        for word in route.path.split():
+            node = node.children.setdefault(word, CommandTrie())
+        if node.route is not None:
+            raise ValueError(f"command {route.path} already registered")
+        node.route = route
+
+    def match(self, words):
+        node, found = self, None
+        for word in words:
+            node = node.children.get(word)
+            if node is None:
+                break
+            if node.route is not None:
+                found = node.route
+        return found
+
+    def paths(self):
+        routes = [self.route.path] if self.route is not None else []
+        for child in self.children.values():
+            routes.extend(child.paths())
+        return routes
+
+class RateLimiter:
+    """Fixed window command counter per user"""
+
+    def __init__(self, limit=COMMAND_RATE_LIMIT, window=COMMAND_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.windows = {}  # user_id -> [window start, commands, warned]
+
+    def allow(self, user_id):
+        """(allowed, first refusal of the window) - the caller warns the user once per window"""
+        if self.limit <= 0:
+            return True, False
+        now = time.monotonic()
+        state = self.windows.get(user_id)
+        if state is None or now - state[0] >= self.window:
+            if len(self.windows) > 10000:
+                self._prune(now)
+            self.windows[user_id] = [now, 1, False]
+            return True, False
+        state[1] += 1
+        if state[1] <= self.limit:
+            return True, False
+        warn = not state[2]
+        state[2] = True
+        return False, warn
+
+    def _prune(self, now):
+        for user_id in [uid for uid, state in self.windows.items() if now - state[0] >= self.window]:
+            del self.windows[user_id]
+
+class CommandRouter:
+    """Single NewMessage entry point: middlewares, then one route or the fallback
+
+    A middleware is `async (event, command, route) -> bool`: command is the
+    parsed words (None for plain text), route the matched Route (None if no
+    command matched); returning False stops the message there.
+    """
+
+    def __init__(self, admin_id=0, rate_limiter=None):
+        self.admin_id = admin_id
+        self.trie = CommandTrie()
+        self.middlewares = []
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.fallback_handler = None
+
+    def command(self, path, licensed=False, admin_only=False):
+        """Decorator registering `async handler(event)` for a command path"""
+        def register(handler):
+            self.trie.add(Route(path, handler, licensed, admin_only))
+            return handler
+        return register
+
+    def middleware(self, func):
+        """Decorator adding a middleware, run before the built-in rate and access checks"""
+        self.middlewares.append(func)
+        return func
+
+    def fallback(self, func):
+        """Decorator for `async handler(event)`: plain text and unknown commands"""
+        self.fallback_handler = func
+        return func
+
+    def commands(self):
+        return sorted(self.trie.paths())
+
+    def attach(self, client):
+        client.add_event_handler(self.dispatch, events.NewMessage())
+
+    async def dispatch(self, event):
+        command = parse_command(event.raw_text)
+        route = self.trie.match(command) if command else None
+        for middleware in (*self.middlewares, self._check_rate, self._check_access):
+            if not await middleware(event, command, route):
+                return
+        try:
+            if route is not None:
+                await route.handler(event)
+            elif self.fallback_handler is not None:
+                await self.fallback_handler(event)
+        except Exception as e:
+            logger.error(f"Error handling {route.path if route else 'message'} from user {event.sender_id}: {e}")
+
+    async def _check_rate(self, event, command, route):
+        if command is None or event.sender_id == self.admin_id:
+            return True
+        allowed, warn = self.rate_limiter.allow(event.sender_id)
+        if warn:
+            logger.warning(f"Command rate limit reached by user {event.sender_id}")
+            await event.respond(f"⏳ Trop de commandes. Réessayez dans {self.rate_limiter.window:.0f} secondes.")
+        return allowed
+
+    async def _check_access(self, event, command, route):
+        if route is None:
+            return True
+        if route.admin_only and event.sender_id != self.admin_id:
+            await event.respond(ADMIN_REQUIRED)
+            return False
+        if route.licensed and len(command) > route.depth:
+            from bot.database import is_user_licensed
+            if not await is_user_licensed(event.sender_id):
+                await event.respond(PREMIUM_REQUIRED)
+                return False
+        return True
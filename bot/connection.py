@@ -3,11 +3,71 @@ import re
 import os
 from telethon import TelegramClient
 from telethon.errors import PhoneNumberInvalidError, FloodWaitError
+from bot.conversation import conversations, AWAITING_CODE
 
 logger = logging.getLogger(__name__)
 
-# Store active connection sessions
-active_connections = {}
+def phone_key(phone_number):
+    """Digits of a phone number: '+229...' and '229...' name the same account"""
+    return re.sub(r'\D', '', str(phone_number or ''))
+
+class ConnectionRegistry:
+    """Active connections keyed by (user_id, phone)
+
+    Each entry is a dict holding at least 'client', 'phone', 'status'
+    ('code_sent' while waiting for the verification code, then 'connected')
+    and 'handlers' (names of the redirections routed on that client), so one
+    user can run several accounts side by side.
+    """
+
+    def __init__(self):
+        self.entries = {}  # (user_id, phone digits) -> entry, oldest first
+
+    def set(self, user_id, phone_number, **fields):
+        """Create or update the entry of an account and return it"""
+        key = (int(user_id), phone_key(phone_number))
+        entry = self.entries.pop(key, None) or {'handlers': set()}
+        entry.update(fields)
+        entry.setdefault('phone', phone_number)
+        entry.setdefault('status', 'connected')
+        entry['connected'] = entry['status'] == 'connected'
+        # Re-inserted last: the most recently connected account comes last
+        self.entries[key] = entry
+        return entry
+
+    def get(self, user_id, phone_number=None):
+        """Entry of an account, or the user's most recent connected one if no phone is given"""
+        if phone_number:
+            return self.entries.get((int(user_id), phone_key(phone_number)))
+        entries = self.for_user(user_id)
+        connected = [entry for entry in entries if entry['status'] == 'connected']
+        return (connected or entries or [None])[-1]
+
+    def get_client(self, user_id, phone_number=None):
+        entry = self.get(user_id, phone_number)
+        return entry.get('client') if entry else None
+
+    def remove(self, user_id, phone_number):
+        """Forget an account and return its entry (the caller disconnects the client)"""
+        return self.entries.pop((int(user_id), phone_key(phone_number)), None)
+
+    def for_user(self, user_id):
+        """All entries of a user, oldest first"""
+        user_id = int(user_id)
+        return [entry for (uid, _), entry in self.entries.items() if uid == user_id]
+
+    def items(self):
+        """((user_id, phone digits), entry) pairs"""
+        return list(self.entries.items())
+
+    def has_user(self, user_id):
+        return any(uid == int(user_id) for uid, _ in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+# Active connections of every user and account
+connection_registry = ConnectionRegistry()
 
 async def handle_connect(event, client):
     """
@@ -59,6 +119,23 @@ async def handle_connect(event, client):
         session_name = f"session_{user_id}_{phone_number}"
         
         try:
+            # One code at a time: a connection still waiting for its code on another number is cancelled
+            waiting = conversations.expect(user_id, AWAITING_CODE)
+            if waiting and phone_key(waiting['phone']) != phone_key(phone_number):
+                abandoned = connection_registry.get(user_id, waiting['phone'])
+                if abandoned and abandoned['status'] == 'code_sent':
+                    connection_registry.remove(user_id, waiting['phone'])
+                    await abandoned['client'].disconnect()
+                conversations.clear(user_id, AWAITING_CODE)
+                await event.respond(f"ℹ️ La connexion de {waiting['phone']} en attente de code est annulée.")
+
+            # Detach the account's previous client (pending code or connected) before
+            # opening the same session file again: it would otherwise stay connected
+            previous = connection_registry.remove(user_id, phone_number)
+            if previous and previous.get('client'):
+                await previous['client'].disconnect()
+                logger.info(f"Previous client ({previous['status']}) of user {user_id}, phone {formatted_phone} disconnected")
+            
             # Create new client for the phone number
             new_client = TelegramClient(
                 session_name,
@@ -71,13 +148,15 @@ async def handle_connect(event, client):
             # Send code request
             result = await new_client.send_code_request(formatted_phone)
             
-            # Store the connection session
-            active_connections[user_id] = {
-                'client': new_client,
-                'phone': formatted_phone,
-                'phone_code_hash': result.phone_code_hash,
-                'session_name': session_name
-            }
+            # Store the connection session (next to the user's other accounts)
+            connection_registry.set(
+                user_id, formatted_phone,
+                client=new_client,
+                status='code_sent',
+                phone_code_hash=result.phone_code_hash,
+                session_name=session_name
+            )
+            conversations.set(user_id, AWAITING_CODE, phone=formatted_phone)
             
             success_message = f"""
 ✅ **Code de vérification envoyé !**
@@ -122,13 +201,21 @@ async def handle_verification_code(event, client):
         message_text = event.text.strip()
         
         # Check if user has an active connection attempt
-        if user_id not in active_connections:
+        pending = conversations.expect(user_id, AWAITING_CODE)
+        if pending is None:
             return False  # Not a verification code
         
         # Check if message starts with 'aa' (verification code format)
         if not message_text.startswith('aa'):
             return False  # Not a verification code
         
+        # The client of the number that last asked for a code
+        connection_data = connection_registry.get(user_id, pending['phone'])
+        if connection_data is None or connection_data['status'] != 'code_sent':
+            conversations.clear(user_id, AWAITING_CODE)
+            await event.respond("❌ **Aucune connexion en attente**\n\nRelancez `/connect NUMERO` pour recevoir un nouveau code.")
+            return True
+        
         # Extract the actual code
         verification_code = message_text[2:]  # Remove 'aa' prefix
         
@@ -136,7 +223,6 @@ async def handle_verification_code(event, client):
             await event.respond("❌ **Code invalide**\n\nLe code doit contenir uniquement des chiffres après 'aa'.")
             return True
         
-        connection_data = active_connections[user_id]
         new_client = connection_data['client']
         phone = connection_data['phone']
         phone_code_hash = connection_data['phone_code_hash']
@@ -146,6 +232,7 @@ async def handle_verification_code(event, client):
             await new_client.sign_in(phone, verification_code, phone_code_hash=phone_code_hash)
             
             # Connection successful
+            conversations.clear(user_id, AWAITING_CODE)
             success_message = f"""
 🎉 **Connexion réussie !**
 
@@ -167,21 +254,24 @@ async def handle_verification_code(event, client):
             # Store the successful connection
             await store_successful_connection(user_id, phone)
             
-            # Keep the client active for chat operations and redirections
-            active_connections[user_id] = {
-                'client': new_client,
-                'phone': phone,
-                'connected': True,
-                'session_name': connection_data['session_name']
-            }
-            
-            # Store in connection function for restoration
-            await store_connection_client(user_id, phone, new_client)
-            
             # Store session in persistent database
             from bot.session_manager import session_manager
             await session_manager.store_session(user_id, phone, connection_data['session_name'])
             
+            # With sharding, the worker owning the user runs the client: hand the session over
+            from bot.sharding import shard_coordinator
+            if shard_coordinator.active:
+                connection_registry.remove(user_id, phone)
+                await new_client.disconnect()
+                await shard_coordinator.call(user_id, "attach", phone_number=phone,
+                                             session_file=f"{connection_data['session_name']}.session")
+                logger.info(f"Successful connection for user {user_id} with phone {phone} (worker {shard_coordinator.shard_of(user_id)})")
+                return True
+            
+            # Keep the client active for chat operations and redirections
+            await store_connection_client(user_id, phone, new_client)
+            connection_registry.set(user_id, phone, phone_code_hash=None, session_name=connection_data['session_name'])
+            
             # Setup message redirection handlers for existing redirections
             from bot.message_handler import message_redirector
             await message_redirector.setup_redirection_handlers()
@@ -228,13 +318,13 @@ async def store_connection_client(user_id, phone_number, client):
     """
     try:
         from datetime import datetime
-        active_connections[user_id] = {
-            'phone': phone_number,
-            'connected_at': datetime.now(),
-            'client': client,
-            'connected': True
-        }
-        logger.info(f"Active connection with client stored for user {user_id}")
+        connection_registry.set(
+            user_id, phone_number,
+            connected_at=datetime.now(),
+            client=client,
+            status='connected'
+        )
+        logger.info(f"Active connection with client stored for user {user_id}, phone {phone_number}")
         
     except Exception as e:
         logger.error(f"Error storing active connection with client: {e}")
@@ -0,0 +1,75 @@
+"""
+État de conversation par utilisateur pour les échanges en plusieurs étapes
+(/connect -> code, /redirection add -> IDs, /valide -> licence), une étape par
+échange. Gardé en mémoire avec expiration, il indique à quoi sert le prochain
+message texte
+"""
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "600"))  # seconds a step waits for the user's answer
+
+AWAITING_CODE = "awaiting_code"
+AWAITING_REDIRECTION_IDS = "awaiting_redirection_ids"
+AWAITING_LICENSE = "awaiting_license"
+
+class ConversationStates:
+    """Pending steps per user and flow: {(user_id, state): (data, expiry)}, expired lazily
+
+    Each multi-step command waits in its own state, so starting one (e.g.
+    /redirection add) doesn't drop another one (a /connect waiting for its code).
+    """
+
+    def __init__(self, ttl=CONVERSATION_TTL):
+        self.ttl = ttl
+        self.states = {}  # (user_id, state) -> (data, expires_at)
+        self._purge_at = 1000
+
+    def set(self, user_id, state, **data):
+        """Start waiting for `state` (replaces the user's previous step of that flow only)"""
+        now = time.monotonic()
+        if len(self.states) >= self._purge_at:
+            self._purge(now)
+        self.states[(int(user_id), state)] = (data, now + self.ttl)
+        logger.debug(f"Conversation of {user_id}: {state}")
+
+    def expect(self, user_id, state):
+        """Data of the user's `state` step, None if there is none or it expired"""
+        key = (int(user_id), state)
+        entry = self.states.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self.states[key]
+            logger.info(f"Conversation step {state} of user {user_id} expired")
+            return None
+        return entry[0]
+
+    def pending(self, user_id):
+        """{state: data} of every step the user has in progress"""
+        user_id = int(user_id)
+        states = [state for uid, state in self.states if uid == user_id]
+        steps = {state: self.expect(user_id, state) for state in states}
+        return {state: data for state, data in steps.items() if data is not None}
+
+    def clear(self, user_id, state=None):
+        """End the user's `state` step (every step when not given)"""
+        user_id = int(user_id)
+        for key in [key for key in self.states if key[0] == user_id and state in (None, key[1])]:
+            del self.states[key]
+
+    def _purge(self, now):
+        for key in [key for key, entry in self.states.items() if entry[1] <= now]:
+            del self.states[key]
+        # Amortised: the next purge waits until the table doubles
+        self._purge_at = max(1000, 2 * len(self.states))
+
+    def __len__(self):
+        return len(self.states)
+
+# Shared by the bot command handlers (connection, redirection, licence)
+conversations = ConversationStates()
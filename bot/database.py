@@ -1,117 +1,82 @@
 import logging
-import json
 import os
 from datetime import datetime
+from bot.storage import create_storage
 
 logger = logging.getLogger(__name__)
 
 # Simple file-based storage for demo purposes
 DATA_FILE = "user_data.json"
 
+# Storage backend: "json" (user_data.json) or "sqlite" (indexed tables)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_FILE = os.getenv("STORAGE_SQLITE_PATH", "user_data.db")
+
+# Delay before dirty JSON data is written back to disk (seconds)
+FLUSH_DELAY = float(os.getenv("DATA_FLUSH_DELAY", "1.0"))
+
+storage = create_storage(STORAGE_BACKEND, DATA_FILE, SQLITE_FILE, FLUSH_DELAY)
+
 def load_data():
-    """Load user data from file"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure all required keys exist
-                if "pending_redirections" not in data:
-                    data["pending_redirections"] = {}
-                    save_data(data)  # Save updated structure
-                return data
-        except Exception as e:
-            logger.error(f"Error loading data: {e}")
-    return {
-        "licenses": {},
-        "connections": {},
-        "redirections": {},
-        "transformations": {},
-        "whitelists": {},
-        "blacklists": {},
-        "chats": {},
-        "pending_redirections": {}
-    }
+    """Load all user data (in-memory store or SQLite snapshot)"""
+    return storage.load_all()
 
 def save_data(data):
-    """Save user data to file"""
+    """Save all user data"""
     try:
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        storage.save_all(data)
+        _invalidate_entitlements()
     except Exception as e:
         logger.error(f"Error saving data: {e}")
 
 async def store_license(user_id, license_code):
     """Store validated license"""
-    data = load_data()
-    data["licenses"][str(user_id)] = {
+    storage.set_license(str(user_id), {
         "license": license_code,
         "validated_at": datetime.now().isoformat(),
         "active": True
-    }
-    save_data(data)
+    })
+    _invalidate_entitlements(user_id)
     logger.info(f"License stored for user {user_id}")
 
 async def is_user_licensed(user_id):
-    """Check if user has valid license"""
-    # Check if user is admin (owner always has access)
-    import os
-    admin_id = os.getenv("ADMIN_ID")
-    if admin_id and str(user_id) == admin_id:
-        return True
-    
-    # Check regular license
-    data = load_data()
-    user_license = data["licenses"].get(str(user_id))
-    return user_license and user_license.get("active", False)
+    """Check if user has valid license (admin always has access; cached per user)"""
+    from bot.entitlements import entitlements
+    return entitlements.is_licensed(user_id)
+
+def _invalidate_entitlements(user_id=None):
+    from bot.entitlements import entitlements
+    entitlements.invalidate(user_id)
 
 async def store_connection(user_id, phone_number):
     """Store successful phone connection - automatically replaces existing connection for same phone"""
-    data = load_data()
-    if str(user_id) not in data["connections"]:
-        data["connections"][str(user_id)] = []
-    
-    # Check if phone already exists and remove it (automatic replacement)
-    data["connections"][str(user_id)] = [
-        conn for conn in data["connections"][str(user_id)] 
-        if conn["phone"] != phone_number
-    ]
-    
-    # Add new connection with current timestamp
-    data["connections"][str(user_id)].append({
+    storage.store_connection(str(user_id), {
         "phone": phone_number,
         "connected_at": datetime.now().isoformat(),
         "active": True,
         "replaced_at": datetime.now().strftime("%d/%m/%Y %H:%M:%S")
     })
-    save_data(data)
     logger.info(f"Connection stored/replaced for user {user_id}: {phone_number}")
 
 async def get_user_connections(user_id):
     """Get user's phone connections"""
-    data = load_data()
-    return data["connections"].get(str(user_id), [])
+    return storage.get_connections(str(user_id))
 
 async def store_redirection(user_id, name, phone_number, action, channel_name=None, source_id=None, destination_id=None):
     """Store redirection rule"""
-    data = load_data()
-    if str(user_id) not in data["redirections"]:
-        data["redirections"][str(user_id)] = {}
+    user_key = str(user_id)
     
     if action == "add":
         # Check if a redirection with same phone already exists and replace it
-        existing_redirection = None
-        for redir_name, redir_data in data["redirections"][str(user_id)].items():
-            if redir_data.get("phone") == phone_number:
-                existing_redirection = redir_name
-                break
+        existing_redirection = next(iter(storage.get_redirections(user_key, phone_number)), None)
         
         # If exists, mark as replaced
         replaced_info = ""
         if existing_redirection:
             replaced_info = f" (remplacé: {existing_redirection})"
-            del data["redirections"][str(user_id)][existing_redirection]
+            storage.delete_redirection(user_key, existing_redirection)
         
-        data["redirections"][str(user_id)][name] = {
+        storage.set_redirection(user_key, name, {
             "phone": phone_number,
             "name": name,
             "channel_name": channel_name or name,
@@ -121,29 +86,39 @@ async def store_redirection(user_id, name, phone_number, action, channel_name=No
             "replaced_at": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
             "active": True,
             "replacement_info": replaced_info
-        }
+        })
     elif action == "remove":
-        if name in data["redirections"][str(user_id)]:
-            del data["redirections"][str(user_id)][name]
+        storage.delete_redirection(user_key, name)
     elif action == "change":
-        if name in data["redirections"][str(user_id)]:
-            data["redirections"][str(user_id)][name]["phone"] = phone_number
-            data["redirections"][str(user_id)][name]["channel_name"] = channel_name or name
-            data["redirections"][str(user_id)][name]["source_id"] = source_id
-            data["redirections"][str(user_id)][name]["destination_id"] = destination_id
-            data["redirections"][str(user_id)][name]["updated_at"] = datetime.now().isoformat()
+        redirection = storage.get_redirections(user_key).get(name)
+        if redirection:
+            redirection["phone"] = phone_number
+            redirection["channel_name"] = channel_name or name
+            redirection["source_id"] = source_id
+            redirection["destination_id"] = destination_id
+            redirection["updated_at"] = datetime.now().isoformat()
+            storage.set_redirection(user_key, name, redirection)
     
-    save_data(data)
     logger.info(f"Redirection {action} for user {user_id}: {name} -> {channel_name or name}")
 
+async def set_redirection_option(user_id, name, phone_number, key, value):
+    """Set an option (e.g. batch_forward) on an existing redirection"""
+    redirection = storage.get_redirections(str(user_id), phone_number).get(name)
+    if redirection is None:
+        return False
+    redirection = dict(redirection)
+    redirection[key] = value
+    redirection["updated_at"] = datetime.now().isoformat()
+    storage.set_redirection(str(user_id), name, redirection)
+    logger.info(f"Redirection option {key}={value} for user {user_id}: {name}")
+    return True
+
 async def get_user_redirections(user_id, phone_number):
     """Get user redirections for a phone number"""
-    data = load_data()
-    user_redirections = data["redirections"].get(str(user_id), {})
     phone_redirections = []
     
-    for name, redir in user_redirections.items():
-        if redir["phone"] == phone_number and redir.get("active", True):
+    for name, redir in storage.get_redirections(str(user_id), phone_number).items():
+        if redir.get("active", True):
             phone_redirections.append({
                 "name": name,
                 "channel_name": redir.get("channel_name", name),
@@ -152,29 +127,93 @@ async def get_user_redirections(user_id, phone_number):
     
     return phone_redirections
 
-async def store_pending_redirection(user_id, name, phone_number):
-    """Store pending redirection waiting for channel IDs"""
-    data = load_data()
-    data["pending_redirections"][str(user_id)] = {
-        "name": name,
-        "phone_number": phone_number,
-        "created_at": datetime.now().isoformat()
-    }
-    save_data(data)
-    logger.info(f"Pending redirection stored for user {user_id}: {name} on {phone_number}")
+async def get_source_redirections(source_id):
+    """Get all redirections reading from a source chat, as (user_id, redirection) pairs"""
+    return storage.get_redirections_by_source(source_id)
+
+async def get_user_filters(user_id, kind):
+    """Get a user's whitelist/blacklist filters ({redirection name: rules})"""
+    return storage.get_document(kind, str(user_id)) or {}
+
+async def store_filter(user_id, kind, name, phone_number, rules):
+    """Store the whitelist/blacklist rules of a redirection"""
+    filters = dict(await get_user_filters(user_id, kind))
+    filters[name] = dict(rules, phone=phone_number)
+    storage.set_document(kind, str(user_id), filters)
+    _invalidate_filters(user_id)
+    logger.info(f"Filter {kind} stored for user {user_id}: {name} on {phone_number}")
+
+async def remove_filter(user_id, kind, name, phone_number):
+    """Remove the whitelist/blacklist rules of a redirection"""
+    filters = dict(await get_user_filters(user_id, kind))
+    if name not in filters or filters[name].get("phone") != phone_number:
+        return False
+    del filters[name]
+    storage.set_document(kind, str(user_id), filters or None)
+    _invalidate_filters(user_id)
+    return True
+
+async def clear_filters(user_id, kind, phone_number):
+    """Remove every whitelist/blacklist filter of a phone number"""
+    filters = await get_user_filters(user_id, kind)
+    kept = {name: rules for name, rules in filters.items() if rules.get("phone") != phone_number}
+    storage.set_document(kind, str(user_id), kept or None)
+    _invalidate_filters(user_id)
+    return len(filters) - len(kept)
+
+def _invalidate_filters(user_id):
+    from bot.filters import filter_engine
+    filter_engine.invalidate(user_id)
+    _notify_shard(user_id)
+
+def _notify_shard(user_id):
+    """With sharding, the worker running the user's redirections reloads its rules"""
+    from bot.sharding import shard_coordinator
+    if shard_coordinator.active:
+        shard_coordinator.notify(user_id, "invalidate")
+
+async def get_user_transformations(user_id):
+    """Get a user's transformations ({redirection name: {phone, version, steps}})"""
+    return storage.get_document("transformations", str(user_id)) or {}
+
+async def store_transformation(user_id, name, phone_number, transform_type, config):
+    """Set one transformation step of a redirection (bumps the rule version)"""
+    transformations = dict(await get_user_transformations(user_id))
+    current = transformations.get(name, {})
+    steps = dict(current.get("steps", {}))
+    steps[transform_type] = config
+    transformations[name] = {"phone": phone_number, "version": current.get("version", 0) + 1, "steps": steps}
+    storage.set_document("transformations", str(user_id), transformations)
+    _invalidate_transformations(user_id)
+    logger.info(f"Transformation {transform_type} stored for user {user_id}: {name} on {phone_number}")
+
+async def remove_transformation(user_id, name, phone_number, transform_type):
+    """Remove one transformation step of a redirection"""
+    transformations = dict(await get_user_transformations(user_id))
+    current = transformations.get(name)
+    if not current or current.get("phone") != phone_number or transform_type not in current.get("steps", {}):
+        return False
+    steps = {step: config for step, config in current["steps"].items() if step != transform_type}
+    if steps:
+        transformations[name] = dict(current, version=current.get("version", 0) + 1, steps=steps)
+    else:
+        del transformations[name]
+    storage.set_document("transformations", str(user_id), transformations or None)
+    _invalidate_transformations(user_id)
+    return True
 
-async def get_pending_redirection(user_id):
-    """Get pending redirection for user"""
-    data = load_data()
-    return data["pending_redirections"].get(str(user_id))
+async def clear_transformations(user_id, phone_number):
+    """Remove every transformation of a phone number"""
+    transformations = await get_user_transformations(user_id)
+    kept = {name: rules for name, rules in transformations.items() if rules.get("phone") != phone_number}
+    storage.set_document("transformations", str(user_id), kept or None)
+    _invalidate_transformations(user_id)
+    return len(transformations) - len(kept)
 
-async def clear_pending_redirection(user_id):
-    """Clear pending redirection for user"""
-    data = load_data()
-    if str(user_id) in data["pending_redirections"]:
-        del data["pending_redirections"][str(user_id)]
-        save_data(data)
-        logger.info(f"Pending redirection cleared for user {user_id}")
+def _invalidate_transformations(user_id):
+    from bot.transform_pipeline import transformation_engine
+    transformation_engine.invalidate(user_id)
+    _notify_shard(user_id)
 
 async def get_user_chats_data(user_id, phone_number, chat_type=None):
     """Get user chats data (comprehensive list of 100+ chats)"""
@@ -0,0 +1,83 @@
+"""
+Déduplication des contenus redirigés
+Empreinte (texte normalisé + identifiants des médias) mémorisée par
+destination pendant une fenêtre de temps bornée
+"""
+
+import logging
+import os
+import re
+import time
+import hashlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "3600"))  # seconds; 0 disables deduplication
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "5000"))  # per destination
+
+_whitespace = re.compile(r"\s+")
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a message text"""
+    return _whitespace.sub(" ", text or "").strip().casefold()
+
+def media_id(message):
+    """Telegram id of the photo/document of a message, or None"""
+    for attribute in ("photo", "document"):
+        media = getattr(message, attribute, None)
+        if media is not None and getattr(media, "id", None) is not None:
+            return f"{attribute}:{media.id}"
+    return None
+
+def content_fingerprint(text=None, messages=()):
+    """Digest of normalised text plus media ids (None if there is nothing to compare)"""
+    normalized = normalize_text(text)
+    media_ids = [mid for mid in (media_id(message) for message in messages) if mid]
+    if not normalized and not media_ids:
+        return None
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16)
+    for mid in media_ids:
+        digest.update(b"\0" + mid.encode("ascii"))
+    return digest.digest()
+
+class DedupCache:
+    """Time-windowed, size-bounded set of recent fingerprints per destination"""
+
+    def __init__(self, window=DEDUP_WINDOW, max_entries=DEDUP_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self.destinations = {}  # destination_id -> OrderedDict(fingerprint -> sent_at)
+        self.skipped = 0
+
+    def claim(self, destination_id, fingerprint):
+        """Record a fingerprint about to be sent; False if it was already sent recently"""
+        if not fingerprint or self.window <= 0:
+            return True
+        seen = self.destinations.setdefault(int(destination_id), OrderedDict())
+        now = time.monotonic()
+        # Oldest entries first: drop the expired ones
+        while seen and next(iter(seen.values())) < now - self.window:
+            seen.popitem(last=False)
+        if fingerprint in seen:
+            self.skipped += 1
+            return False
+        seen[fingerprint] = now
+        while len(seen) > self.max_entries:
+            seen.popitem(last=False)
+        return True
+
+    def release(self, destination_id, fingerprint):
+        """Forget a claimed fingerprint whose send failed"""
+        if fingerprint:
+            self.destinations.get(int(destination_id), {}).pop(fingerprint, None)
+
+    def stats(self):
+        return {
+            'destinations': len(self.destinations),
+            'entries': sum(len(seen) for seen in self.destinations.values()),
+            'skipped': self.skipped,
+        }
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+dedup_cache = DedupCache()
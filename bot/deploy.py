@@ -95,6 +95,10 @@ async def create_deployment_zip():
             'PROJECT_OVERVIEW.md'
         ]
         
+        # Make sure pending data changes are on disk before packaging
+        from bot.database import storage
+        storage.flush()
+        
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             # Add individual files
             for item in files_to_include:
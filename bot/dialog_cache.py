@@ -0,0 +1,212 @@
+"""
+Index des dialogues par compte pour /chats
+Chargé une fois via iter_dialogs, indexé par type, puis tenu à jour par les
+mises à jour Telegram (nouveaux chats, renommages, départs)
+"""
+
+import logging
+import os
+import time
+import asyncio
+import itertools
+from telethon import events, utils
+
+logger = logging.getLogger(__name__)
+
+DIALOG_CACHE_TTL = float(os.getenv("DIALOG_CACHE_TTL", "1800"))  # full refresh after this many seconds
+CHATS_PAGE_SIZE = int(os.getenv("CHATS_PAGE_SIZE", "50"))
+
+CHAT_TYPES = ("user", "bot", "group", "channel")
+
+def chat_type_of(entity):
+    """user, bot, group or channel"""
+    entity_type = type(entity).__name__
+    if entity_type == 'User':
+        return 'bot' if getattr(entity, 'bot', False) else 'user'
+    if entity_type == 'Chat':
+        return 'group'
+    if entity_type == 'Channel':
+        if getattr(entity, 'megagroup', False) or getattr(entity, 'gigagroup', False):
+            return 'group'
+        return 'channel'
+    return 'user'
+
+def chat_record(entity):
+    """The dict shown by /chats for an entity"""
+    from bot.entity_cache import entity_display_name
+    return {
+        'id': entity.id,
+        'name': entity_display_name(entity, entity.id),
+        'type': chat_type_of(entity),
+        'username': getattr(entity, 'username', None)
+    }
+
+class DialogIndex:
+    """Dialogs of one client, by id and by type, most recent first"""
+
+    def __init__(self, client, ttl=DIALOG_CACHE_TTL, page_size=CHATS_PAGE_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.page_size = page_size
+        self.chats = {}  # id -> record, in dialog order
+        self.by_type = {chat_type: {} for chat_type in CHAT_TYPES}  # type -> {id: record}
+        self.loaded_at = None
+        self.self_id = None
+        self._loading = None
+        self._progress = asyncio.Event()  # set (and replaced) each time a first load adds dialogs
+        self._handlers_attached = False
+
+    def _add(self, record, first=False):
+        old = self.chats.pop(record['id'], None)
+        if old is not None:
+            self.by_type[old['type']].pop(old['id'], None)
+        if first:
+            # New activity: keep the "most recent first" order
+            self.chats = {record['id']: record, **self.chats}
+            self.by_type[record['type']] = {record['id']: record, **self.by_type[record['type']]}
+        else:
+            self.chats[record['id']] = record
+            self.by_type[record['type']][record['id']] = record
+
+    def _remove(self, chat_id):
+        record = self.chats.pop(chat_id, None)
+        if record is not None:
+            self.by_type[record['type']].pop(chat_id, None)
+
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    @property
+    def loading(self):
+        return self._loading is not None and not self._loading.done()
+
+    def _start_load(self):
+        if not self.loading:
+            self._loading = asyncio.ensure_future(self._load())
+            self._loading.add_done_callback(self._load_done)
+        return self._loading
+
+    def _load_done(self, future):
+        # Also marks the exception as retrieved for background refreshes
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Error loading dialog index: {future.exception()}")
+
+    async def ensure_loaded(self, force=False):
+        """Full load on first use or after the TTL; concurrent callers share one walk"""
+        if not force and not self.is_stale():
+            return
+        await asyncio.shield(self._start_load())
+
+    async def ready(self, chat_type=None, count=None):
+        """Return as soon as `count` chats of the view can be shown
+
+        A first load is streamed: this returns once enough dialogs have been
+        read, while the walk continues in the background. A stale index is
+        served as is and refreshed in the background.
+        """
+        if not self.is_stale():
+            return
+        loading = self._start_load()
+        if self.loaded_at is not None:
+            return
+        count = count or self.page_size
+        source = lambda: self.chats if chat_type is None else self.by_type.get(chat_type, {})
+        while not loading.done() and len(source()) < count:
+            progress = asyncio.ensure_future(self._progress.wait())
+            await asyncio.wait([progress, loading], return_when=asyncio.FIRST_COMPLETED)
+            progress.cancel()
+        if loading.done():
+            loading.result()  # propagate a failed first load
+
+    async def _load(self):
+        from bot.entity_cache import get_entity_cache
+        entity_cache = get_entity_cache(self.client)
+        started = time.monotonic()
+        first_load = self.loaded_at is None
+        if first_load:
+            # Fill the live index so the first pages can be shown during the walk
+            chats, by_type = self.chats, self.by_type
+        else:
+            # Refresh: keep serving the current index until the walk is complete
+            chats, by_type = {}, {chat_type: {} for chat_type in CHAT_TYPES}
+        async for dialog in self.client.iter_dialogs():
+            try:
+                entity_cache.add_dialog(dialog)
+                record = chat_record(dialog.entity)
+                chats[record['id']] = record
+                by_type[record['type']][record['id']] = record
+            except Exception as e:
+                logger.error(f"Error processing chat entity: {e}")
+            if first_load and len(chats) % 100 == 0:
+                # iter_dialogs fetches 100 dialogs per request: wake up ready() waiters
+                self._progress.set()
+                self._progress = asyncio.Event()
+        self.chats, self.by_type = chats, by_type
+        self.loaded_at = time.monotonic()
+        if self.self_id is None:
+            try:
+                self.self_id = (await self.client.get_me(input_peer=True)).user_id
+            except Exception as e:
+                logger.warning(f"Could not resolve own id for dialog index: {e}")
+        self._attach_handlers()
+        logger.info(f"Dialog index loaded: {len(chats)} chats in {time.monotonic() - started:.1f}s")
+
+    def _attach_handlers(self):
+        """Keep the index current from updates once it has been loaded"""
+        if self._handlers_attached:
+            return
+        self.client.add_event_handler(self._on_new_message, events.NewMessage())
+        self.client.add_event_handler(self._on_chat_action, events.ChatAction())
+        self._handlers_attached = True
+
+    def detach(self):
+        if self._handlers_attached:
+            self.client.remove_event_handler(self._on_new_message)
+            self.client.remove_event_handler(self._on_chat_action)
+            self._handlers_attached = False
+
+    async def _upsert_from_event(self, event, first=True):
+        try:
+            entity = await event.get_chat()
+            if entity is not None:
+                self._add(chat_record(entity), first=first)
+        except Exception as e:
+            logger.debug(f"Dialog index update skipped: {e}")
+
+    async def _on_new_message(self, event):
+        # Only chats we don't know yet: a dict lookup for everything else
+        chat_id, _ = utils.resolve_id(event.chat_id)
+        if chat_id not in self.chats:
+            await self._upsert_from_event(event)
+
+    async def _on_chat_action(self, event):
+        chat_id, _ = utils.resolve_id(event.chat_id)
+        if (event.user_left or event.user_kicked) and self.self_id is not None and event.user_id == self.self_id:
+            self._remove(chat_id)
+        elif event.new_title or chat_id not in self.chats:
+            await self._upsert_from_event(event, first=chat_id not in self.chats)
+
+    def get_chats(self, chat_type=None):
+        """All chats, or those of one type (no re-walk, no filtering pass)"""
+        source = self.chats if chat_type is None else self.by_type.get(chat_type, {})
+        return list(source.values())
+
+    def counts(self):
+        return {chat_type: len(records) for chat_type, records in self.by_type.items()}
+
+    def page(self, chat_type=None, page=1, page_size=None):
+        """(records of the page, page number, page count); page is clamped to the valid range"""
+        page_size = page_size or self.page_size
+        source = self.chats if chat_type is None else self.by_type.get(chat_type, {})
+        pages = max(1, -(-len(source) // page_size))
+        page = min(max(1, page), pages)
+        start = (page - 1) * page_size
+        return list(itertools.islice(source.values(), start, start + page_size)), page, pages
+
+def get_dialog_index(client):
+    """Return the client's dialog index, creating it on first use"""
+    index = getattr(client, 'dialog_index', None)
+    if index is None:
+        index = DialogIndex(client)
+        client.dialog_index = index
+    return index
@@ -0,0 +1,114 @@
+"""
+Dispatcher unique par client Telegram
+Un seul gestionnaire NewMessage/MessageEdited par client, routage par chat source
+"""
+
+import logging
+from telethon import events, utils
+from telethon.tl import types
+
+logger = logging.getLogger(__name__)
+
+def source_peer_ids(source_id):
+    """Return the marked peer ids an event chat_id can have for a source id
+
+    Mirrors Telethon's chats= filter: a negative id is already marked, a
+    positive id may be a user, a basic group or a channel.
+    """
+    source_id = int(source_id)
+    if source_id < 0:
+        return {source_id}
+    return {
+        utils.get_peer_id(types.PeerUser(source_id)),
+        utils.get_peer_id(types.PeerChat(source_id)),
+        utils.get_peer_id(types.PeerChannel(source_id)),
+    }
+
+class RedirectionDispatcher:
+    """Routes a client's updates to redirection rules through a source_id index"""
+
+    def __init__(self, client):
+        self.client = client
+        self.rules_by_source = {}  # marked chat id -> {name: rule}
+        self.rules = {}  # name -> rule
+        self.attached = False
+
+    def attach(self):
+        """Register the two shared handlers on the client (once)"""
+        if self.attached:
+            return
+        self.client.add_event_handler(self._on_new_message, events.NewMessage())
+        self.client.add_event_handler(self._on_edited_message, events.MessageEdited())
+        self.attached = True
+
+    def detach(self):
+        """Unregister the shared handlers"""
+        if not self.attached:
+            return
+        self.client.remove_event_handler(self._on_new_message)
+        self.client.remove_event_handler(self._on_edited_message)
+        self.attached = False
+
+    def add_rule(self, name, source_id, destination_id, callback, **extra):
+        """Add or replace a rule without touching the client's handler list
+
+        callback(event, rule, is_edit) is awaited for every matching update.
+        """
+        self.remove_rule(name)
+        rule = {
+            'name': name,
+            'source_id': int(source_id),
+            'destination_id': int(destination_id),
+            'callback': callback,
+            'peer_ids': source_peer_ids(source_id),
+        }
+        rule.update(extra)
+        self.rules[name] = rule
+        for peer_id in rule['peer_ids']:
+            self.rules_by_source.setdefault(peer_id, {})[name] = rule
+        self.attach()
+        return rule
+
+    def remove_rule(self, name):
+        """Remove a rule, return True if it existed"""
+        rule = self.rules.pop(name, None)
+        if not rule:
+            return False
+        for peer_id in rule['peer_ids']:
+            source_rules = self.rules_by_source.get(peer_id)
+            if source_rules is not None:
+                source_rules.pop(name, None)
+                if not source_rules:
+                    del self.rules_by_source[peer_id]
+        return True
+
+    def get_rules(self, chat_id):
+        """Rules matching a marked chat id"""
+        source_rules = self.rules_by_source.get(chat_id)
+        return list(source_rules.values()) if source_rules else []
+
+    async def _on_new_message(self, event):
+        await self.dispatch(event, is_edit=False)
+
+    async def _on_edited_message(self, event):
+        await self.dispatch(event, is_edit=True)
+
+    async def dispatch(self, event, is_edit=False):
+        """Fan an update out to every rule of its source chat"""
+        source_rules = self.rules_by_source.get(event.chat_id)
+        if not source_rules:
+            return
+        # Copy: callbacks may add/remove rules while we iterate
+        for rule in list(source_rules.values()):
+            try:
+                await rule['callback'](event, rule, is_edit)
+            except Exception as e:
+                logger.error(f"Error dispatching to redirection {rule['name']}: {e}")
+
+def get_dispatcher(client):
+    """Return the client's dispatcher, creating it on first use"""
+    dispatcher = getattr(client, 'redirection_dispatcher', None)
+    if dispatcher is None:
+        dispatcher = RedirectionDispatcher(client)
+        client.redirection_dispatcher = dispatcher
+    return dispatcher
@@ -0,0 +1,69 @@
+"""
+Droits premium des utilisateurs
+Le statut de licence de chaque utilisateur est gardé en mémoire (TTL + LRU)
+après la première lecture du stockage ; store_license et les changements de
+l'admin l'invalident
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", "3600"))
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", "10000"))
+
+class LicenceEntitlements:
+    """Cached "has an active licence" flag per user id (the admin always has one)"""
+
+    def __init__(self, ttl=ENTITLEMENT_CACHE_TTL, max_size=ENTITLEMENT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # user_id (str) -> (expires_at, bool); bounded, since any user (licensed or not) can send commands
+        self.licensed = OrderedDict()
+        self._admin_id = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def admin_id(self):
+        # Read once, after config.settings has loaded .env
+        if self._admin_id is None:
+            self._admin_id = os.getenv("ADMIN_ID") or ""
+        return self._admin_id
+
+    def is_licensed(self, user_id):
+        key = str(user_id)
+        if key == self.admin_id:
+            return True
+        entry = self.licensed.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] >= now:
+            self.licensed.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        from bot.database import storage
+        record = storage.get_license(key)
+        licensed = bool(record and record.get("active", False))
+        self.licensed[key] = (now + self.ttl, licensed)
+        self.licensed.move_to_end(key)
+        while len(self.licensed) > self.max_size:
+            self.licensed.popitem(last=False)
+        return licensed
+
+    def invalidate(self, user_id=None):
+        """Forget the cached status (of one user, or all) after a licence change"""
+        if user_id is None:
+            self.licensed.clear()
+            self._admin_id = None
+        else:
+            self.licensed.pop(str(user_id), None)
+
+    def stats(self):
+        return {'users': len(self.licensed), 'hits': self.hits, 'misses': self.misses}
+
+# Shared by every premium check (command router and command modules)
+entitlements = LicenceEntitlements()
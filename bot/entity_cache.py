@@ -0,0 +1,158 @@
+"""
+Cache des entités Telegram par client (TTL + LRU)
+Évite un get_entity par message redirigé juste pour les logs
+"""
+
+import logging
+import os
+import time
+import asyncio
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "3600"))
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "2000"))
+ENTITY_CACHE_PREWARM_LIMIT = int(os.getenv("ENTITY_CACHE_PREWARM_LIMIT", "200"))
+
+# All live caches, for /stats
+_caches = weakref.WeakSet()
+
+def entity_display_name(entity, chat_id=None):
+    """Get the proper display name of a user/chat/channel entity"""
+    if getattr(entity, 'title', None):
+        return entity.title
+    if getattr(entity, 'first_name', None):
+        name = entity.first_name
+        if getattr(entity, 'last_name', None):
+            name += f" {entity.last_name}"
+        return name
+    if getattr(entity, 'username', None):
+        return f"@{entity.username}"
+    return f"Chat {chat_id if chat_id is not None else getattr(entity, 'id', '?')}"
+
+class EntityCache:
+    """TTL + LRU cache of entities for one Telegram client"""
+
+    def __init__(self, client, ttl=ENTITY_CACHE_TTL, max_size=ENTITY_CACHE_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()  # chat_id -> (expires_at, entity)
+        self.pending = {}  # chat_id -> future, coalesces concurrent misses
+        self.hits = 0
+        self.misses = 0
+        self.prewarmed = False
+        self.prewarm_task = None  # keeps the background prewarm alive until it finishes
+        _caches.add(self)
+
+    def _lookup(self, chat_id):
+        entry = self.entries.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, entity = entry
+        if expires_at < time.monotonic():
+            del self.entries[chat_id]
+            return None
+        self.entries.move_to_end(chat_id)
+        return entity
+
+    def put(self, chat_id, entity):
+        """Store an entity (evicts the least recently used past max_size)"""
+        self.entries[chat_id] = (time.monotonic() + self.ttl, entity)
+        self.entries.move_to_end(chat_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, chat_id=None):
+        """Forget one entity, or all of them"""
+        if chat_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(chat_id, None)
+
+    async def get_entity(self, chat_id):
+        """Return the entity for chat_id, resolving it at most once per TTL"""
+        entity = self._lookup(chat_id)
+        if entity is not None:
+            self.hits += 1
+            return entity
+        self.misses += 1
+
+        future = self.pending.get(chat_id)
+        if future is not None:
+            return await future
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[chat_id] = future
+        try:
+            entity = await self.client.get_entity(chat_id)
+            self.put(chat_id, entity)
+            future.set_result(entity)
+            return entity
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody is waiting on it
+            future.exception()
+            raise
+        finally:
+            del self.pending[chat_id]
+
+    async def get_name(self, chat_id):
+        """Return the display name for chat_id, or 'Chat <id>' if unresolvable"""
+        try:
+            entity = await self.get_entity(chat_id)
+            return entity_display_name(entity, chat_id)
+        except Exception as e:
+            logger.error(f"Error getting channel name for {chat_id}: {e}")
+            return f"Chat {chat_id}"
+
+    def add_dialog(self, dialog):
+        """Cache the entity of a dialog returned by iter_dialogs"""
+        self.put(dialog.id, dialog.entity)
+
+    async def prewarm(self, limit=ENTITY_CACHE_PREWARM_LIMIT):
+        """Fill the cache from the client's most recent dialogs"""
+        try:
+            count = 0
+            async for dialog in self.client.iter_dialogs(limit=limit):
+                self.add_dialog(dialog)
+                count += 1
+            self.prewarmed = True
+            logger.info(f"Entity cache prewarmed with {count} dialogs")
+        except Exception as e:
+            logger.error(f"Error prewarming entity cache: {e}")
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+def get_entity_cache(client):
+    """Return the client's entity cache, creating it on first use"""
+    cache = getattr(client, 'entity_cache', None)
+    if cache is None:
+        cache = EntityCache(client)
+        client.entity_cache = cache
+    return cache
+
+def prewarm_entity_cache(client):
+    """Start prewarming a client's entity cache in the background"""
+    cache = get_entity_cache(client)
+    if not cache.prewarmed and (cache.prewarm_task is None or cache.prewarm_task.done()):
+        cache.prewarm_task = asyncio.create_task(cache.prewarm())
+    return cache
+
+def get_cache_stats():
+    """Aggregated hit/miss counters over every client cache"""
+    caches = list(_caches)
+    totals = {'clients': len(caches), 'size': 0, 'hits': 0, 'misses': 0}
+    for cache in caches:
+        for key, value in cache.stats().items():
+            totals[key] += value
+    lookups = totals['hits'] + totals['misses']
+    totals['hit_rate'] = (totals['hits'] / lookups * 100) if lookups else 0.0
+    return totals
@@ -0,0 +1,190 @@
+"""
+Filtres whitelist / blacklist par redirection
+Les règles (mots-clés, regex, expéditeurs, types de média) sont compilées une
+seule fois (un trie pour les mots-clés, une regex combinée pour les regex),
+évaluées avant chaque envoi
+"""
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FILTER_KINDS = ("whitelists", "blacklists")
+
+MEDIA_TYPES = ("photo", "video", "gif", "sticker", "voice", "audio", "document", "text")
+
+# Group references (\1, (?P=name), (?(1)...)) point at the wrong group once regexes are combined
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+def split_filter_terms(text):
+    """One term per line when the text has several lines, else comma separated ('\\,' is a literal comma)"""
+    if "\n" in text.strip():
+        return text.splitlines()
+    return [term.replace("\\,", ",") for term in re.split(r"(?<!\\),", text)]
+
+def parse_filter_terms(text):
+    """Parse 'mot, autre mot, regex:^\\d+, from:@user, media:photo' into a rule dict
+
+    Terms may also be given one per line, e.g. for regexes containing commas.
+    Raises ValueError for an invalid regex or media type.
+    """
+    rules = {"keywords": [], "regexes": [], "senders": [], "media": []}
+    for term in split_filter_terms(text):
+        term = term.strip()
+        if not term:
+            continue
+        prefix, _, value = term.partition(":")
+        prefix = prefix.lower()
+        value = value.strip()
+        if prefix in ("regex", "re") and value:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"regex invalide `{value}` : {e}")
+            rules["regexes"].append(value)
+        elif prefix == "from" and value:
+            rules["senders"].append(value.lstrip("@").lower())
+        elif prefix == "media" and value:
+            if value.lower() not in MEDIA_TYPES:
+                raise ValueError(f"type de média invalide `{value}` (types : {', '.join(MEDIA_TYPES)})")
+            rules["media"].append(value.lower())
+        else:
+            rules["keywords"].append(term.lower())
+    return rules
+
+def format_rules(rules):
+    """Short human-readable summary of a rule dict"""
+    labels = []
+    labels.extend(keyword.replace(",", "\\,") for keyword in rules.get("keywords", []))
+    labels.extend(f"regex:{regex}".replace(",", "\\,") for regex in rules.get("regexes", []))
+    labels.extend(f"from:{sender}" for sender in rules.get("senders", []))
+    labels.extend(f"media:{media}" for media in rules.get("media", []))
+    return ", ".join(labels) or "aucune"
+
+def trie_pattern(words):
+    """Regex alternation of literal words factored by common prefix
+
+    'chat', 'chaton', 'chien' -> 'ch(?:at(?:on)?|ien)': the regex engine
+    walks one branch per character instead of trying every word in turn.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = []
+        for char in sorted(key for key in node if key):
+            sub = build(node[char])
+            branches.append(re.escape(char) + (sub or ""))
+        if not branches:
+            return None
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return build(trie) or ""
+
+def message_media_type(message):
+    """Media type name of a Telethon message ('text' for plain text)"""
+    for media_type in ("sticker", "gif", "voice", "video", "audio", "photo", "document"):
+        if getattr(message, media_type, None):
+            return media_type
+    return "text" if getattr(message, "text", None) else None
+
+class CompiledFilter:
+    """One rule set compiled into a single text matcher plus sender/media sets"""
+
+    def __init__(self, rules):
+        self.size = sum(len(rules.get(key, [])) for key in ("keywords", "regexes", "senders", "media"))
+        self.senders = set(rules.get("senders", []))
+        self.media = set(rules.get("media", []))
+        self.keyword_matcher = None
+        self.text_matchers = []
+
+        # Keywords are stored lowercased: match them against the lowercased text,
+        # re.IGNORECASE makes a large alternation several times slower
+        keywords = sorted(set(rules.get("keywords", [])))
+        if keywords:
+            self.keyword_matcher = re.compile(trie_pattern(keywords))
+        regexes = rules.get("regexes", [])
+        separate = [regex for regex in regexes if BACKREFERENCE.search(regex)]
+        combined = [regex for regex in regexes if not BACKREFERENCE.search(regex)]
+        if combined:
+            try:
+                self.text_matchers = [re.compile("|".join(f"(?:{regex})" for regex in combined), re.IGNORECASE)]
+            except re.error:
+                # A user regex that can't be combined (e.g. inline global flags): compile separately
+                separate = regexes
+        for regex in separate:
+            try:
+                self.text_matchers.append(re.compile(regex, re.IGNORECASE))
+            except re.error as e:
+                logger.error(f"Ignoring invalid filter regex `{regex}`: {e}")
+
+    def matches(self, message):
+        text = getattr(message, "text", None) or ""
+        if text:
+            if self.keyword_matcher is not None and self.keyword_matcher.search(text.lower()):
+                return True
+            if any(matcher.search(text) for matcher in self.text_matchers):
+                return True
+        if self.senders:
+            sender_id = getattr(message, "sender_id", None)
+            if sender_id is not None and str(sender_id) in self.senders:
+                return True
+            username = getattr(getattr(message, "sender", None), "username", None)
+            if username and username.lower() in self.senders:
+                return True
+        if self.media and message_media_type(message) in self.media:
+            return True
+        return False
+
+class FilterEngine:
+    """Compiled filters per (kind, user_id, redirection name), rebuilt on change"""
+
+    def __init__(self):
+        self.compiled = {}  # (kind, user_id) -> {redirection name: CompiledFilter}
+
+    def _user_filters(self, kind, user_id):
+        key = (kind, str(user_id))
+        filters = self.compiled.get(key)
+        if filters is None:
+            from bot.database import storage
+            document = storage.get_document(kind, str(user_id)) or {}
+            filters = {name: CompiledFilter(rules) for name, rules in document.items()}
+            self.compiled[key] = filters
+        return filters
+
+    def invalidate(self, user_id=None):
+        """Drop compiled filters (of one user, or all) after a change"""
+        if user_id is None:
+            self.compiled.clear()
+            return
+        for kind in FILTER_KINDS:
+            self.compiled.pop((kind, str(user_id)), None)
+
+    def allows(self, user_id, redirection_name, *messages):
+        """True if the message(s) pass the redirection's whitelist and blacklist
+
+        For an album, the whitelist passes if any item matches and the
+        blacklist rejects the whole album if any item matches.
+        """
+        try:
+            whitelist = self._user_filters("whitelists", user_id).get(redirection_name)
+            if whitelist is not None and whitelist.size and not any(whitelist.matches(m) for m in messages):
+                return False
+            blacklist = self._user_filters("blacklists", user_id).get(redirection_name)
+            if blacklist is not None and any(blacklist.matches(m) for m in messages):
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Error evaluating filters for {redirection_name}: {e}")
+            return True
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+filter_engine = FilterEngine()
@@ -0,0 +1,174 @@
+"""
+Transfert d'un message vers la destination d'une redirection
+Pipeline commun à MessageRedirector et SimpleRedirectionRestorer : édition
+des messages déjà transférés, filtres, albums, rafales, transformations,
+déduplication, envoi et correspondance des identifiants
+"""
+
+import logging
+from bot.send_queue import get_send_scheduler
+from bot.album_buffer import album_buffer, album_key, map_album, forward_batch_buffer, batch_key, forward_batch
+from bot.filters import filter_engine
+from bot.transform_pipeline import transformation_engine
+from bot.dedup import dedup_cache, content_fingerprint
+from bot.entity_cache import get_entity_cache
+from bot.metrics import forwarding_metrics
+from bot.log_pipeline import get_message_logger, log_lazy
+
+logger = logging.getLogger(__name__)
+# Per-message lines: sampled and rate limited per redirection (see bot.log_pipeline)
+message_logger = get_message_logger(__name__)
+
+async def _route_names(client, source_id, destination_id):
+    """'source (name) to destination (name)' for log lines (names come from the entity cache)"""
+    entity_cache = get_entity_cache(client)
+    source_name = await entity_cache.get_name(source_id)
+    dest_name = await entity_cache.get_name(int(destination_id))
+    return f"{source_id} ({source_name}) to {destination_id} ({dest_name})"
+
+async def _log_route(client, source_id, destination_id, log_extra, message):
+    """INFO line message(route) on message_logger; names are only resolved for emitted lines"""
+    async def build():
+        return message(await _route_names(client, source_id, destination_id))
+    await log_lazy(message_logger, logging.INFO, build, extra=log_extra, stacklevel=2)
+
+def _sent_id(sent_message):
+    """Id of the sent message (forward_messages may return a list)"""
+    if isinstance(sent_message, list):
+        return sent_message[0].id if sent_message else None
+    return getattr(sent_message, 'id', None)
+
+async def _apply_edit(event, destination_id, redirect_name, user_id, message_mapping, timings, log_extra):
+    """Mirror an edit on the redirected message; True when nothing is left to send"""
+    client = event.client
+    message = event.message
+    redirected_msg_id = message_mapping.get(event.chat_id, message.id, destination_id)
+    if redirected_msg_id is None:
+        # Edits of messages we never forwarded are not sent
+        message_logger.info(f"Edit event for unmapped message {message.id} in {event.chat_id}", extra=log_extra)
+        return True
+    try:
+        if message.text:
+            text = transformation_engine.apply(user_id, redirect_name, message.text)
+            if not text.strip():
+                message_logger.info(f"Edit of message {message.id} from {event.chat_id} empty after transformations for {redirect_name}, not applied", extra=log_extra)
+                return True
+            await get_send_scheduler(client).edit_message(int(destination_id), redirected_msg_id, text, timings=timings)
+            forwarding_metrics.record_send(user_id, redirect_name, [message], timings, is_edit=True)
+            await _log_route(client, event.chat_id, destination_id, log_extra,
+                             lambda route: f"Message edited and updated from {route} via {redirect_name}")
+            return True
+        if message.media:
+            # Media can't be edited in place: delete the copy and send the new media
+            try:
+                await get_send_scheduler(client).delete_messages(int(destination_id), redirected_msg_id)
+            except Exception:
+                pass  # Continue even if delete fails
+            return False
+        # Message was emptied: delete the redirected message too
+        try:
+            await get_send_scheduler(client).delete_messages(int(destination_id), redirected_msg_id)
+            message_mapping.delete(event.chat_id, message.id, destination_id)
+            message_logger.info(f"Message deleted from {event.chat_id} to {destination_id} via {redirect_name}", extra=log_extra)
+        except Exception as delete_error:
+            logger.warning(f"Failed to delete message {redirected_msg_id}: {delete_error}")
+        return True
+    except Exception as edit_error:
+        if "Content of the message was not modified" in str(edit_error):
+            message_logger.info(f"Message content unchanged for edit in {event.chat_id} to {destination_id} via {redirect_name}", extra=log_extra)
+            return True  # Don't send duplicate message
+        # If edit fails for other reasons, send a new message instead
+        logger.warning(f"Failed to edit message {redirected_msg_id}: {edit_error}. Sending new message instead.")
+        return False
+
+async def forward_message(event, destination_id, redirect_name, user_id, message_mapping, is_edit=False, batch_forward=False):
+    """Forward (or mirror the edit of) event.message to destination_id for one redirection
+
+    Errors of the send calls are raised to the caller.
+    """
+    client = event.client
+    message = event.message
+    original_msg_id = message.id
+    timings = {}  # queue wait / API time of the send, for the latency histograms
+    log_extra = {'redirection': f"{user_id}:{redirect_name}"}  # rate limit key of the log lines
+
+    if is_edit and await _apply_edit(event, destination_id, redirect_name, user_id, message_mapping, timings, log_extra):
+        return
+
+    # Whitelist / blacklist of the redirection (albums are checked as a whole below)
+    if not is_edit and not message.grouped_id and not filter_engine.allows(user_id, redirect_name, message):
+        message_logger.info(f"Message {original_msg_id} from {event.chat_id} filtered out by {redirect_name}", extra=log_extra)
+        return
+
+    # Album item: wait for the rest of the album and forward it in one call
+    if message.grouped_id and not is_edit:
+        messages = await album_buffer.collect(album_key(event, destination_id), message)
+        if messages is None:
+            return  # Forwarded together with the first item of the album
+        if not filter_engine.allows(user_id, redirect_name, *messages):
+            message_logger.info(f"Album from {event.chat_id} filtered out by {redirect_name}", extra=log_extra)
+            return
+        fingerprint = content_fingerprint("\n".join(m.text for m in messages if m.text), messages)
+        if not dedup_cache.claim(destination_id, fingerprint):
+            message_logger.info(f"Duplicate album from {event.chat_id} skipped for {destination_id} via {redirect_name}", extra=log_extra)
+            return
+        try:
+            sent_messages = await get_send_scheduler(client).forward_messages(int(destination_id), messages, timings=timings)
+        except Exception:
+            dedup_cache.release(destination_id, fingerprint)
+            raise
+        forwarding_metrics.record_send(user_id, redirect_name, messages, timings)
+        map_album(message_mapping, event.chat_id, messages, destination_id, sent_messages)
+        await _log_route(client, event.chat_id, destination_id, log_extra,
+                         lambda route: f"Album of {len(messages)} messages redirected from {route} via {redirect_name}")
+        return
+
+    # Burst mode: forward the source's messages in one call (copy mode when text is transformed)
+    if batch_forward and not is_edit and not transformation_engine.has_transformations(user_id, redirect_name):
+        messages = await forward_batch_buffer.collect(batch_key(event, destination_id), message)
+        if messages is None:
+            return  # Forwarded together with the first message of the burst
+        forwarded = await forward_batch(client, event.chat_id, messages, destination_id, message_mapping, timings)
+        if forwarded:
+            forwarding_metrics.record_send(user_id, redirect_name, forwarded, timings)
+        await _log_route(client, event.chat_id, destination_id, log_extra,
+                         lambda route: f"Burst of {len(forwarded)}/{len(messages)} messages forwarded from {route} via {redirect_name}")
+        return
+
+    # Send new message (either first time or edit/media replacement)
+    text = None
+    if message.text:
+        text = transformation_engine.apply(user_id, redirect_name, message.text)
+        if not text.strip():
+            message_logger.info(f"Message {original_msg_id} from {event.chat_id} empty after transformations for {redirect_name}", extra=log_extra)
+            return
+    elif not message.media:
+        return
+
+    # Skip content already sent to this destination recently (edits are never deduplicated)
+    fingerprint = None if is_edit else content_fingerprint(text, [] if text else [message])
+    if not dedup_cache.claim(destination_id, fingerprint):
+        message_logger.info(f"Duplicate message {original_msg_id} from {event.chat_id} skipped for {destination_id} via {redirect_name}", extra=log_extra)
+        return
+
+    try:
+        if text:
+            sent_message = await get_send_scheduler(client).send_message(int(destination_id), text, timings=timings)
+        else:
+            # Forward media directly
+            sent_message = await get_send_scheduler(client).forward_messages(int(destination_id), message, timings=timings)
+    except Exception:
+        dedup_cache.release(destination_id, fingerprint)
+        raise
+    if not sent_message:
+        return
+    forwarding_metrics.record_send(user_id, redirect_name, [message], timings, is_edit=is_edit)
+
+    # Store the mapping for future edits (new messages and media replacements)
+    sent_id = _sent_id(sent_message)
+    if sent_id is not None:
+        message_mapping.set(event.chat_id, original_msg_id, destination_id, sent_id)
+
+    action = "edited and redirected" if is_edit else "redirected"
+    await _log_route(client, event.chat_id, destination_id, log_extra,
+                     lambda route: f"Message {action} from {route} via {redirect_name}")
@@ -12,25 +12,31 @@ from bot.redirection import handle_redirection_command
 from bot.transformation import handle_transformation_command
 from bot.whitelist import handle_whitelist_command
 from bot.blacklist import handle_blacklist_command
-from bot.chats import handle_chats_command
+from bot.chats import handle_chats_command, handle_chats_callback
 from bot.admin import handle_admin_commands
+from bot.command_router import CommandRouter
+from bot.conversation import conversations, AWAITING_CODE, AWAITING_REDIRECTION_IDS, AWAITING_LICENSE
+from bot.log_pipeline import setup_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/activity.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued, written by a background thread)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
 # Initialize Telegram client without starting it yet
 client = TelegramClient('bot', API_ID, API_HASH)
 
-@client.on(events.NewMessage(pattern="/start"))
+# Every command goes through one NewMessage handler (see router.attach below)
+router = CommandRouter(ADMIN_ID)
+
+@router.middleware
+async def update_activity(event, command, route):
+    """Mettre à jour l'activité du bot à chaque message"""
+    if hasattr(client, 'keep_alive_system'):
+        client.keep_alive_system.update_bot_activity()
+    return True
+
+@router.command("/start")
 async def start(event):
     """Handle /start command"""
     try:
@@ -58,7 +64,7 @@ Pour accéder aux fonctionnalités premium, veuillez valider votre licence avec
         logger.error(f"Error in start command: {e}")
         await event.respond("❌ Une erreur est survenue. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/valide"))
+@router.command("/valide")
 async def valide(event):
     """Handle /valide command for license validation"""
     try:
@@ -68,7 +74,7 @@ async def valide(event):
         logger.error(f"Error in license validation: {e}")
         await event.respond("❌ Erreur lors de la validation de licence. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/payer une semaine"))
+@router.command("/payer une semaine")
 async def payer_semaine(event):
     """Handle /payer une semaine command"""
     try:
@@ -78,7 +84,7 @@ async def payer_semaine(event):
         logger.error(f"Error in weekly payment processing: {e}")
         await event.respond("❌ Erreur lors du traitement du paiement. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/payer un mois"))
+@router.command("/payer un mois")
 async def payer_mois(event):
     """Handle /payer un mois command"""
     try:
@@ -88,14 +94,10 @@ async def payer_mois(event):
         logger.error(f"Error in monthly payment processing: {e}")
         await event.respond("❌ Erreur lors du traitement du paiement. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/payer"))
+@router.command("/payer")
 async def payer(event):
     """Handle /payer command for payment processing"""
     try:
-        # Check if it's a specific payment command
-        if "une semaine" in event.text or "un mois" in event.text:
-            return  # Let the specific handlers handle it first
-
         # Show payment options
         payment_options = """
 💳 **Options de paiement TeleFeed**
@@ -116,7 +118,7 @@ Choisissez votre formule d'abonnement :
         logger.error(f"Error in payment processing: {e}")
         await event.respond("❌ Erreur lors du traitement du paiement. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/deposer"))
+@router.command("/deposer", licensed=True)
 async def deposer(event):
     """Handle /deposer command for file deployment"""
     try:
@@ -126,7 +128,7 @@ async def deposer(event):
         logger.error(f"Error in deploy handling: {e}")
         await event.respond("❌ Erreur lors du traitement du dépôt. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/connect"))
+@router.command("/connect")
 async def connect(event):
     """Handle /connect command"""
     try:
@@ -136,7 +138,7 @@ async def connect(event):
         logger.error(f"Error in connect command: {e}")
         await event.respond("❌ Erreur lors de la connexion. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/redirection"))
+@router.command("/redirection", licensed=True)
 async def redirection(event):
     """Handle /redirection command"""
     try:
@@ -146,7 +148,7 @@ async def redirection(event):
         logger.error(f"Error in redirection command: {e}")
         await event.respond("❌ Erreur lors de la redirection. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/transformation"))
+@router.command("/transformation", licensed=True)
 async def transformation(event):
     """Handle /transformation command"""
     try:
@@ -156,7 +158,7 @@ async def transformation(event):
         logger.error(f"Error in transformation command: {e}")
         await event.respond("❌ Erreur lors de la transformation. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/whitelist"))
+@router.command("/whitelist", licensed=True)
 async def whitelist(event):
     """Handle /whitelist command"""
     try:
@@ -166,7 +168,7 @@ async def whitelist(event):
         logger.error(f"Error in whitelist command: {e}")
         await event.respond("❌ Erreur lors de la whitelist. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/blacklist"))
+@router.command("/blacklist", licensed=True)
 async def blacklist(event):
     """Handle /blacklist command"""
     try:
@@ -176,7 +178,7 @@ async def blacklist(event):
         logger.error(f"Error in blacklist command: {e}")
         await event.respond("❌ Erreur lors de la blacklist. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/chats"))
+@router.command("/chats", licensed=True)
 async def chats(event):
     """Handle /chats command"""
     try:
@@ -186,7 +188,15 @@ async def chats(event):
         logger.error(f"Error in chats command: {e}")
         await event.respond("❌ Erreur lors de l'affichage des chats. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/help"))
+@client.on(events.CallbackQuery(pattern=b"chats:"))
+async def chats_page(event):
+    """Handle /chats previous/next page buttons"""
+    try:
+        await handle_chats_callback(event, client)
+    except Exception as e:
+        logger.error(f"Error in chats pagination: {e}")
+
+@router.command("/help")
 async def help_command(event):
     """Handle /help command"""
     try:
@@ -217,27 +227,27 @@ Pour toute question ou problème, contactez l'administrateur.
         await event.respond("❌ Une erreur est survenue. Veuillez réessayer.")
 
 # Admin commands
-@client.on(events.NewMessage(pattern="/admin"))
+@router.command("/admin", admin_only=True)
 async def admin_command(event):
     """Handle /admin command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/confirm"))
+@router.command("/confirm", admin_only=True)
 async def confirm_command(event):
     """Handle /confirm command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/generate"))
+@router.command("/generate", admin_only=True)
 async def generate_command(event):
     """Handle /generate command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/users"))
+@router.command("/users", admin_only=True)
 async def users_command(event):
     """Handle /users command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/stats"))
+@router.command("/stats", admin_only=True)
 async def stats_command(event):
     """Handle /stats command"""
     await handle_admin_commands(event, client)
@@ -269,9 +279,10 @@ async def handle_sessions(event, client):
         system_info = f"{platform.system()} {platform.release()}"
 
         # Get active connections
-        from bot.connection import active_connections
+        from bot.connection import connection_registry
+        user_connections = connection_registry.for_user(user_id)
 
-        if user_id not in active_connections:
+        if not user_connections:
             # Afficher quand même les infos serveur
             server_info = f"""
 🌐 **Serveur Replit Hébergement**
@@ -293,10 +304,8 @@ async def handle_sessions(event, client):
             await event.respond(server_info)
             return
 
-        connection_info = active_connections[user_id]
-
-        # Check if connection is still valid
-        if 'client' not in connection_info:
+        # Check if a connection is still valid
+        if not any('client' in connection_info for connection_info in user_connections):
             server_info = f"""
 🌐 **Serveur Replit Hébergement**
 
@@ -315,8 +324,17 @@ async def handle_sessions(event, client):
             await event.respond(server_info)
             return
 
-        phone = connection_info.get('phone', 'N/A')
-        connected_at = connection_info.get('connected_at', 'N/A')
+        accounts_text = ""
+        for connection_info in user_connections:
+            phone = connection_info.get('phone', 'N/A')
+            connected_at = connection_info.get('connected_at', 'N/A')
+            status = '✅ Connecté' if connection_info.get('connected', False) else '❌ Déconnecté'
+            accounts_text += f"""
+📞 **Numéro :** {phone}
+⏰ **Connecté le :** {connected_at}
+🔗 **Statut :** {status}
+🔀 **Redirections actives :** {len(connection_info.get('handlers', ()))}
+"""
 
         # Get session from database
         from bot.session_manager import session_manager
@@ -338,10 +356,7 @@ async def handle_sessions(event, client):
 📱 **Sessions Utilisateur**
 
 👤 **Utilisateur :** {user_id}
-📞 **Numéro :** {phone}
-⏰ **Connecté le :** {connected_at}
-🔗 **Statut :** {'✅ Connecté' if connection_info.get('connected', False) else '❌ Déconnecté'}
-
+{accounts_text}
 📊 **Détails des sessions :**
 """
 
@@ -370,22 +385,27 @@ async def handle_sessions(event, client):
     except Exception as e:
         logger.error(f"Erreur dans handle_sessions: {e}")
         await event.respond("❌ Erreur lors de la récupération des sessions.")
-@client.on(events.NewMessage(pattern="/sessions"))
+@router.command("/sessions", admin_only=True)
 async def sessions_command(event):
     """Handle /sessions command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/stop"))
+@router.command("/latency", admin_only=True)
+async def latency_command(event):
+    """Handle /latency command"""
+    await handle_admin_commands(event, client)
+
+@router.command("/logs", admin_only=True)
+async def logs_command(event):
+    """Handle /logs command"""
+    await handle_admin_commands(event, client)
+
+@router.command("/stop", admin_only=True)
 async def stop_continuous_command(event):
     """Handle /stop command - Stop continuous mode"""
     try:
         user_id = event.sender_id
 
-        # Only allow admin to control
-        if user_id != ADMIN_ID:
-            await event.respond("❌ Commande réservée aux administrateurs.")
-            return
-
         # Access the keep_alive instance (will be created in start_bot)
         if hasattr(client, 'keep_alive_system'):
             response = client.keep_alive_system.stop_continuous_mode()
@@ -399,17 +419,12 @@ async def stop_continuous_command(event):
         logger.error(f"Error in stop command: {e}")
         await event.respond("❌ Erreur lors de l'arrêt du mode continu.")
 
-@client.on(events.NewMessage(pattern="/start_continuous"))
+@router.command("/start_continuous", admin_only=True)
 async def start_continuous_command(event):
     """Handle /start_continuous command - Start continuous mode"""
     try:
         user_id = event.sender_id
 
-        # Only allow admin to control
-        if user_id != ADMIN_ID:
-            await event.respond("❌ Commande réservée aux administrateurs.")
-            return
-
         # Access the keep_alive instance
         if hasattr(client, 'keep_alive_system'):
             response = client.keep_alive_system.start_continuous_mode()
@@ -423,17 +438,12 @@ async def start_continuous_command(event):
         logger.error(f"Error in start_continuous command: {e}")
         await event.respond("❌ Erreur lors du démarrage du mode continu.")
 
-@client.on(events.NewMessage(pattern="/keepalive"))
+@router.command("/keepalive", admin_only=True)
 async def keepalive_command(event):
     """Handle /keepalive command - Check keep-alive system status"""
     try:
         user_id = event.sender_id
 
-        # Only allow admin to check status
-        if user_id != ADMIN_ID:
-            await event.respond("❌ Commande réservée aux administrateurs.")
-            return
-
         # Get status from keep_alive system
         if hasattr(client, 'keep_alive_system'):
             status = client.keep_alive_system.get_status()
@@ -486,17 +496,12 @@ async def keepalive_command(event):
         logger.error(f"Error in keepalive command: {e}")
         await event.respond("❌ Erreur lors de la vérification du statut.")
 
-@client.on(events.NewMessage(pattern="/railway"))
+@router.command("/railway", admin_only=True)
 async def railway_command(event):
     """Handle /railway command - Railway deployment and communication"""
     try:
         user_id = event.sender_id
-        admin_id = int(os.getenv("ADMIN_ID", "0"))
-        
-        if user_id != admin_id:
-            await event.respond("❌ Commande réservée à l'administrateur.")
-            return
-        
+
         railway_info = f"""
 🚂 **STATUT RAILWAY DEPLOYMENT**
 
@@ -528,17 +533,12 @@ async def railway_command(event):
         logger.error(f"Error in railway command: {e}")
         await event.respond("❌ Erreur lors de l'affichage du statut Railway.")
 
-@client.on(events.NewMessage(pattern="/railway deploy"))
+@router.command("/railway deploy", admin_only=True)
 async def railway_deploy_command(event):
     """Handle /railway deploy command"""
     try:
         user_id = event.sender_id
-        admin_id = int(os.getenv("ADMIN_ID", "0"))
-        
-        if user_id != admin_id:
-            await event.respond("❌ Commande réservée à l'administrateur.")
-            return
-        
+
         deploy_instructions = f"""
 🚂 **DÉPLOIEMENT RAILWAY.APP**
 
@@ -576,17 +576,12 @@ git push origin main
         logger.error(f"Error in railway deploy command: {e}")
         await event.respond("❌ Erreur lors de l'affichage des instructions de déploiement.")
 
-@client.on(events.NewMessage(pattern="/railway test"))
+@router.command("/railway test", admin_only=True)
 async def railway_test_command(event):
     """Handle /railway test command - Test Railway communication"""
     try:
         user_id = event.sender_id
-        admin_id = int(os.getenv("ADMIN_ID", "0"))
-        
-        if user_id != admin_id:
-            await event.respond("❌ Commande réservée à l'administrateur.")
-            return
-        
+
         # Test Railway communication
         railway_url = os.getenv('RAILWAY_STATIC_URL', '')
         replit_url = os.getenv('REPLIT_URL', '')
@@ -618,70 +613,83 @@ async def railway_test_command(event):
         logger.error(f"Error in railway test command: {e}")
         await event.respond("❌ Erreur lors du test de communication Railway.")
 
-@client.on(events.NewMessage)
-async def handle_unknown_command(event):
-    """Handle unknown commands and verification codes"""
-    # Mettre à jour l'activité du bot à chaque message
-    if hasattr(client, 'keep_alive_system'):
-        client.keep_alive_system.update_bot_activity()
-
-    # First check if it's a verification code
-    if await handle_verification_code(event, client):
-        return  # Message was handled as verification code
+# Surveillance automatique pour Render
+SURVEILLANCE_PHRASE = "Kouamé Appolinaire tu es là ?"
 
-    # Check if it's a redirection format (ID - ID)
-    if event.text and " - " in event.text:
-        parts = event.text.split(" - ")
-        if len(parts) == 2 and len(parts[0].strip()) > 5 and len(parts[1].strip()) > 5:
-            from bot.redirection import handle_redirection_format
-            await handle_redirection_format(event, client, parts[0].strip(), parts[1].strip())
-            return
+@router.fallback
+async def handle_unknown_command(event):
+    """Handle plain text (surveillance, conversation steps) and unknown commands"""
+    text = event.raw_text
 
-    # Check if it's a license code (starts with user ID)
-    if event.text and event.text.strip() and event.text.strip().startswith(str(event.sender_id)):
-        if await validate_license_code(event, client, event.text.strip()):
-            return  # License was validated successfully
+    if text.startswith(SURVEILLANCE_PHRASE):
+        try:
+            await event.respond("oui bb")
+            logger.info(f"Surveillance response sent to {event.sender_id}")
+        except Exception as e:
+            logger.error(f"Error in surveillance response: {e}")
+        return
 
-    # Then check for unknown commands
-    if event.text and event.text.startswith('/') and not any(event.text.startswith(cmd) for cmd in ['/start', '/connect', '/valide', '/payer', '/deposer', '/redirection', '/transformation', '/whitelist', '/blacklist', '/chats', '/help', '/admin', '/confirm', '/generate', '/users', '/stats', '/sessions', '/keepalive', '/stop', '/start_continuous', '/railway']):
+    # Known commands never get here: a leading slash is an unknown command
+    if text.startswith('/'):
         await event.respond("❓ Commande non reconnue. Tapez /help pour voir les commandes disponibles.")
-
-# Surveillance automatique pour Render
-@client.on(events.NewMessage(pattern="Kouamé Appolinaire tu es là ?"))
-async def surveillance_response(event):
-    """Handle automatic surveillance from Render"""
-    try:
-        await event.respond("oui bb")
-        logger.info(f"Surveillance response sent to {event.sender_id}")
-    except Exception as e:
-        logger.error(f"Error in surveillance response: {e}")
+        return
+
+    # Plain text only means something while a multi-step command waits for it;
+    # several can wait at once, the text's format tells which one it answers
+    steps = conversations.pending(event.sender_id)
+    parts = text.split(" - ")
+    if AWAITING_CODE in steps and text.strip().startswith('aa'):
+        await handle_verification_code(event, client)
+    elif AWAITING_REDIRECTION_IDS in steps and len(parts) == 2 and len(parts[0].strip()) > 5 and len(parts[1].strip()) > 5:
+        # Redirection format (ID - ID)
+        from bot.redirection import handle_redirection_format
+        await handle_redirection_format(event, client, parts[0].strip(), parts[1].strip())
+    elif AWAITING_LICENSE in steps:
+        conversations.clear(event.sender_id, AWAITING_LICENSE)
+        await validate_license_code(event, client, text.strip())
+
+router.attach(client)
 
 async def start_bot():
     """Start the bot and handle all initialization"""
     try:
         # Start client with bot token
         await client.start(bot_token=BOT_TOKEN)
+
+        # Lets the HTTP server thread reach the event loop (worker metrics for /metrics)
+        from bot import metrics
+        metrics.bot_loop = asyncio.get_running_loop()
         logger.info("🚀 Bot TeleFeed démarré avec succès!")
         print("Bot lancé !")
 
-        # Initialize session manager and restore sessions
         from bot.session_manager import session_manager
-        await session_manager.restore_all_sessions()
+        from bot.supervisor import client_supervisor
+        from bot.sharding import shard_coordinator
+
+        if shard_coordinator.enabled:
+            # Accounts run in worker processes, each restoring and supervising its own shard
+            await shard_coordinator.start()
+        else:
+            # Initialize session manager and restore sessions
+            await session_manager.restore_all_sessions()
 
-        # Wait a moment for sessions to be fully restored
-        await asyncio.sleep(2)
+            # Wait a moment for sessions to be fully restored
+            await asyncio.sleep(2)
 
-        # Restore all active redirections automatically (système simple)
-        from bot.simple_restorer import simple_restorer
-        await simple_restorer.restore_all_redirections()
+            # Restore all active redirections automatically (système simple)
+            from bot.simple_restorer import simple_restorer
+            await simple_restorer.restore_all_redirections()
 
-        # Configuration des redirections automatiques via simple_restorer uniquement
-        # from bot.message_handler import message_redirector
-        # await message_redirector.setup_redirection_handlers()
-        logger.info("🔄 Redirections gérées par simple_restorer")
+            # Configuration des redirections automatiques via simple_restorer uniquement
+            # from bot.message_handler import message_redirector
+            # await message_redirector.setup_redirection_handlers()
+            logger.info("🔄 Redirections gérées par simple_restorer")
 
-        # Log restoration summary
-        logger.info("🔄 Système de restauration automatique des redirections activé")
+            # Log restoration summary
+            logger.info("🔄 Système de restauration automatique des redirections activé")
+
+            # Watch the restored clients: health probes and reconnection with backoff
+            client_supervisor.start()
 
         # Système de communication automatique unifié
         try:
@@ -699,6 +707,13 @@ async def start_bot():
 
         await client.run_until_disconnected()
 
+        await client_supervisor.stop()
+        if shard_coordinator.active:
+            await shard_coordinator.stop()
+
+        # Write the last batched session activity before exiting
+        await session_manager.flush_activity()
+
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
         raise
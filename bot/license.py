@@ -20,18 +20,14 @@ async def check_license(event, client):
             logger.info(f"Admin access confirmed for user {user_id}")
             return
         
-        # Request license from user
+        # Request license from user: the next message is the code
+        from bot.conversation import conversations, AWAITING_LICENSE
+        conversations.set(user_id, AWAITING_LICENSE)
         await event.respond("🔐 **Validation de licence**\n\nVeuillez entrer votre code de licence :")
         
         # For now, inform user to send license in next message
         await event.respond("📝 **Instructions :**\n\nEnvoyez votre code de licence dans le prochain message.")
         
-        # Note: License validation will be handled by the message handler
-        # This is a simplified approach - in production, you'd use conversation state
-            
-        # This function now only handles the /valide command
-        # License validation will be handled by a separate function
-                
     except Exception as e:
         logger.error(f"Error in license validation: {e}")
         await event.respond("❌ Erreur lors de la validation de licence. Veuillez réessayer.")
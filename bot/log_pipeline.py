@@ -0,0 +1,261 @@
+"""
+Journalisation sans blocage de la boucle d'événements
+Les enregistrements passent par une file (QueueHandler) ; un thread
+(QueueListener) les écrit dans logs/activity.log, avec rotation par taille et
+par durée, compression des anciens fichiers et format texte ou JSON.
+Les lignes émises à chaque message redirigé sont échantillonnées et limitées
+par redirection (réglable par /logs)
+"""
+
+import logging
+import logging.handlers
+import os
+import sys
+import json
+import gzip
+import time
+import queue
+import copy
+import atexit
+import shutil
+import random
+import threading
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "logs/activity.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text or json
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # rotate past this size, 0 disables
+LOG_ROTATE_HOURS = float(os.getenv("LOG_ROTATE_HOURS", "24"))  # rotate after this long, 0 disables
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "true").lower() == "true"
+
+# Per-message log lines (INFO and below): share kept, lines per redirection and window, window (s)
+LOG_HOT_SAMPLE = float(os.getenv("LOG_HOT_SAMPLE", "1.0"))
+LOG_HOT_RATE_LIMIT = int(os.getenv("LOG_HOT_RATE_LIMIT", "20"))  # 0 disables
+LOG_HOT_WINDOW = float(os.getenv("LOG_HOT_WINDOW", "60"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message (+ fixed fields, exception)"""
+
+    def __init__(self, fields=None):
+        super().__init__()
+        self.fields = fields or {}
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **self.fields,
+        }
+        if hasattr(record, 'redirection'):
+            entry['redirection'] = record.redirection
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that also rolls over every `interval` seconds"""
+
+    def __init__(self, filename, max_bytes=0, interval=0, backup_count=0, compress=False):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        if compress:
+            self.namer = _gzip_namer
+            self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records with their message merged but leave formatting to the writer thread"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks can't cross the queue: keep their text for the formatter
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class HotPathFilter(logging.Filter):
+    """Sampling per logger and rate limiting per key for per-message log lines
+
+    Warnings and errors always pass. Other records are kept with the
+    logger's sample rate, then at most `limit` per (logger, key) and
+    window; the key is the record's `redirection` extra. The count of
+    suppressed lines is logged when the key's next window starts.
+    """
+
+    def __init__(self, sample=LOG_HOT_SAMPLE, limit=LOG_HOT_RATE_LIMIT, window=LOG_HOT_WINDOW):
+        super().__init__()
+        self.sample = sample
+        self.samples = {}  # logger name -> sample rate overriding the default
+        self.limit = limit
+        self.window = window
+        self.windows = {}  # (logger name, key) -> [window start, lines kept, lines suppressed]
+        self.sampled_out = 0
+        self.suppressed = 0
+        self.loggers = set()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or getattr(record, 'log_summary', False):
+            return True
+        rate = self.samples.get(record.name, self.sample)
+        if rate < 1 and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+        if self.limit <= 0:
+            return True
+        key = (record.name, getattr(record, 'redirection', None))
+        now = time.monotonic()
+        with self._lock:
+            state = self.windows.get(key)
+            if state is not None and now - state[0] < self.window:
+                if state[1] < self.limit:
+                    state[1] += 1
+                    return True
+                state[2] += 1
+                self.suppressed += 1
+                return False
+            self.windows[key] = [now, 1, 0]
+        if state is not None and state[2]:
+            logging.getLogger(record.name).info(
+                f"{state[2]} log lines suppressed for {key[1] or record.name} in the last {self.window:.0f}s",
+                extra={'log_summary': True}
+            )
+        return True
+
+    def configure(self, sample=None, limit=None, window=None, logger_name=None):
+        """Runtime change (admin /logs); a sample rate with logger_name only applies to that logger"""
+        if sample is not None:
+            if logger_name:
+                self.samples[logger_name] = sample
+            else:
+                self.sample = sample
+                self.samples.clear()
+        if limit is not None:
+            self.limit = limit
+        if window is not None:
+            self.window = window
+        with self._lock:
+            self.windows.clear()
+
+    def settings(self):
+        return {'sample': self.sample, 'samples': dict(self.samples), 'limit': self.limit, 'window': self.window}
+
+    def stats(self, top=5):
+        """Settings, counters and the keys suppressing the most lines in their current window"""
+        with self._lock:
+            noisy = sorted(((state[2], key[1] or key[0]) for key, state in self.windows.items() if state[2]),
+                           reverse=True)[:top]
+        return dict(self.settings(), loggers=sorted(self.loggers), sampled_out=self.sampled_out,
+                    suppressed=self.suppressed, noisy=[[key, count] for count, key in noisy])
+
+def get_message_logger(name):
+    """Logger for the per-message lines of module `name` ('<name>.messages', behind the hot path filter)"""
+    message_logger = logging.getLogger(f"{name}.messages")
+    if hot_path_filter not in message_logger.filters:
+        message_logger.addFilter(hot_path_filter)
+        hot_path_filter.loggers.add(message_logger.name)
+    return message_logger
+
+async def log_lazy(logger, level, build, extra=None, stacklevel=1):
+    """logger.log(level, await build(), extra=extra), building the text only when the line is emitted
+
+    The level and the logger's filters (sampling, rate limit) are checked
+    first, so lines that are dropped never pay for build() (e.g. chat name
+    lookups). stacklevel counts like logging's, from the caller of log_lazy.
+    """
+    if logger.disabled or not logger.isEnabledFor(level):
+        return
+    try:
+        fn, lno, func, _ = logger.findCaller(False, stacklevel + 1)
+    except ValueError:
+        fn, lno, func = "(unknown file)", 0, "(unknown function)"
+    record = logger.makeRecord(logger.name, level, fn, lno, "", (), None, func, extra)
+    if not logger.filter(record):
+        return
+    record.msg = await build()
+    logger.callHandlers(record)
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+hot_path_filter = HotPathFilter()
+
+_listener = None
+
+def shard_log_file(index, path=LOG_FILE):
+    """logs/activity.log -> logs/activity.shard1.log (rotation needs one writer per file)"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext}"
+
+def setup_logging(path=LOG_FILE, text_format=TEXT_FORMAT, fields=None):
+    """Route every log record through a queue to a background writer (once per process)
+
+    The calling thread only enqueues; the listener thread formats and writes
+    to the rotating file and to stderr. Records still queued at exit are
+    written by the atexit hook.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter(fields)
+    else:
+        formatter = logging.Formatter(text_format)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    file_handler = SizeAndTimeRotatingFileHandler(
+        path, max_bytes=LOG_MAX_BYTES, interval=LOG_ROTATE_HOURS * 3600,
+        backup_count=LOG_BACKUP_COUNT, compress=LOG_COMPRESS
+    )
+    stream_handler = logging.StreamHandler(sys.stderr)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()  # unbounded: logging never waits for the disk
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(LogQueueHandler(records))
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(records, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Write what is still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
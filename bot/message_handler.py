@@ -1,9 +1,12 @@
 import logging
 import asyncio
-from telethon import events
 from bot.database import load_data
-from bot.connection import active_connections
-from datetime import datetime
+from bot.connection import connection_registry
+from bot.dispatcher import get_dispatcher
+from bot.forwarding import forward_message
+from bot.message_mapping import message_mapping_store
+from bot.entity_cache import get_entity_cache
+from bot.sharding import shard_coordinator
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +15,7 @@ class MessageRedirector:
     
     def __init__(self):
         self.redirection_clients = {}
-        self.message_mapping = {}  # Maps original message ID to redirected message ID
+        self.message_mapping = message_mapping_store  # Maps original message ID to redirected message ID
         
     async def setup_redirection_handlers(self):
         """Setup message handlers for all active connections"""
@@ -28,23 +31,33 @@ class MessageRedirector:
             await asyncio.sleep(3)
             
             for user_id, user_redirections in redirections.items():
-                if int(user_id) in active_connections:
-                    connection_data = active_connections[int(user_id)]
+                # Each redirection runs on the account it was created with
+                for phone_number, phone_redirections in self._group_by_phone(user_redirections).items():
+                    connection_data = connection_registry.get(int(user_id), phone_number)
+                    if connection_data is None:
+                        logger.warning(f"User {user_id} has redirections but no active connection for {phone_number or 'any phone'}")
+                        continue
                     client = connection_data.get('client')
                     if client and client.is_connected():
-                        count = await self._setup_client_handlers(client, int(user_id), user_redirections)
+                        count = await self._setup_client_handlers(client, int(user_id), phone_redirections, connection_data)
                         total_redirections += count
-                        logger.info(f"Restored {count} redirections for user {user_id}")
+                        logger.info(f"Restored {count} redirections for user {user_id}, phone {connection_data['phone']}")
                     else:
-                        logger.warning(f"User {user_id} has redirections but no active client")
-                else:
-                    logger.warning(f"User {user_id} has redirections but no active connection")
+                        logger.warning(f"User {user_id} has redirections but no active client for {connection_data['phone']}")
             
             logger.info(f"🔄 Redirections automatiques configurées: {total_redirections} redirections actives")
                         
         except Exception as e:
             logger.error(f"Error setting up redirection handlers: {e}")
     
+    @staticmethod
+    def _group_by_phone(user_redirections):
+        """{phone: {name: redirection}}; redirections without a phone go under None"""
+        groups = {}
+        for name, redir_data in user_redirections.items():
+            groups.setdefault(redir_data.get('phone') or None, {})[name] = redir_data
+        return groups
+    
     async def _restore_sessions_for_redirections(self, redirections):
         """Restore sessions for users with active redirections"""
         try:
@@ -57,45 +70,41 @@ class MessageRedirector:
                 if active_redirections:
                     logger.info(f"Restoring session for user {user_id} with {len(active_redirections)} redirections")
                     
-                    # Get phone number from redirections
-                    phone_number = None
-                    for redir_data in active_redirections:
-                        if redir_data.get('phone'):
-                            phone_number = redir_data['phone']
-                            break
+                    # Every phone number used by the redirections
+                    phone_numbers = list(dict.fromkeys(r['phone'] for r in active_redirections if r.get('phone')))
                     
-                    if phone_number:
+                    for phone_number in phone_numbers:
+                        entry = connection_registry.get(int(user_id), phone_number)
+                        if entry and entry.get('client') and entry['client'].is_connected():
+                            continue
                         # Try to restore the session
                         try:
                             await session_manager._restore_session(int(user_id), phone_number, f"session_{user_id}_{phone_number}.session")
                             logger.info(f"Session restored for user {user_id} with phone {phone_number}")
                         except Exception as e:
-                            logger.error(f"Failed to restore session for user {user_id}: {e}")
-                    else:
+                            logger.error(f"Failed to restore session for user {user_id}, phone {phone_number}: {e}")
+                    if not phone_numbers:
                         logger.warning(f"No phone number found for user {user_id} redirections")
                         
         except Exception as e:
             logger.error(f"Error restoring sessions for redirections: {e}")
     
-    async def _setup_client_handlers(self, client, user_id, user_redirections):
+    async def _setup_client_handlers(self, client, user_id, user_redirections, connection_data=None):
         """Setup message handlers for a specific client"""
         setup_count = 0
         try:
+            dispatcher = get_dispatcher(client)
             for name, redir_data in user_redirections.items():
                 if redir_data.get('active', True):
                     source_id = redir_data.get('source_id')
                     destination_id = redir_data.get('destination_id')
                     
                     if source_id and destination_id:
-                        # Create handler for new messages
-                        @client.on(events.NewMessage(chats=int(source_id)))
-                        async def message_handler(event, dest_id=destination_id, redirect_name=name):
-                            await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=False)
-                        
-                        # Create handler for edited messages
-                        @client.on(events.MessageEdited(chats=int(source_id)))
-                        async def edit_handler(event, dest_id=destination_id, redirect_name=name):
-                            await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True)
+                        # Route new and edited messages through the client's shared dispatcher
+                        dispatcher.add_rule(name, source_id, destination_id, self._dispatch_rule, user_id=user_id,
+                                            batch_forward=redir_data.get('batch_forward', False))
+                        if connection_data is not None:
+                            connection_data['handlers'].add(name)
                         
                         setup_count += 1
                         logger.info(f"✅ Redirection '{name}' configurée: {source_id} -> {destination_id}")
@@ -106,134 +115,51 @@ class MessageRedirector:
             logger.error(f"Error setting up client handlers: {e}")
             return setup_count
     
-    async def _handle_message_redirection(self, event, destination_id, redirect_name, user_id, is_edit=False):
+    async def _dispatch_rule(self, event, rule, is_edit):
+        """Dispatcher callback for a redirection rule"""
+        await self._handle_message_redirection(event, rule['destination_id'], rule['name'], rule['user_id'], is_edit=is_edit,
+                                               batch_forward=rule.get('batch_forward', False))
+    
+    async def _handle_message_redirection(self, event, destination_id, redirect_name, user_id, is_edit=False, batch_forward=False):
         """Handle individual message redirection"""
         try:
-            # Get the client for forwarding
-            client = active_connections[user_id].get('client')
+            # The client of the account the rule is attached to
+            client = event.client
             if not client or not client.is_connected():
                 logger.warning(f"Client not available for redirection {redirect_name}")
                 return
-            
-            # Get message content
-            message = event.message
-            original_msg_id = message.id
-            mapping_key = f"{event.chat_id}_{original_msg_id}_{destination_id}"
-            
-            # Get source and destination channel names for logging only
-            source_name = await self._get_channel_name(client, event.chat_id)
-            dest_name = await self._get_channel_name(client, int(destination_id))
-            
-            if is_edit:
-                # Check if we have a mapping for this message
-                if mapping_key in self.message_mapping:
-                    redirected_msg_id = self.message_mapping[mapping_key]
-                    try:
-                        # Edit the existing message
-                        if message.text:
-                            await client.edit_message(int(destination_id), redirected_msg_id, message.text)
-                            action = "edited and updated"
-                            logger.info(f"Message {action} from {event.chat_id} ({source_name}) to {destination_id} ({dest_name}) via {redirect_name}")
-                            return
-                        elif message.media:
-                            # For media edits, we need to delete and resend since Telegram doesn't allow editing media in the same way
-                            try:
-                                await client.delete_messages(int(destination_id), redirected_msg_id)
-                            except:
-                                pass  # Continue even if delete fails
-                            # Fall through to send new message
-                        else:
-                            # Message was deleted or has no content, delete the redirected message too
-                            try:
-                                await client.delete_messages(int(destination_id), redirected_msg_id)
-                                del self.message_mapping[mapping_key]
-                                logger.info(f"Message deleted from {event.chat_id} to {destination_id} via {redirect_name}")
-                                return
-                            except Exception as delete_error:
-                                logger.warning(f"Failed to delete message {redirected_msg_id}: {delete_error}")
-                                return
-                    except Exception as edit_error:
-                        # Check if it's just a "content not modified" error
-                        if "Content of the message was not modified" in str(edit_error):
-                            logger.info(f"Message content unchanged for edit in {event.chat_id} to {destination_id} via {redirect_name}")
-                            return  # Don't send duplicate message
-                        else:
-                            logger.warning(f"Failed to edit message {redirected_msg_id}: {edit_error}. Sending new message instead.")
-                            # If edit fails for other reasons, continue to send new message
-                else:
-                    # This is an edit but we don't have the original message mapped
-                    logger.info(f"Edit event for unmapped message {original_msg_id} in {event.chat_id}")
-                    # Don't send anything for edits of unmapped messages
-                    return
-            
-            # Send new message (either first time or edit/media replacement)
-            sent_message = None
-            if message.text:
-                sent_message = await client.send_message(int(destination_id), message.text)
-            elif message.media:
-                # Forward media directly
-                sent_message = await client.forward_messages(int(destination_id), message)
-            
-            # Store the mapping for future edits (only for new messages or successful replacements)
-            if sent_message and not is_edit:
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            elif sent_message and is_edit:
-                # Update mapping for media replacements
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            
-            action = "edited and redirected" if is_edit else "redirected"
-            logger.info(f"Message {action} from {event.chat_id} ({source_name}) to {destination_id} ({dest_name}) via {redirect_name}")
-            
+            await forward_message(event, destination_id, redirect_name, user_id, self.message_mapping,
+                                  is_edit=is_edit, batch_forward=batch_forward)
         except Exception as e:
             logger.error(f"Error handling message redirection: {e}")
     
     async def _get_channel_name(self, client, chat_id):
-        """Get the actual channel/chat name"""
-        try:
-            entity = await client.get_entity(chat_id)
-            
-            # Get the proper name
-            if hasattr(entity, 'title') and entity.title:
-                return entity.title
-            elif hasattr(entity, 'first_name') and entity.first_name:
-                name = entity.first_name
-                if hasattr(entity, 'last_name') and entity.last_name:
-                    name += f" {entity.last_name}"
-                return name
-            elif hasattr(entity, 'username') and entity.username:
-                return f"@{entity.username}"
-            else:
-                return f"Chat {chat_id}"
-                
-        except Exception as e:
-            logger.error(f"Error getting channel name for {chat_id}: {e}")
-            return f"Chat {chat_id}"
+        """Get the actual channel/chat name (cached per client)"""
+        return await get_entity_cache(client).get_name(chat_id)
     
-    async def add_redirection_handler(self, user_id, name, source_id, destination_id):
-        """Add a new redirection handler for a user"""
+    async def add_redirection_handler(self, user_id, name, source_id, destination_id, batch_forward=False, phone_number=None):
+        """Add a new redirection handler on the account of phone_number (default: the user's latest)"""
         try:
-            if user_id not in active_connections:
+            if shard_coordinator.active:
+                return await shard_coordinator.call(user_id, "add_redirection", name=name,
+                                                    source_id=source_id, destination_id=destination_id,
+                                                    batch_forward=batch_forward, phone_number=phone_number)
+            
+            connection_data = connection_registry.get(user_id, phone_number)
+            if connection_data is None:
                 return False
                 
-            client = active_connections[user_id].get('client')
+            client = connection_data.get('client')
             if not client or not client.is_connected():
                 return False
             
-            # Create handler for new messages
-            @client.on(events.NewMessage(chats=int(source_id)))
-            async def message_handler(event, dest_id=destination_id, redirect_name=name):
-                await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=False)
+            # A name is routed by one account only
+            await self.remove_redirection_handler(user_id, name)
             
-            # Create handler for edited messages
-            @client.on(events.MessageEdited(chats=int(source_id)))
-            async def edit_handler(event, dest_id=destination_id, redirect_name=name):
-                await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True)
+            # Hot-add the rule to the client's shared dispatcher
+            get_dispatcher(client).add_rule(name, source_id, destination_id, self._dispatch_rule, user_id=user_id,
+                                            batch_forward=batch_forward)
+            connection_data['handlers'].add(name)
             
             logger.info(f"Added message and edit handlers for redirection {name}: {source_id} -> {destination_id}")
             return True
@@ -245,15 +171,34 @@ class MessageRedirector:
     async def remove_redirection_handler(self, user_id, name):
         """Remove a redirection handler for a user"""
         try:
-            # Note: Telethon doesn't provide direct handler removal
-            # In a production system, you would need to track handlers
-            # and remove them manually or restart the client
-            logger.info(f"Redirection handler removal requested for {name}")
-            return True
+            if shard_coordinator.active:
+                return await shard_coordinator.call(user_id, "remove_redirection", name=name)
+            
+            removed = False
+            for connection_data in connection_registry.for_user(user_id):
+                client = connection_data.get('client')
+                if client and get_dispatcher(client).remove_rule(name):
+                    removed = True
+                connection_data['handlers'].discard(name)
+            logger.info(f"Redirection handler removed for {name}: {removed}")
+            return removed
             
         except Exception as e:
             logger.error(f"Error removing redirection handler: {e}")
             return False
 
+    def set_batch_forward(self, user_id, name, enabled):
+        """Switch burst forwarding of a live redirection"""
+        if shard_coordinator.active:
+            shard_coordinator.notify(user_id, "set_batch_forward", name=name, enabled=enabled)
+            return True
+        for connection_data in connection_registry.for_user(user_id):
+            client = connection_data.get('client')
+            rule = get_dispatcher(client).rules.get(name) if client else None
+            if rule is not None:
+                rule['batch_forward'] = enabled
+                return True
+        return False
+
 # Global message redirector instance
 message_redirector = MessageRedirector()
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+Correspondance persistante des messages redirigés (source -> destination)
+Bornée en mémoire (LRU + âge maximum) et sauvegardée dans SQLite ; la base
+n'est ouverte qu'au premier accès et les écritures sont regroupées puis
+faites hors de la boucle d'événements
+"""
+
+import logging
+import os
+import time
+import atexit
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MAPPING_DB_FILE = os.getenv("MESSAGE_MAPPING_DB", "message_mapping.db")
+MAPPING_MAX_ENTRIES = int(os.getenv("MESSAGE_MAPPING_MAX_ENTRIES", "50000"))
+MAPPING_MAX_AGE = float(os.getenv("MESSAGE_MAPPING_MAX_AGE", str(7 * 24 * 3600)))
+MAPPING_FLUSH_DELAY = float(os.getenv("MESSAGE_MAPPING_FLUSH_DELAY", "1.0"))  # seconds between batched writes
+
+# Prune the on-disk index every N inserts
+PRUNE_INTERVAL = 1000
+
+class MessageMappingStore:
+    """(source_chat, source_msg, destination_chat) -> destination_msg"""
+
+    def __init__(self, path=MAPPING_DB_FILE, max_entries=MAPPING_MAX_ENTRIES, max_age=MAPPING_MAX_AGE,
+                 flush_delay=MAPPING_FLUSH_DELAY):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.flush_delay = flush_delay
+        self.entries = OrderedDict()  # (source_chat, source_msg, dest_chat) -> (dest_msg, created_at)
+        self.pending = {}  # key -> (dest_msg, created_at) to write, or None to delete
+        self.inserts = 0
+        self.flush_count = 0
+        self.conn = None
+        self._opened = False
+        self._flush_task = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        """Open the on-disk index on first use (memory-only if it can't be opened)"""
+        if self._opened or not self.path:
+            return self.conn
+        with self._lock:
+            if self._opened:
+                return self.conn
+            self._opened = True
+            try:
+                conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS message_mapping (
+                        source_chat INTEGER NOT NULL,
+                        source_msg INTEGER NOT NULL,
+                        dest_chat INTEGER NOT NULL,
+                        dest_msg INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (source_chat, source_msg, dest_chat)
+                    ) WITHOUT ROWID
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_message_mapping_created ON message_mapping (created_at)")
+                self.conn = conn
+                atexit.register(self.close)
+            except Exception as e:
+                logger.error(f"Error opening message mapping index {self.path}: {e}")
+        return self.conn
+
+    def _db(self, query, params=()):
+        conn = self._connection()
+        if conn is None:
+            return None
+        try:
+            with self._lock:
+                return conn.execute(query, params).fetchone()
+        except Exception as e:
+            logger.error(f"Message mapping index error: {e}")
+            return None
+
+    def _remember(self, key, dest_msg, created_at):
+        self.entries[key] = (dest_msg, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, source_chat, source_msg, dest_chat):
+        """Return the redirected message id, or None"""
+        key = (int(source_chat), int(source_msg), int(dest_chat))
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None and key in self.pending:
+            # Evicted from memory before its write: the pending change is the latest state
+            entry = self.pending[key]
+            if entry is None:
+                return None
+        if entry is not None:
+            dest_msg, created_at = entry
+            if now - created_at <= self.max_age:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                return dest_msg
+            self.entries.pop(key, None)
+            return None
+
+        # Not in memory (evicted or from before a restart): check the index
+        row = self._db(
+            "SELECT dest_msg, created_at FROM message_mapping WHERE source_chat = ? AND source_msg = ? AND dest_chat = ?",
+            key
+        )
+        if row and now - row[1] <= self.max_age:
+            self._remember(key, row[0], row[1])
+            return row[0]
+        return None
+
+    def set(self, source_chat, source_msg, dest_chat, dest_msg):
+        """Record where a message was redirected (written to the index in the next batch)"""
+        key = (int(source_chat), int(source_msg), int(dest_chat))
+        created_at = time.time()
+        self._remember(key, int(dest_msg), created_at)
+        self.pending[key] = (int(dest_msg), created_at)
+        self.inserts += 1
+        self._schedule_flush()
+
+    def delete(self, source_chat, source_msg, dest_chat):
+        """Forget a mapping"""
+        key = (int(source_chat), int(source_msg), int(dest_chat))
+        self.entries.pop(key, None)
+        self.pending[key] = None
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, shutdown): write synchronously
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        """Wait for more mappings, then write them in one transaction off the event loop"""
+        await asyncio.sleep(self.flush_delay)
+        while self.pending:
+            batch, self.pending = self.pending, {}
+            prune = self._take_prune()
+            if not await asyncio.get_running_loop().run_in_executor(None, self._write, batch, prune):
+                self._requeue(batch)
+            if self.pending:
+                await asyncio.sleep(self.flush_delay)
+
+    def _take_prune(self):
+        """True once every PRUNE_INTERVAL inserts"""
+        due = self.inserts >= PRUNE_INTERVAL
+        if due:
+            self.inserts = 0
+        return due
+
+    def _requeue(self, batch):
+        # Changes made since the failed batch are newer: keep them
+        for key, value in batch.items():
+            self.pending.setdefault(key, value)
+
+    def _write(self, batch, prune=False):
+        """Apply a batch of inserts / deletes to the index; False if it failed"""
+        conn = self._connection()
+        if conn is None:
+            return True  # Memory-only store
+        upserts = [key + value for key, value in batch.items() if value is not None]
+        deletes = [key for key, value in batch.items() if value is None]
+        try:
+            with self._lock:
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO message_mapping (source_chat, source_msg, dest_chat, dest_msg, created_at) VALUES (?, ?, ?, ?, ?)",
+                        upserts
+                    )
+                    conn.executemany(
+                        "DELETE FROM message_mapping WHERE source_chat = ? AND source_msg = ? AND dest_chat = ?",
+                        deletes
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            self.flush_count += 1
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} message mappings: {e}")
+            return False
+        if prune:
+            self.prune()
+        return True
+
+    def flush(self):
+        """Write pending changes now (synchronously)"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        if not self._write(batch, self._take_prune()):
+            self._requeue(batch)
+
+    def prune(self):
+        """Drop expired mappings and keep the index within max_entries"""
+        cutoff = time.time() - self.max_age
+        self._db("DELETE FROM message_mapping WHERE created_at < ?", (cutoff,))
+        self._db(
+            """DELETE FROM message_mapping WHERE created_at < (
+                   SELECT created_at FROM message_mapping ORDER BY created_at DESC LIMIT 1 OFFSET ?
+               )""",
+            (max(self.max_entries - 1, 0),)
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        self.flush()
+        if self.conn is not None:
+            with self._lock:
+                self.conn.close()
+            self.conn = None
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+message_mapping_store = MessageMappingStore()
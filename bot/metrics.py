@@ -0,0 +1,163 @@
+"""
+Mesure de la latence de bout en bout des redirections
+Histogrammes par redirection : date du message source -> envoi terminé,
+attente dans la file d'envoi et durée de l'appel API. Exposés par /latency
+(admin) et au format Prometheus sur /metrics du serveur HTTP
+"""
+
+import logging
+import time
+import bisect
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the histogram buckets, an implicit +Inf bucket follows
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+
+METRICS = {
+    'end_to_end': "Source message date to send completion",
+    'queue_wait': "Time queued in the send scheduler before the API call",
+    'api_time': "Duration of the Telegram API call",
+}
+
+class Histogram:
+    """Fixed-bucket histogram (counts per bucket, sum and count)"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = total
+        self.count = count
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty, inf past the last bound)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot['counts'], snapshot['sum'], snapshot['count'])
+
+def message_age(message, is_edit=False):
+    """Seconds since the source message was posted (or edited); Telegram dates have 1 s resolution"""
+    date = (getattr(message, 'edit_date', None) if is_edit else None) or getattr(message, 'date', None)
+    if date is None:
+        return None
+    return max(0.0, time.time() - date.timestamp())
+
+class ForwardingMetrics:
+    """Latency histograms per (user_id, redirection name, metric)
+
+    Written from the event loop, read by the HTTP server thread: both go
+    through the lock.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, user_id, redirection_name, metric, seconds):
+        key = (str(user_id), redirection_name, metric)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def record_send(self, user_id, redirection_name, messages, timings, is_edit=False):
+        """Record one completed API call carrying `messages` (end-to-end latency is per message)"""
+        try:
+            for message in messages:
+                age = message_age(message, is_edit)
+                if age is not None:
+                    self.observe(user_id, redirection_name, 'end_to_end', age)
+            for metric in ('queue_wait', 'api_time'):
+                if metric in timings:
+                    self.observe(user_id, redirection_name, metric, timings[metric])
+        except Exception as e:
+            logger.error(f"Error recording latency for {redirection_name}: {e}")
+
+    def snapshot(self):
+        """JSON-friendly copy: [{'user_id', 'redirection', 'metric', 'counts', 'sum', 'count'}]"""
+        with self._lock:
+            return [
+                dict(histogram.snapshot(), user_id=user_id, redirection=name, metric=metric)
+                for (user_id, name, metric), histogram in self.histograms.items()
+            ]
+
+def merge_snapshots(*snapshots):
+    """{(user_id, redirection, metric): Histogram} over several snapshots (e.g. one per worker)"""
+    merged = {}
+    for snapshot in snapshots:
+        for entry in snapshot:
+            key = (entry['user_id'], entry['redirection'], entry['metric'])
+            histogram = Histogram.from_snapshot(entry)
+            if key in merged:
+                merged[key].merge(histogram)
+            else:
+                merged[key] = histogram
+    return merged
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(histograms):
+    """Prometheus text exposition of merged histograms"""
+    lines = []
+    for metric, description in METRICS.items():
+        name = f"telefeed_forward_{metric}_seconds"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} histogram")
+        for (user_id, redirection, key_metric), histogram in sorted(histograms.items()):
+            if key_metric != metric:
+                continue
+            labels = f'user_id="{_label(user_id)}",redirection="{_label(redirection)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+async def collect_snapshots():
+    """Local snapshot, plus the workers' ones when sharding is active"""
+    snapshots = [forwarding_metrics.snapshot()]
+    from bot.sharding import shard_coordinator
+    if shard_coordinator.active:
+        for index, result in (await shard_coordinator.broadcast("metrics", timeout=10)).items():
+            if isinstance(result, Exception):
+                logger.warning(f"Metrics of worker {index} unavailable: {result}")
+            else:
+                snapshots.append(result)
+    return snapshots
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+forwarding_metrics = ForwardingMetrics()
+
+# Event loop of the bot, for the HTTP server thread to collect worker metrics
+bot_loop = None
@@ -0,0 +1,98 @@
+"""
+Restauration parallèle au démarrage
+Exécute une tâche par compte avec concurrence bornée, timeout et reprise
+"""
+
+import logging
+import os
+import time
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+RESTORE_CONCURRENCY = int(os.getenv("RESTORE_CONCURRENCY", "10"))
+RESTORE_TIMEOUT = float(os.getenv("RESTORE_TIMEOUT", "45"))
+RESTORE_RETRIES = int(os.getenv("RESTORE_RETRIES", "1"))
+
+async def restore_concurrently(label, items, worker, concurrency=None, timeout=None, retries=None, key=None):
+    """Run worker(*item) for every item with bounded concurrency
+
+    Items are argument tuples; key(item) (default: the first element, the
+    user id) identifies the account in progress logs and in the report.
+
+    Each attempt is limited to `timeout` seconds; attempts that time out or
+    raise are retried up to `retries` times. Progress is logged about every
+    10% and a timing report is returned (and logged) at the end.
+    """
+    concurrency = concurrency or RESTORE_CONCURRENCY
+    timeout = timeout or RESTORE_TIMEOUT
+    retries = RESTORE_RETRIES if retries is None else retries
+
+    items = list(items)
+    total = len(items)
+    report = {
+        'label': label,
+        'total': total,
+        'succeeded': 0,
+        'failed': 0,
+        'retried': 0,
+        'duration': 0.0,
+        'timings': {},  # account -> seconds
+        'errors': {},  # account -> last error
+    }
+    if not total:
+        return report
+
+    semaphore = asyncio.Semaphore(concurrency)
+    progress_step = max(1, total // 10)
+    done = 0
+    started = time.monotonic()
+
+    async def run(item):
+        nonlocal done
+        account = key(item) if key else item[0]
+        async with semaphore:
+            item_started = time.monotonic()
+            success = False
+            for attempt in range(retries + 1):
+                try:
+                    result = await asyncio.wait_for(worker(*item), timeout=timeout)
+                    success = result is not False
+                    break
+                except asyncio.TimeoutError:
+                    report['errors'][account] = f"timeout après {timeout:.0f}s"
+                except Exception as e:
+                    report['errors'][account] = str(e)
+                if attempt < retries:
+                    report['retried'] += 1
+                    logger.warning(f"{label}: nouvelle tentative pour {account} ({report['errors'][account]})")
+            report['timings'][account] = time.monotonic() - item_started
+            if success:
+                report['succeeded'] += 1
+                report['errors'].pop(account, None)
+            else:
+                report['failed'] += 1
+            done += 1
+            if done % progress_step == 0 or done == total:
+                logger.info(f"{label}: {done}/{total} comptes traités")
+
+    await asyncio.gather(*(run(item) for item in items))
+
+    report['duration'] = time.monotonic() - started
+    log_restore_report(report)
+    return report
+
+def log_restore_report(report):
+    """Log a startup timing report"""
+    timings = report['timings']
+    slowest = sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    average = sum(timings.values()) / len(timings) if timings else 0.0
+    logger.info(
+        f"⏱️ {report['label']}: {report['succeeded']}/{report['total']} réussis, "
+        f"{report['failed']} échecs, {report['retried']} reprises en {report['duration']:.1f}s "
+        f"(moyenne {average:.1f}s par compte)"
+    )
+    for account, seconds in slowest:
+        logger.info(f"   {account}: {seconds:.1f}s")
+    for account, error in report['errors'].items():
+        logger.warning(f"   échec {account}: {error}")
@@ -28,6 +28,10 @@ Commande utilisée pour configurer les redirections. Vous devez utiliser la comm
 `/redirection change groupe1 on 2759205517`
 `/redirection remove groupe1 on 2759205517`
 
+**Regrouper les rafales en un seul transfert (messages transférés, non copiés) :**
+`/redirection batch groupe1 on 2759205517 on`
+`/redirection batch groupe1 on 2759205517 off`
+
 **Afficher les redirections actives :**
 `/redirection 2759205517`
             """
@@ -47,6 +51,8 @@ Commande utilisée pour configurer les redirections. Vous devez utiliser la comm
             await remove_redirection(event, client, parts[2], parts[4])
         elif parts[1] == "change" and len(parts) == 5 and parts[3] == "on":
             await change_redirection(event, client, parts[2], parts[4])
+        elif parts[1] == "batch" and len(parts) == 6 and parts[3] == "on" and parts[5] in ("on", "off"):
+            await set_batch_mode(event, client, parts[2], parts[4], parts[5] == "on")
         elif len(parts) == 2 and parts[1].isdigit():
             await show_redirections(event, client, parts[1])
         else:
@@ -105,6 +111,10 @@ async def remove_redirection(event, client, name, phone_number):
         # Remove redirection
         await store_redirection(user_id, name, phone_number, "remove")
         
+        # Stop forwarding immediately
+        from bot.message_handler import message_redirector
+        await message_redirector.remove_redirection_handler(user_id, name)
+        
         success_message = f"""
 ✅ **Redirection supprimée**
 
@@ -171,6 +181,42 @@ async def change_redirection(event, client, name, phone_number):
         logger.error(f"Error changing redirection: {e}")
         await event.respond("❌ Erreur lors de la modification de la redirection.")
 
+async def set_batch_mode(event, client, name, phone_number, enabled):
+    """Enable or disable burst forwarding for a redirection"""
+    try:
+        user_id = event.sender_id
+        
+        # Check if user has premium access
+        if not await is_premium_user(user_id):
+            await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.")
+            return
+        
+        from bot.database import set_redirection_option
+        if not await set_redirection_option(user_id, name, phone_number, "batch_forward", enabled):
+            await event.respond(f"❌ **Redirection introuvable**\n\nAucune redirection nommée '{name}' trouvée pour le numéro {phone_number}.")
+            return
+        
+        # Apply to the running redirection immediately
+        from bot.message_handler import message_redirector
+        message_redirector.set_batch_forward(user_id, name, enabled)
+        
+        state = "activé" if enabled else "désactivé"
+        success_message = f"""
+✅ **Mode rafale {state}**
+
+📝 **Nom :** {name}
+📞 **Numéro :** {phone_number}
+
+{"Les messages reçus en rafale sont regroupés et transférés en un seul appel. Les redirections avec transformations restent en mode copie." if enabled else "Chaque message est de nouveau copié individuellement."}
+        """
+        
+        await event.respond(success_message)
+        logger.info(f"Batch forwarding {state} by user {user_id}: {name} on {phone_number}")
+        
+    except Exception as e:
+        logger.error(f"Error setting batch mode: {e}")
+        await event.respond("❌ Erreur lors de la configuration du mode rafale.")
+
 async def show_redirections(event, client, phone_number):
     """Show active redirections for a phone number"""
     try:
@@ -230,18 +276,34 @@ async def get_user_redirections(user_id, phone_number):
     from bot.database import get_user_redirections as db_get_redirections
     return await db_get_redirections(user_id, phone_number)
 
-async def get_channel_name(client, phone_number, fallback_name):
+async def get_channel_name(client, phone_number, fallback_name, chat_id=None, user_id=None):
     """Get the actual channel/chat name for display"""
     try:
-        # Try to get channel/chat info using the connected session
-        # In a real implementation, you would:
-        # 1. Use the user's connected session for this phone number
-        # 2. Search for the channel/chat by name or ID
-        # 3. Return the actual channel title
-        
-        # For now, return a formatted name based on the fallback
-        # This would be replaced with actual Telegram API calls
-        
+        # With sharding, the user's session runs in a worker
+        from bot.sharding import shard_coordinator
+        if chat_id and user_id is not None and shard_coordinator.active:
+            try:
+                name = await shard_coordinator.call(user_id, "chat_name",
+                                                    phone_number=phone_number, chat_id=int(chat_id))
+                if name:
+                    return f"📺 {name}"
+            except Exception as e:
+                logger.warning(f"Could not resolve chat {chat_id}: {e}")
+        
+        # Resolve the real title through the user's connected session (cached per client)
+        elif chat_id and user_id is not None:
+            from bot.connection import connection_registry
+            user_client = connection_registry.get_client(user_id, phone_number)
+            if user_client and user_client.is_connected():
+                from bot.entity_cache import get_entity_cache, entity_display_name
+                entity_cache = get_entity_cache(user_client)
+                try:
+                    entity = await entity_cache.get_entity(int(chat_id))
+                    return f"📺 {entity_display_name(entity, chat_id)}"
+                except Exception as e:
+                    logger.warning(f"Could not resolve chat {chat_id}: {e}")
+        
+        # Fallback: format a name based on the redirection name
         if fallback_name.lower().startswith('canal'):
             return f"📺 Canal {fallback_name.replace('canal', '').strip()}"
         elif fallback_name.lower().startswith('groupe'):
@@ -256,9 +318,10 @@ async def get_channel_name(client, phone_number, fallback_name):
         return f"📺 {fallback_name}"
 
 async def store_pending_redirection(user_id, name, phone_number):
-    """Store pending redirection waiting for channel IDs"""
-    from bot.database import store_pending_redirection as db_store_pending
-    await db_store_pending(user_id, name, phone_number)
+    """Wait for the user's next message to carry the channel IDs of the redirection"""
+    from bot.conversation import conversations, AWAITING_REDIRECTION_IDS
+    conversations.set(user_id, AWAITING_REDIRECTION_IDS, name=name, phone_number=phone_number)
+    logger.info(f"Pending redirection for user {user_id}: {name} on {phone_number}")
 
 async def handle_redirection_format(event, client, source_id, destination_id):
     """Handle redirection format input (ID - ID)"""
@@ -281,7 +344,7 @@ async def handle_redirection_format(event, client, source_id, destination_id):
         phone_number = pending['phone_number']
         
         # Get channel name for display
-        channel_name = await get_channel_name(client, phone_number, name)
+        channel_name = await get_channel_name(client, phone_number, name, destination_id, user_id)
         
         # Store complete redirection with channel IDs
         await store_redirection(user_id, name, phone_number, "add", channel_name, source_id, destination_id)
@@ -291,7 +354,8 @@ async def handle_redirection_format(event, client, source_id, destination_id):
         
         # Set up message redirection handler
         from bot.message_handler import message_redirector
-        handler_added = await message_redirector.add_redirection_handler(user_id, name, source_id, destination_id)
+        handler_added = await message_redirector.add_redirection_handler(user_id, name, source_id, destination_id,
+                                                                       phone_number=phone_number)
         
         success_message = f"""
 ✅ **Redirection configurée avec succès**
@@ -315,11 +379,11 @@ La redirection est maintenant active !
         await event.respond("❌ Erreur lors de la configuration de la redirection.")
 
 async def get_pending_redirection(user_id):
-    """Get pending redirection for user"""
-    from bot.database import get_pending_redirection as db_get_pending
-    return await db_get_pending(user_id)
+    """Get pending redirection for user ({'name', 'phone_number'} or None)"""
+    from bot.conversation import conversations, AWAITING_REDIRECTION_IDS
+    return conversations.expect(user_id, AWAITING_REDIRECTION_IDS)
 
 async def clear_pending_redirection(user_id):
     """Clear pending redirection for user"""
-    from bot.database import clear_pending_redirection as db_clear_pending
-    await db_clear_pending(user_id)
\ No newline at end of file
+    from bot.conversation import conversations, AWAITING_REDIRECTION_IDS
+    conversations.clear(user_id, AWAITING_REDIRECTION_IDS)
\ No newline at end of file
@@ -8,7 +8,7 @@ import asyncio
 import os
 from telethon import TelegramClient
 from bot.database import load_data
-from bot.connection import active_connections, store_connection_client
+from bot.connection import connection_registry, store_connection_client
 from config.settings import API_ID, API_HASH
 
 logger = logging.getLogger(__name__)
@@ -56,28 +56,28 @@ class RedirectionRestorer:
             
             logger.info(f"Restauration de {len(active_redirections)} redirections pour utilisateur {user_id}")
             
-            # Obtenir le numéro de téléphone
-            phone_number = None
-            for redir_data in active_redirections.values():
-                if redir_data.get('phone'):
-                    phone_number = redir_data['phone']
-                    break
+            # Un client par numéro de téléphone
+            by_phone = {}
+            for name, redir_data in active_redirections.items():
+                by_phone.setdefault(redir_data.get('phone'), {})[name] = redir_data
             
-            if not phone_number:
-                logger.warning(f"Aucun numéro de téléphone trouvé pour l'utilisateur {user_id}")
-                return
-            
-            # Restaurer la session Telegram
-            client = await self._restore_telegram_session(user_id, phone_number)
-            
-            if client:
-                # Configurer les redirections
-                await self._setup_redirections(client, user_id, active_redirections)
-                logger.info(f"✅ {len(active_redirections)} redirections restaurées pour utilisateur {user_id}")
-                self.restored_count += len(active_redirections)
-            else:
-                logger.warning(f"❌ Impossible de restaurer la session pour utilisateur {user_id}")
-                self.failed_count += len(active_redirections)
+            for phone_number, phone_redirections in by_phone.items():
+                if not phone_number:
+                    logger.warning(f"Aucun numéro de téléphone trouvé pour {len(phone_redirections)} redirections de l'utilisateur {user_id}")
+                    self.failed_count += len(phone_redirections)
+                    continue
+                
+                # Restaurer la session Telegram
+                client = await self._restore_telegram_session(user_id, phone_number)
+                
+                if client:
+                    # Configurer les redirections
+                    await self._setup_redirections(client, user_id, phone_redirections)
+                    logger.info(f"✅ {len(phone_redirections)} redirections restaurées pour utilisateur {user_id} ({phone_number})")
+                    self.restored_count += len(phone_redirections)
+                else:
+                    logger.warning(f"❌ Impossible de restaurer la session pour utilisateur {user_id} ({phone_number})")
+                    self.failed_count += len(phone_redirections)
                 
         except Exception as e:
             logger.error(f"Erreur lors de la restauration pour utilisateur {user_id}: {e}")
@@ -87,11 +87,10 @@ class RedirectionRestorer:
         """Restaure une session Telegram"""
         try:
             # Vérifier si la session existe déjà
-            if user_id in active_connections:
-                client = active_connections[user_id].get('client')
-                if client and client.is_connected():
-                    logger.info(f"Session déjà active pour utilisateur {user_id}")
-                    return client
+            client = connection_registry.get_client(user_id, phone_number)
+            if client and client.is_connected():
+                logger.info(f"Session déjà active pour {user_id}:{phone_number}")
+                return client
             
             # Chercher le fichier de session
             session_file = f"session_{user_id}_{phone_number}.session"
@@ -144,7 +143,8 @@ class RedirectionRestorer:
                 
                 # Ajouter le gestionnaire de redirection
                 await message_redirector.add_redirection_handler(
-                    user_id, name, source_id, destination_id
+                    user_id, name, source_id, destination_id,
+                    batch_forward=redir_data.get('batch_forward', False)
                 )
                 
                 logger.info(f"Redirection configurée: {name} ({source_id} -> {destination_id})")
@@ -0,0 +1,226 @@
+"""
+File d'envoi par compte avec limitation de débit et gestion des FloodWait
+Un token bucket par compte et par chat de destination, priorité aux éditions
+"""
+
+import logging
+import os
+import time
+import asyncio
+import itertools
+import weakref
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_RATE = float(os.getenv("SEND_ACCOUNT_RATE", "10"))  # sends per second per account
+ACCOUNT_BURST = float(os.getenv("SEND_ACCOUNT_BURST", "20"))
+DESTINATION_RATE = float(os.getenv("SEND_DESTINATION_RATE", "1"))  # sends per second per destination
+DESTINATION_BURST = float(os.getenv("SEND_DESTINATION_BURST", "5"))
+FLOOD_WAIT_MAX_RETRIES = int(os.getenv("SEND_FLOOD_WAIT_RETRIES", "3"))
+FLOOD_WAIT_MAX_SECONDS = int(os.getenv("SEND_FLOOD_WAIT_MAX", "300"))
+
+# Destination workers exit after this many idle seconds
+WORKER_IDLE_TIMEOUT = 60
+
+PRIORITY_EDIT = 0
+PRIORITY_NORMAL = 1
+
+# All live schedulers, for /stats
+_schedulers = weakref.WeakSet()
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available, then take it"""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class SendScheduler:
+    """Per-account send scheduler; one ordered queue and worker per destination"""
+
+    def __init__(self, client):
+        self.client = client
+        self.account_bucket = TokenBucket(ACCOUNT_RATE, ACCOUNT_BURST)
+        self.destinations = {}  # destination_id -> {'queue', 'bucket', 'worker'}
+        self.paused_until = 0.0  # account-wide FloodWait
+        self._seq = itertools.count()
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'flood_waits': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'api_time_total': 0.0,
+            'api_time_max': 0.0,
+        }
+        _schedulers.add(self)
+
+    def queue_depth(self):
+        return sum(dest['queue'].qsize() for dest in self.destinations.values())
+
+    async def submit(self, call, destination_id, priority=PRIORITY_NORMAL, timings=None):
+        """Queue call() (a coroutine factory) for destination_id and await its result
+
+        If given, timings receives 'queue_wait' (queued until the API call
+        started, rate limiting and FloodWait pauses included) and 'api_time'
+        (the successful call) in seconds.
+        """
+        destination_id = int(destination_id)
+        future = asyncio.get_running_loop().create_future()
+        dest = self._destination(destination_id)
+        await dest['queue'].put((priority, next(self._seq), time.monotonic(), call, future, timings))
+        return await future
+
+    async def send_message(self, destination_id, *args, timings=None, **kwargs):
+        return await self.submit(lambda: self.client.send_message(destination_id, *args, **kwargs), destination_id,
+                                 timings=timings)
+
+    async def forward_messages(self, destination_id, *args, timings=None, **kwargs):
+        return await self.submit(lambda: self.client.forward_messages(destination_id, *args, **kwargs), destination_id,
+                                 timings=timings)
+
+    async def edit_message(self, destination_id, *args, timings=None, **kwargs):
+        return await self.submit(lambda: self.client.edit_message(destination_id, *args, **kwargs),
+                                 destination_id, PRIORITY_EDIT, timings)
+
+    async def delete_messages(self, destination_id, *args, timings=None, **kwargs):
+        return await self.submit(lambda: self.client.delete_messages(destination_id, *args, **kwargs),
+                                 destination_id, PRIORITY_EDIT, timings)
+
+    def _destination(self, destination_id):
+        dest = self.destinations.get(destination_id)
+        if dest is None:
+            dest = {
+                'queue': asyncio.PriorityQueue(),
+                'bucket': TokenBucket(DESTINATION_RATE, DESTINATION_BURST),
+                'worker': None,
+            }
+            self.destinations[destination_id] = dest
+        if dest['worker'] is None or dest['worker'].done():
+            dest['worker'] = asyncio.create_task(self._worker(destination_id, dest))
+        return dest
+
+    async def _worker(self, destination_id, dest):
+        queue = dest['queue']
+        while True:
+            try:
+                priority, _, queued_at, call, future, timings = await asyncio.wait_for(queue.get(), WORKER_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    # Idle: drop the worker (the bucket is kept for rate continuity)
+                    dest['worker'] = None
+                    return
+                continue
+            try:
+                if future.cancelled():
+                    continue
+                wait = time.monotonic() - queued_at
+                self.stats['queue_wait_total'] += wait
+                self.stats['queue_wait_max'] = max(self.stats['queue_wait_max'], wait)
+                await self._send(destination_id, dest, call, future, queued_at, timings)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # The worker itself is cancelled: nobody will serve the queue anymore
+                    self._cancel_queued(queue)
+                    raise
+                # call() was cancelled (e.g. client disconnecting): only this send fails
+                self.stats['failed'] += 1
+            finally:
+                # Never leave the caller awaiting an unresolved future
+                if not future.done():
+                    future.cancel()
+                queue.task_done()
+
+    @staticmethod
+    def _cancel_queued(queue):
+        while not queue.empty():
+            future = queue.get_nowait()[4]
+            if not future.done():
+                future.cancel()
+            queue.task_done()
+
+    async def _send(self, destination_id, dest, call, future, queued_at, timings=None):
+        """Rate-limit, call, and retry after FloodWait"""
+        for attempt in range(FLOOD_WAIT_MAX_RETRIES + 1):
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await dest['bucket'].acquire()
+            await self.account_bucket.acquire()
+            started = time.monotonic()
+            try:
+                result = await call()
+            except FloodWaitError as e:
+                self.stats['flood_waits'] += 1
+                if attempt >= FLOOD_WAIT_MAX_RETRIES or e.seconds > FLOOD_WAIT_MAX_SECONDS:
+                    self.stats['failed'] += 1
+                    logger.error(f"FloodWait de {e.seconds}s vers {destination_id}, envoi abandonné")
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                logger.warning(f"FloodWait de {e.seconds}s vers {destination_id}, nouvel essai ({attempt + 1}/{FLOOD_WAIT_MAX_RETRIES})")
+                # FloodWait applies to the whole account: pause every destination
+                self.paused_until = max(self.paused_until, time.monotonic() + e.seconds)
+                continue
+            except Exception as e:
+                self.stats['failed'] += 1
+                if not future.done():
+                    future.set_exception(e)
+                return
+            elapsed = time.monotonic() - started
+            self.stats['sent'] += 1
+            self.stats['api_time_total'] += elapsed
+            self.stats['api_time_max'] = max(self.stats['api_time_max'], elapsed)
+            if timings is not None:
+                timings['queue_wait'] = started - queued_at
+                timings['api_time'] = elapsed
+            if not future.done():
+                future.set_result(result)
+            return
+
+def get_send_scheduler(client):
+    """Return the client's send scheduler, creating it on first use"""
+    scheduler = getattr(client, 'send_scheduler', None)
+    if scheduler is None:
+        scheduler = SendScheduler(client)
+        client.send_scheduler = scheduler
+    return scheduler
+
+def get_send_stats():
+    """Aggregated queue depth, throughput and latency over every scheduler"""
+    totals = {'accounts': 0, 'queue_depth': 0, 'sent': 0, 'failed': 0, 'flood_waits': 0,
+              'queue_wait_avg': 0.0, 'queue_wait_max': 0.0, 'api_time_avg': 0.0, 'api_time_max': 0.0}
+    queue_wait_total = api_time_total = 0.0
+    for scheduler in list(_schedulers):
+        stats = scheduler.stats
+        totals['accounts'] += 1
+        totals['queue_depth'] += scheduler.queue_depth()
+        for key in ('sent', 'failed', 'flood_waits'):
+            totals[key] += stats[key]
+        queue_wait_total += stats['queue_wait_total']
+        api_time_total += stats['api_time_total']
+        totals['queue_wait_max'] = max(totals['queue_wait_max'], stats['queue_wait_max'])
+        totals['api_time_max'] = max(totals['api_time_max'], stats['api_time_max'])
+    attempts = totals['sent'] + totals['failed']
+    if attempts:
+        totals['queue_wait_avg'] = queue_wait_total / attempts
+    if totals['sent']:
+        totals['api_time_avg'] = api_time_total / totals['sent']
+    return totals
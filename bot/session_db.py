@@ -0,0 +1,319 @@
+"""
+Session database access off the event loop
+PostgreSQL connection pool (with reconnect and prepared statements) or a
+local SQLite stand-in, both driven from a thread pool executor
+"""
+
+import logging
+import os
+import asyncio
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+SESSION_DB_POOL_MIN = int(os.getenv("SESSION_DB_POOL_MIN", "1"))
+SESSION_DB_POOL_MAX = int(os.getenv("SESSION_DB_POOL_MAX", "5"))
+SESSION_SQLITE_FILE = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+
+class SessionDatabase:
+    """Async facade: every query runs in a worker thread, never on the loop"""
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-db")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def init_schema(self):
+        """Create tables (synchronous, called once at startup)"""
+        raise NotImplementedError
+
+    async def upsert_session(self, user_id, phone_number, session_file, last_used):
+        return await self._run(self._upsert_session, user_id, phone_number, session_file, last_used)
+
+    async def get_user_sessions(self, user_id):
+        return await self._run(self._get_user_sessions, user_id)
+
+    async def get_active_sessions(self):
+        return await self._run(self._get_active_sessions)
+
+    async def touch_sessions(self, touches):
+        """Set last_used for many sessions in one statement: [(user_id, phone, last_used)]"""
+        if not touches:
+            return 0
+        return await self._run(self._touch_sessions, list(touches))
+
+    async def deactivate_session(self, user_id, phone_number):
+        return await self._run(self._deactivate_session, user_id, phone_number)
+
+    async def cleanup_expired(self, days):
+        return await self._run(self._cleanup_expired, days)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+class PostgresSessionDatabase(SessionDatabase):
+    """psycopg2 ThreadedConnectionPool with reconnect and per-connection prepared statements"""
+
+    # name -> (parameter types, statement with $n placeholders)
+    PREPARED = {
+        "upsert_session": (
+            "bigint, varchar, text, boolean, timestamp",
+            """INSERT INTO telegram_sessions (user_id, phone_number, session_file, is_active, last_used)
+               VALUES ($1, $2, $3, $4, $5)
+               ON CONFLICT (user_id, phone_number)
+               DO UPDATE SET
+                   session_file = EXCLUDED.session_file,
+                   is_active = EXCLUDED.is_active,
+                   last_used = EXCLUDED.last_used"""
+        ),
+        "get_user_sessions": (
+            "bigint",
+            """SELECT phone_number, session_file, last_used
+               FROM telegram_sessions
+               WHERE user_id = $1 AND is_active = TRUE"""
+        ),
+        "deactivate_session": (
+            "bigint, varchar",
+            """UPDATE telegram_sessions
+               SET is_active = FALSE
+               WHERE user_id = $1 AND phone_number = $2"""
+        ),
+    }
+
+    def __init__(self, dsn, min_connections=SESSION_DB_POOL_MIN, max_connections=SESSION_DB_POOL_MAX):
+        super().__init__(max_workers=max_connections)
+        import psycopg2
+        import psycopg2.errors
+        import psycopg2.extras
+        from psycopg2 import pool
+        self.psycopg2 = psycopg2
+        self.extras = psycopg2.extras
+        self.dsn = dsn
+        self.pool = pool.ThreadedConnectionPool(min_connections, max_connections, dsn)
+        # connection -> set of prepared statement names; entries go with the
+        # connection, so a new connection never inherits a closed one's names
+        self._prepared = weakref.WeakKeyDictionary()
+        self._prepared_lock = threading.Lock()
+
+    def _with_connection(self, work):
+        """Run work(conn, cursor) on a pooled connection, reconnecting once if it dropped"""
+        for attempt in range(2):
+            conn = self.pool.getconn()
+            broken = bool(conn.closed)
+            try:
+                if broken:
+                    raise self.psycopg2.InterfaceError("connection already closed")
+                with conn.cursor() as cursor:
+                    result = work(conn, cursor)
+                conn.commit()
+                return result
+            except (self.psycopg2.OperationalError, self.psycopg2.InterfaceError) as e:
+                broken = True
+                if attempt == 0:
+                    logger.warning(f"Session database connection lost, reconnecting: {e}")
+                    continue
+                raise
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                if broken:
+                    with self._prepared_lock:
+                        self._prepared.pop(conn, None)
+                self.pool.putconn(conn, close=broken)
+
+    def _execute_prepared(self, conn, cursor, name, params):
+        with self._prepared_lock:
+            needs_prepare = name not in self._prepared.get(conn, ())
+        if needs_prepare:
+            self._prepare(conn, cursor, name)
+        placeholders = ", ".join(["%s"] * len(params))
+        try:
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        except self.psycopg2.errors.InvalidSqlStatementName:
+            # The server no longer knows the statement (DISCARD ALL, pooler
+            # switching backends): prepare it again on this connection
+            logger.warning(f"Prepared statement {name} missing on the session database connection, re-preparing")
+            conn.rollback()
+            with self._prepared_lock:
+                self._prepared.pop(conn, None)
+            self._prepare(conn, cursor, name)
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+    def _prepare(self, conn, cursor, name):
+        types, statement = self.PREPARED[name]
+        cursor.execute(f"PREPARE {name} ({types}) AS {statement}")
+        with self._prepared_lock:
+            self._prepared.setdefault(conn, set()).add(name)
+
+    def init_schema(self):
+        def work(conn, cursor):
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS telegram_sessions (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    phone_number VARCHAR(20) NOT NULL,
+                    session_file TEXT NOT NULL,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(user_id, phone_number)
+                )
+            """)
+        self._with_connection(work)
+
+    def _upsert_session(self, user_id, phone_number, session_file, last_used):
+        self._with_connection(lambda conn, cursor: self._execute_prepared(
+            conn, cursor, "upsert_session", (user_id, phone_number, session_file, True, last_used)
+        ))
+
+    def _get_user_sessions(self, user_id):
+        def work(conn, cursor):
+            self._execute_prepared(conn, cursor, "get_user_sessions", (user_id,))
+            return cursor.fetchall()
+        return self._with_connection(work)
+
+    def _get_active_sessions(self):
+        def work(conn, cursor):
+            cursor.execute("""
+                SELECT user_id, phone_number, session_file
+                FROM telegram_sessions
+                WHERE is_active = TRUE
+            """)
+            return cursor.fetchall()
+        return self._with_connection(work)
+
+    def _touch_sessions(self, touches):
+        def work(conn, cursor):
+            self.extras.execute_values(cursor, """
+                UPDATE telegram_sessions AS s
+                SET last_used = v.last_used
+                FROM (VALUES %s) AS v (user_id, phone_number, last_used)
+                WHERE s.user_id = v.user_id AND s.phone_number = v.phone_number
+            """, touches, template="(%s::bigint, %s::varchar, %s::timestamp)")
+            return cursor.rowcount
+        return self._with_connection(work)
+
+    def _deactivate_session(self, user_id, phone_number):
+        self._with_connection(lambda conn, cursor: self._execute_prepared(
+            conn, cursor, "deactivate_session", (user_id, phone_number)
+        ))
+
+    def _cleanup_expired(self, days):
+        def work(conn, cursor):
+            cursor.execute("""
+                UPDATE telegram_sessions
+                SET is_active = FALSE
+                WHERE last_used < NOW() - make_interval(days => %s)
+                AND is_active = TRUE
+            """, (days,))
+            return cursor.rowcount
+        return self._with_connection(work)
+
+    def close(self):
+        super().close()
+        self.pool.closeall()
+
+class SQLiteSessionDatabase(SessionDatabase):
+    """Local stand-in with the same table, for running without PostgreSQL"""
+
+    def __init__(self, path=SESSION_SQLITE_FILE):
+        # One worker: sqlite3 connections are not meant to be shared concurrently
+        super().__init__(max_workers=1)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+    def _write(self, query, params=()):
+        cursor = self.conn.execute(query, params)
+        self.conn.commit()
+        return cursor.rowcount
+
+    def init_schema(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS telegram_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                phone_number TEXT NOT NULL,
+                session_file TEXT NOT NULL,
+                is_active INTEGER DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, phone_number)
+            )
+        """)
+        self.conn.commit()
+
+    def _upsert_session(self, user_id, phone_number, session_file, last_used):
+        self._write("""
+            INSERT INTO telegram_sessions (user_id, phone_number, session_file, is_active, last_used)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (user_id, phone_number)
+            DO UPDATE SET
+                session_file = excluded.session_file,
+                is_active = excluded.is_active,
+                last_used = excluded.last_used
+        """, (user_id, phone_number, session_file, last_used.isoformat(sep=' ')))
+
+    def _get_user_sessions(self, user_id):
+        return self.conn.execute("""
+            SELECT phone_number, session_file, last_used
+            FROM telegram_sessions
+            WHERE user_id = ? AND is_active = 1
+        """, (user_id,)).fetchall()
+
+    def _get_active_sessions(self):
+        return self.conn.execute("""
+            SELECT user_id, phone_number, session_file
+            FROM telegram_sessions
+            WHERE is_active = 1
+        """).fetchall()
+
+    def _touch_sessions(self, touches):
+        cursor = self.conn.executemany("""
+            UPDATE telegram_sessions
+            SET last_used = ?
+            WHERE user_id = ? AND phone_number = ?
+        """, [(last_used.isoformat(sep=' '), user_id, phone) for user_id, phone, last_used in touches])
+        self.conn.commit()
+        return cursor.rowcount
+
+    def _deactivate_session(self, user_id, phone_number):
+        self._write("""
+            UPDATE telegram_sessions
+            SET is_active = 0
+            WHERE user_id = ? AND phone_number = ?
+        """, (user_id, phone_number))
+
+    def _cleanup_expired(self, days):
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(sep=' ')
+        return self._write("""
+            UPDATE telegram_sessions
+            SET is_active = 0
+            WHERE last_used < ? AND is_active = 1
+        """, (cutoff,))
+
+    def close(self):
+        super().close()
+        self.conn.close()
+
+def create_session_database(database_url):
+    """PostgreSQL pool for a postgres URL, SQLite stand-in otherwise
+
+    DATABASE_URL=sqlite:///path/to/file.db selects the stand-in explicitly;
+    without DATABASE_URL the stand-in uses SESSION_SQLITE_PATH.
+    """
+    if database_url and database_url.startswith("sqlite:"):
+        path = database_url.split("sqlite:///", 1)[-1] if "sqlite:///" in database_url else SESSION_SQLITE_FILE
+        return SQLiteSessionDatabase(path)
+    if not database_url:
+        logger.warning(f"DATABASE_URL not set, using local SQLite session database {SESSION_SQLITE_FILE}")
+        return SQLiteSessionDatabase(SESSION_SQLITE_FILE)
+    return PostgresSessionDatabase(database_url)
@@ -3,41 +3,79 @@ import os
 import asyncio
 from telethon import TelegramClient
 from bot.database import load_data, save_data
-import psycopg2
+from bot.session_db import create_session_database
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Seconds between batched last_used writes
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "60"))
+
+class ActivityTracker:
+    """Records session touches in memory and writes them as one batched UPDATE"""
+    
+    def __init__(self, manager, flush_interval=ACTIVITY_FLUSH_INTERVAL):
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.pending = {}  # (user_id, phone_number) -> last touch
+        self.touches = 0
+        self.flushes = 0
+        self._task = None
+    
+    def touch(self, user_id, phone_number):
+        """Record activity (latest touch wins) and make sure the flush loop runs"""
+        self.pending[(user_id, phone_number)] = datetime.now()
+        self.touches += 1
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+            except RuntimeError:
+                pass  # No loop yet: flushed by the next touch from inside the loop
+    
+    async def _flush_loop(self):
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def flush(self):
+        """Write every pending touch in one statement"""
+        if not self.pending or self.manager.db is None:
+            return
+        batch, self.pending = self.pending, {}
+        try:
+            await self.manager.db.touch_sessions(
+                [(user_id, phone, last_used) for (user_id, phone), last_used in batch.items()]
+            )
+            self.flushes += 1
+        except Exception as e:
+            # Keep the touches for the next flush (newer touches win)
+            for key, last_used in batch.items():
+                self.pending.setdefault(key, last_used)
+            logger.error(f"Error updating session activity: {e}")
+
 class SessionManager:
     """Manages persistent Telegram sessions"""
     
     def __init__(self):
         self.sessions = {}  # In-memory active sessions
-        self.db_connection = None
-        self._init_database()
+        self._db = None
+        self._db_opened = False
+        self.last_restore_report = None
+        self.activity = ActivityTracker(self)
+    
+    @property
+    def db(self):
+        """Session database, opened on first use (importing this module creates no file)"""
+        if not self._db_opened:
+            self._db_opened = True
+            self._init_database()
+        return self._db
     
     def _init_database(self):
-        """Initialize database connection and tables"""
+        """Initialize database connection pool and tables"""
         try:
-            self.db_connection = psycopg2.connect(os.getenv("DATABASE_URL"))
-            cursor = self.db_connection.cursor()
-            
-            # Create sessions table if not exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS telegram_sessions (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    phone_number VARCHAR(20) NOT NULL,
-                    session_file TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, phone_number)
-                )
-            """)
-            
-            self.db_connection.commit()
-            cursor.close()
+            self._db = create_session_database(os.getenv("DATABASE_URL"))
+            self._db.init_schema()
             logger.info("Session database initialized successfully")
             
         except Exception as e:
@@ -46,21 +84,8 @@ class SessionManager:
     async def store_session(self, user_id, phone_number, session_name):
         """Store session information in database"""
         try:
-            cursor = self.db_connection.cursor()
-            
             # Insert or update session
-            cursor.execute("""
-                INSERT INTO telegram_sessions (user_id, phone_number, session_file, is_active, last_used)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (user_id, phone_number)
-                DO UPDATE SET 
-                    session_file = EXCLUDED.session_file,
-                    is_active = EXCLUDED.is_active,
-                    last_used = EXCLUDED.last_used
-            """, (user_id, phone_number, session_name, True, datetime.now()))
-            
-            self.db_connection.commit()
-            cursor.close()
+            await self.db.upsert_session(user_id, phone_number, session_name, datetime.now())
             logger.info(f"Session stored for user {user_id}, phone {phone_number}")
             
         except Exception as e:
@@ -69,15 +94,7 @@ class SessionManager:
     async def get_user_sessions(self, user_id):
         """Get all active sessions for a user"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                SELECT phone_number, session_file, last_used 
-                FROM telegram_sessions 
-                WHERE user_id = %s AND is_active = TRUE
-            """, (user_id,))
-            
-            sessions = cursor.fetchall()
-            cursor.close()
+            sessions = await self.db.get_user_sessions(user_id)
             
             return [{'phone': row[0], 'session_file': row[1], 'last_used': row[2]} for row in sessions]
             
@@ -85,23 +102,21 @@ class SessionManager:
             logger.error(f"Error getting user sessions: {e}")
             return []
     
-    async def restore_all_sessions(self):
-        """Restore all active sessions on bot startup"""
+    async def restore_all_sessions(self, owns=None):
+        """Restore all active sessions on bot startup (only users for which owns(user_id) is true, if given)"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                SELECT user_id, phone_number, session_file 
-                FROM telegram_sessions 
-                WHERE is_active = TRUE
-            """)
-            
-            sessions = cursor.fetchall()
-            cursor.close()
-            
-            for user_id, phone_number, session_file in sessions:
-                await self._restore_session(user_id, phone_number, session_file)
+            sessions = await self.db.get_active_sessions()
+            if owns is not None:
+                sessions = [session for session in sessions if owns(session[0])]
+            
+            # Restore accounts concurrently (bounded, with per-account timeout and retry)
+            from bot.parallel_restore import restore_concurrently
+            self.last_restore_report = await restore_concurrently(
+                "Restauration des sessions", sessions, self._restore_session,
+                key=lambda session: f"{session[0]}:{session[1]}"
+            )
                 
-            logger.info(f"Restored {len(sessions)} active sessions")
+            logger.info(f"Restored {self.last_restore_report['succeeded']}/{len(sessions)} active sessions")
             
         except Exception as e:
             logger.error(f"Error restoring sessions: {e}")
@@ -123,22 +138,32 @@ class SessionManager:
             )
             
             # Try to connect
-            await client.connect()
+            try:
+                await client.connect()
+                authorized = await client.is_user_authorized()
+            except BaseException:
+                # Timeout or network error: don't leave a half-open client behind
+                await client.disconnect()
+                raise
             
-            if await client.is_user_authorized():
+            if authorized:
                 # Store in active sessions
-                from bot.connection import active_connections
-                active_connections[user_id] = {
-                    'client': client,
-                    'phone': phone_number,
-                    'connected': True,
-                    'session_name': session_file,
-                    'restored': True
-                }
+                from bot.connection import connection_registry
+                connection_registry.set(
+                    user_id, phone_number,
+                    client=client,
+                    status='connected',
+                    session_name=session_file,
+                    restored=True
+                )
                 
                 # Update last used time
                 await self.update_session_activity(user_id, phone_number)
                 
+                # Preload recent chat names in the background
+                from bot.entity_cache import prewarm_entity_cache
+                prewarm_entity_cache(client)
+                
                 logger.info(f"Session restored for user {user_id}, phone {phone_number}")
                 return True
             else:
@@ -149,46 +174,30 @@ class SessionManager:
                 return False
                 
         except Exception as e:
+            # Connection / network errors are transient: raised so restore_concurrently
+            # retries them, the session is only deactivated when it is gone or revoked
             logger.error(f"Error restoring session for user {user_id}: {e}")
-            await self.deactivate_session(user_id, phone_number)
-            return False
+            raise
     
     async def update_session_activity(self, user_id, phone_number):
-        """Update last used timestamp for a session"""
-        try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET last_used = %s 
-                WHERE user_id = %s AND phone_number = %s
-            """, (datetime.now(), user_id, phone_number))
-            
-            self.db_connection.commit()
-            cursor.close()
-            
-        except Exception as e:
-            logger.error(f"Error updating session activity: {e}")
+        """Update last used timestamp for a session (coalesced, written in batches)"""
+        self.activity.touch(user_id, phone_number)
     
     async def deactivate_session(self, user_id, phone_number):
         """Deactivate a session in database"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET is_active = FALSE 
-                WHERE user_id = %s AND phone_number = %s
-            """, (user_id, phone_number))
-            
-            self.db_connection.commit()
-            cursor.close()
+            await self.db.deactivate_session(user_id, phone_number)
             
             # Remove from active connections if present
-            from bot.connection import active_connections
-            if user_id in active_connections:
-                client = active_connections[user_id].get('client')
-                if client:
-                    await client.disconnect()
-                del active_connections[user_id]
+            from bot.connection import connection_registry
+            entry = connection_registry.remove(user_id, phone_number)
+            if entry and entry.get('client'):
+                await entry['client'].disconnect()
+            
+            # With sharding, the client runs in the worker owning the user
+            from bot.sharding import shard_coordinator
+            if shard_coordinator.active:
+                await shard_coordinator.call(user_id, "detach", phone_number=phone_number)
             
             logger.info(f"Session deactivated for user {user_id}, phone {phone_number}")
             
@@ -198,17 +207,7 @@ class SessionManager:
     async def cleanup_expired_sessions(self):
         """Clean up expired sessions (older than 7 days)"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET is_active = FALSE 
-                WHERE last_used < NOW() - INTERVAL '7 days' 
-                AND is_active = TRUE
-            """)
-            
-            affected_rows = cursor.rowcount
-            self.db_connection.commit()
-            cursor.close()
+            affected_rows = await self.db.cleanup_expired(7)
             
             if affected_rows > 0:
                 logger.info(f"Cleaned up {affected_rows} expired sessions")
@@ -216,10 +215,14 @@ class SessionManager:
         except Exception as e:
             logger.error(f"Error cleaning up expired sessions: {e}")
     
+    async def flush_activity(self):
+        """Write pending last_used updates now"""
+        await self.activity.flush()
+    
     def close(self):
-        """Close database connection"""
-        if self.db_connection:
-            self.db_connection.close()
+        """Close database connection pool"""
+        if self._db:
+            self._db.close()
 
 # Global session manager instance
 session_manager = SessionManager()
\ No newline at end of file
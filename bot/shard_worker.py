@@ -0,0 +1,192 @@
+"""
+Worker de redirection (un processus par shard)
+Restaure les sessions et redirections des comptes de son shard, les supervise,
+puis exécute les opérations envoyées par le bot sur le socket local
+
+    python -m bot.shard_worker INDEX NOMBRE SOCKET
+"""
+
+import logging
+import os
+import sys
+import json
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+def _serialize_buttons(buttons):
+    """Inline buttons as [[(text, data)]] for the bot process to rebuild"""
+    if not buttons:
+        return None
+    return [[(button.text, button.data.decode()) for button in row] for row in buttons]
+
+async def op_attach(user_id, phone_number, session_file):
+    """A number was just connected in the bot process: take its client and redirections over"""
+    from bot.session_manager import session_manager
+    from bot.simple_restorer import simple_restorer
+    from bot.connection import phone_key
+    from bot.database import storage
+    storage.reload()
+    if not await session_manager._restore_session(user_id, phone_number, session_file):
+        return False
+    # Redirections without a phone belong to the user's latest connection
+    user_redirections = storage.get_redirections(str(user_id))
+    connections = {str(user_id): storage.get_connections(str(user_id))}
+    groups = simple_restorer._group_by_phone(user_id, user_redirections, connections)
+    for phone, redirections in groups.items():
+        if phone_key(phone) == phone_key(phone_number):
+            await simple_restorer._restore_user_redirections(user_id, phone_key(phone_number), redirections)
+    return True
+
+async def op_detach(user_id, phone_number):
+    from bot.connection import connection_registry
+    entry = connection_registry.remove(user_id, phone_number)
+    if entry and entry.get('client'):
+        await entry['client'].disconnect()
+    return entry is not None
+
+async def op_add_redirection(user_id, name, source_id, destination_id, batch_forward=False, phone_number=None):
+    from bot.message_handler import message_redirector
+    return await message_redirector.add_redirection_handler(user_id, name, source_id, destination_id,
+                                                            batch_forward=batch_forward, phone_number=phone_number)
+
+async def op_remove_redirection(user_id, name):
+    from bot.message_handler import message_redirector
+    return await message_redirector.remove_redirection_handler(user_id, name)
+
+async def op_set_batch_forward(user_id, name, enabled):
+    from bot.message_handler import message_redirector
+    return message_redirector.set_batch_forward(user_id, name, enabled)
+
+async def op_invalidate(user_id):
+    """Filters or transformations of a user changed in the bot process"""
+    from bot.database import storage
+    from bot.filters import filter_engine
+    from bot.transform_pipeline import transformation_engine
+    storage.reload()
+    filter_engine.invalidate(user_id)
+    transformation_engine.invalidate(user_id)
+    return True
+
+async def op_chats_page(user_id, phone_number, chat_type, page):
+    from bot.chats import chats_page
+    result = await chats_page(user_id, phone_number, chat_type, page)
+    if result is None:
+        return None
+    message, buttons = result
+    return {'message': message, 'buttons': _serialize_buttons(buttons)}
+
+async def op_chat_name(user_id, phone_number, chat_id):
+    from bot.connection import connection_registry
+    from bot.entity_cache import get_entity_cache, entity_display_name
+    client = connection_registry.get_client(user_id, phone_number)
+    if not client or not client.is_connected():
+        return None
+    entity = await get_entity_cache(client).get_entity(int(chat_id))
+    return entity_display_name(entity, chat_id)
+
+async def op_stats():
+    from bot.connection import connection_registry
+    from bot.send_queue import get_send_stats
+    from bot.dedup import dedup_cache
+    from bot.supervisor import client_supervisor
+    return {
+        'pid': os.getpid(),
+        'accounts': len(connection_registry),
+        'send': get_send_stats(),
+        'dedup': dedup_cache.stats(),
+        'supervisor': client_supervisor.stats(),
+    }
+
+async def op_metrics():
+    from bot.metrics import forwarding_metrics
+    return forwarding_metrics.snapshot()
+
+async def op_log_config(**changes):
+    """Apply the admin's /logs settings (if any) and return this worker's counters"""
+    from bot.log_pipeline import hot_path_filter
+    if changes:
+        hot_path_filter.configure(**changes)
+    return hot_path_filter.stats()
+
+OPERATIONS = {
+    'attach': op_attach,
+    'detach': op_detach,
+    'add_redirection': op_add_redirection,
+    'remove_redirection': op_remove_redirection,
+    'set_batch_forward': op_set_batch_forward,
+    'invalidate': op_invalidate,
+    'chats_page': op_chats_page,
+    'chat_name': op_chat_name,
+    'stats': op_stats,
+    'metrics': op_metrics,
+    'log_config': op_log_config,
+}
+
+async def handle_request(request, writer, lock):
+    from bot.sharding import send_line
+    reply = {'id': request.get('id')}
+    try:
+        operation = OPERATIONS.get(request.get('op'))
+        if operation is None:
+            raise ValueError(f"unknown operation {request.get('op')}")
+        reply['result'] = await operation(**request.get('args', {}))
+    except Exception as e:
+        logger.error(f"Error in worker operation {request.get('op')}: {e}")
+        reply['error'] = str(e) or type(e).__name__
+    await send_line(writer, lock, reply)
+
+async def run_worker(index, shards, socket_path):
+    from bot.sharding import shard_of, send_line
+    from bot.session_manager import session_manager
+    from bot.simple_restorer import simple_restorer
+    from bot.supervisor import client_supervisor
+
+    def owns(user_id):
+        return shard_of(user_id, shards) == index
+
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    lock = asyncio.Lock()
+    await send_line(writer, lock, {'shard': index, 'pid': os.getpid()})
+
+    async def restore():
+        # Same startup as the bot process, for this shard's accounts only
+        await session_manager.restore_all_sessions(owns)
+        await simple_restorer.restore_all_redirections(owns)
+        client_supervisor.start()
+        logger.info(f"Worker {index}/{shards} ready")
+
+    def restored(task):
+        if task.cancelled() or task.exception() is None:
+            return
+        # Without its accounts the worker is useless: exit so the bot process restarts it
+        logger.error(f"Worker {index} failed to restore its accounts: {task.exception()}", exc_info=task.exception())
+        writer.close()
+
+    # Operations are served while the accounts are being restored
+    restore_task = asyncio.get_running_loop().create_task(restore())
+    restore_task.add_done_callback(restored)
+    tasks = {restore_task}
+    while True:
+        line = await reader.readline()
+        if not line:
+            # The bot process went away: nothing left to serve
+            break
+        task = asyncio.get_running_loop().create_task(handle_request(json.loads(line), writer, lock))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await client_supervisor.stop()
+    await session_manager.flush_activity()
+    failed = restore_task.done() and not restore_task.cancelled() and restore_task.exception() is not None
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    index, shards, socket_path = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+    from bot.log_pipeline import setup_logging, shard_log_file
+    setup_logging(
+        shard_log_file(index),
+        text_format=f'%(asctime)s - shard-{index} - %(name)s - %(levelname)s - %(message)s',
+        fields={'shard': index}
+    )
+    sys.exit(asyncio.run(run_worker(index, shards, socket_path)))
@@ -0,0 +1,185 @@
+"""
+Répartition des comptes sur plusieurs processus de redirection
+Avec SHARD_WORKERS > 0, le processus du bot lance N workers (python -m
+bot.shard_worker) ; chaque compte appartient au worker désigné par un hash de
+son user_id, qui fait tourner ses clients et son dispatcher. Le bot leur parle
+par un socket Unix local (une ligne JSON par requête / réponse)
+"""
+
+import logging
+import os
+import sys
+import json
+import zlib
+import asyncio
+import itertools
+
+logger = logging.getLogger(__name__)
+
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))  # 0: every account in the bot process
+SHARD_SOCKET = os.getenv("SHARD_SOCKET", "telefeed_shards.sock")
+SHARD_CALL_TIMEOUT = float(os.getenv("SHARD_CALL_TIMEOUT", "60"))  # seconds, /chats may walk many dialogs
+SHARD_RESTART_MAX = 60  # longest delay (s) before restarting a crashed worker
+FLUSH_BEFORE = {"attach", "invalidate"}  # operations after which the worker re-reads user data
+
+def shard_of(user_id, shards):
+    """Worker index owning a user's accounts (stable across restarts and processes)"""
+    return zlib.crc32(str(int(user_id)).encode()) % shards
+
+class ShardError(RuntimeError):
+    """A worker is unavailable or its operation failed"""
+
+async def send_line(writer, lock, payload):
+    """Write one JSON message (writes from concurrent tasks are serialised by lock)"""
+    async with lock:
+        writer.write(json.dumps(payload).encode() + b"\n")
+        await writer.drain()
+
+class ShardCoordinator:
+    """Starts the workers, restarts them when they die and routes operations to them"""
+
+    def __init__(self, workers=SHARD_WORKERS, socket_path=SHARD_SOCKET, timeout=SHARD_CALL_TIMEOUT):
+        self.workers = workers
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.shards = {}  # index -> {'process', 'writer', 'lock', 'ready', 'pending', 'restarts', 'task'}
+        self.active = False
+        self._ids = itertools.count(1)
+        self._server = None
+        self._stopping = False
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def shard_of(self, user_id):
+        return shard_of(user_id, self.workers)
+
+    async def start(self):
+        """Listen on the socket and launch every worker"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._on_connection, path=self.socket_path)
+        for index in range(self.workers):
+            self.shards[index] = {
+                'process': None,
+                'writer': None,
+                'lock': asyncio.Lock(),
+                'ready': asyncio.Event(),
+                'pending': {},  # request id -> future
+                'restarts': 0,
+            }
+            self.shards[index]['task'] = asyncio.get_running_loop().create_task(self._keep_running(index))
+        self.active = True
+        logger.info(f"🧩 {self.workers} workers de redirection lancés (socket {self.socket_path})")
+
+    async def _keep_running(self, index):
+        """Run worker `index`, restarting it with a growing delay if it exits"""
+        shard = self.shards[index]
+        while not self._stopping:
+            shard['process'] = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "bot.shard_worker", str(index), str(self.workers), self.socket_path
+            )
+            code = await shard['process'].wait()
+            if self._stopping:
+                return
+            shard['restarts'] += 1
+            delay = min(SHARD_RESTART_MAX, 2 ** shard['restarts'])
+            logger.error(f"Worker {index} exited with code {code}, restart {shard['restarts']} in {delay}s")
+            await asyncio.sleep(delay)
+
+    async def _on_connection(self, reader, writer):
+        """A worker connected: register it, then resolve the replies it sends"""
+        shard = None
+        try:
+            hello = json.loads(await reader.readline())
+            shard = self.shards[hello['shard']]
+            shard['writer'] = writer
+            shard['ready'].set()
+            logger.info(f"Worker {hello['shard']} connected (pid {hello.get('pid')})")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = shard['pending'].pop(reply.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in reply:
+                    future.set_exception(ShardError(reply['error']))
+                else:
+                    future.set_result(reply.get('result'))
+        except Exception as e:
+            logger.error(f"Error on worker connection: {e}")
+        finally:
+            if shard is not None and shard['writer'] is writer:
+                shard['writer'] = None
+                shard['ready'].clear()
+                for future in shard['pending'].values():
+                    if not future.done():
+                        future.set_exception(ShardError("worker disconnected"))
+                shard['pending'].clear()
+            writer.close()
+
+    async def _call(self, index, op, args, timeout=None):
+        timeout = timeout or self.timeout
+        shard = self.shards[index]
+        try:
+            await asyncio.wait_for(shard['ready'].wait(), timeout)
+        except asyncio.TimeoutError:
+            raise ShardError(f"worker {index} unavailable")
+        if op in FLUSH_BEFORE:
+            # The worker reads the user's data from storage: make our pending writes visible first
+            from bot.database import storage
+            await storage.flush_async()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        shard['pending'][request_id] = future
+        try:
+            await send_line(shard['writer'], shard['lock'], {'id': request_id, 'op': op, 'args': args})
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ShardError(f"worker {index}: {op} timed out")
+        finally:
+            shard['pending'].pop(request_id, None)
+
+    async def call(self, user_id, op, timeout=None, **args):
+        """Run `op` (which receives user_id too) on the worker owning user_id and return its result"""
+        return await self._call(self.shard_of(user_id), op, dict(args, user_id=int(user_id)), timeout)
+
+    def notify(self, user_id, op, **args):
+        """Fire-and-forget call (for synchronous callers); failures are logged"""
+        def done(task):
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Worker {op} for user {user_id} failed: {task.exception()}")
+        asyncio.ensure_future(self.call(user_id, op, **args)).add_done_callback(done)
+
+    async def broadcast(self, op, timeout=None, **args):
+        """Run `op` on every worker; {index: result or exception}"""
+        indexes = list(self.shards)
+        results = await asyncio.gather(*(self._call(index, op, args, timeout) for index in indexes),
+                                       return_exceptions=True)
+        return dict(zip(indexes, results))
+
+    async def stop(self):
+        """Terminate the workers and close the socket"""
+        self._stopping = True
+        self.active = False
+        for shard in self.shards.values():
+            process = shard['process']
+            if process is not None and process.returncode is None:
+                process.terminate()
+        for shard in self.shards.values():
+            if shard['process'] is not None:
+                try:
+                    await asyncio.wait_for(shard['process'].wait(), 10)
+                except asyncio.TimeoutError:
+                    shard['process'].kill()
+            shard['task'].cancel()
+        if self._server is not None:
+            self._server.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+# Active in the bot process once started with SHARD_WORKERS > 0; never in a worker
+shard_coordinator = ShardCoordinator()
@@ -6,9 +6,12 @@ Fonctionne sans dépendance à PostgreSQL
 import logging
 import asyncio
 import os
-import json
 from telethon import TelegramClient
 from config.settings import API_ID, API_HASH
+from bot.dispatcher import get_dispatcher
+from bot.forwarding import forward_message
+from bot.message_mapping import message_mapping_store
+from bot.entity_cache import get_entity_cache, prewarm_entity_cache
 
 logger = logging.getLogger(__name__)
 
@@ -18,20 +21,17 @@ class SimpleRedirectionRestorer:
     def __init__(self):
         self.active_clients = {}
         self.restored_redirections = 0
-        self.message_mapping = {}  # Maps original message ID to redirected message ID
+        self.last_restore_report = None
+        self.message_mapping = message_mapping_store  # Maps original message ID to redirected message ID
         
-    async def restore_all_redirections(self):
-        """Restaure toutes les redirections depuis user_data.json"""
+    async def restore_all_redirections(self, owns=None):
+        """Restaure toutes les redirections depuis user_data.json (seulement les utilisateurs où owns(user_id) est vrai, si donné)"""
         try:
             logger.info("🔄 Démarrage de la restauration simple des redirections")
             
-            # Charger user_data.json
-            if not os.path.exists('user_data.json'):
-                logger.info("Aucun fichier user_data.json trouvé")
-                return
-                
-            with open('user_data.json', 'r') as f:
-                data = json.load(f)
+            # Charger les données (store en mémoire de user_data.json)
+            from bot.database import load_data
+            data = load_data()
             
             redirections = data.get('redirections', {})
             connections = data.get('connections', {})
@@ -40,17 +40,42 @@ class SimpleRedirectionRestorer:
                 logger.info("Aucune redirection à restaurer")
                 return
             
-            # Restaurer pour chaque utilisateur
+            # Restaurer les utilisateurs en parallèle (concurrence bornée, timeout et reprise par compte)
+            from bot.parallel_restore import restore_concurrently
+            # Un élément par compte (utilisateur, numéro) : chaque numéro a son propre client
+            accounts = []
             for user_id, user_redirections in redirections.items():
-                await self._restore_user_redirections(int(user_id), user_redirections, connections)
+                if owns is not None and not owns(int(user_id)):
+                    continue
+                for phone_number, phone_redirections in self._group_by_phone(int(user_id), user_redirections, connections).items():
+                    accounts.append((int(user_id), phone_number, phone_redirections))
+            
+            self.last_restore_report = await restore_concurrently(
+                "Restauration des redirections",
+                accounts,
+                self._restore_user_redirections,
+                key=lambda account: f"{account[0]}:{account[1]}"
+            )
             
             logger.info(f"✅ Restauration terminée: {self.restored_redirections} redirections actives")
             
         except Exception as e:
             logger.error(f"Erreur lors de la restauration: {e}")
     
-    async def _restore_user_redirections(self, user_id, user_redirections, connections):
-        """Restaure les redirections d'un utilisateur"""
+    def _group_by_phone(self, user_id, user_redirections, connections):
+        """{numéro: {nom: redirection}} ; sans numéro, la connexion la plus récente de l'utilisateur"""
+        groups = {}
+        default_phone = None
+        for name, redir_data in user_redirections.items():
+            phone_number = (redir_data.get('phone') or '').lstrip('+')
+            if not phone_number:
+                default_phone = default_phone or self._get_user_phone(user_id, connections)
+                phone_number = default_phone
+            groups.setdefault(phone_number, {})[name] = redir_data
+        return groups
+    
+    async def _restore_user_redirections(self, user_id, phone_number, user_redirections):
+        """Restaure les redirections d'un compte (retourne False en cas d'échec)"""
         try:
             # Filtrer les redirections actives
             active_redirections = {
@@ -59,37 +84,41 @@ class SimpleRedirectionRestorer:
             }
             
             if not active_redirections:
-                return
+                return True
                 
             logger.info(f"Restauration de {len(active_redirections)} redirections pour utilisateur {user_id}")
             
-            # Obtenir le numéro de téléphone depuis les connexions
-            phone_number = self._get_user_phone(user_id, connections)
             if not phone_number:
                 logger.warning(f"Aucun numéro trouvé pour utilisateur {user_id}")
-                return
+                return False
             
             # Créer le client Telegram
             client = await self._create_telegram_client(user_id, phone_number)
             if not client:
                 logger.warning(f"Impossible de créer le client pour {user_id}")
-                return
+                return False
             
             # Configurer les redirections
-            await self._setup_message_handlers(client, user_id, active_redirections)
+            await self._setup_message_handlers(client, user_id, phone_number, active_redirections)
+            
+            # Précharger les noms des chats récents en arrière-plan
+            prewarm_entity_cache(client)
             
             # Stocker le client actif
-            self.active_clients[user_id] = {
+            self.active_clients[(user_id, phone_number)] = {
                 'client': client,
                 'phone': phone_number,
                 'redirections': len(active_redirections)
             }
             
             self.restored_redirections += len(active_redirections)
-            logger.info(f"✅ {len(active_redirections)} redirections configurées pour {user_id}")
+            logger.info(f"✅ {len(active_redirections)} redirections configurées pour {user_id} ({phone_number})")
+            return True
             
         except Exception as e:
+            # Erreurs réseau : relancées pour que restore_concurrently réessaie
             logger.error(f"Erreur restauration utilisateur {user_id}: {e}")
+            raise
     
     def _get_user_phone(self, user_id, connections):
         """Obtient le numéro de téléphone d'un utilisateur"""
@@ -109,12 +138,11 @@ class SimpleRedirectionRestorer:
         """Crée un client Telegram"""
         try:
             # Vérifier si un client existe déjà
-            from bot.connection import active_connections
-            if user_id in active_connections:
-                existing_client = active_connections[user_id].get('client')
-                if existing_client and existing_client.is_connected():
-                    logger.info(f"Utilisation du client existant pour {user_id}")
-                    return existing_client
+            from bot.connection import connection_registry
+            existing_client = connection_registry.get_client(user_id, phone_number)
+            if existing_client and existing_client.is_connected():
+                logger.info(f"Utilisation du client existant pour {user_id}:{phone_number}")
+                return existing_client
             
             # Chercher les fichiers de session possibles
             session_files = [
@@ -135,18 +163,15 @@ class SimpleRedirectionRestorer:
                 logger.warning(f"Aucune session trouvée pour {user_id}:{phone_number}")
                 return None
             
-            # Attendre un moment pour éviter les conflits de base de données
-            await asyncio.sleep(1)
-            
             # Créer le client
             client = TelegramClient(session_file, API_ID, API_HASH)
             
-            # Démarrer la session avec timeout
+            # Démarrer la session (le timeout par compte est géré par restore_concurrently)
             try:
-                await asyncio.wait_for(client.start(phone=f"+{phone_number}"), timeout=30)
-            except asyncio.TimeoutError:
-                logger.error(f"Timeout lors de la connexion pour {user_id}")
-                return None
+                await client.start(phone=f"+{phone_number}")
+            except BaseException:
+                await client.disconnect()
+                raise
             
             if client.is_connected():
                 logger.info(f"Client connecté pour {user_id} avec session {session_file}")
@@ -157,137 +182,55 @@ class SimpleRedirectionRestorer:
                 
         except Exception as e:
             logger.error(f"Erreur création client {user_id}:{phone_number}: {e}")
-            return None
+            raise
     
-    async def _setup_message_handlers(self, client, user_id, redirections):
+    async def _setup_message_handlers(self, client, user_id, phone_number, redirections):
         """Configure les gestionnaires de messages"""
         try:
-            from telethon import events
-            
             # Vérifier que le client est connecté
             if not client.is_connected():
                 logger.error(f"Client non connecté pour utilisateur {user_id}")
                 return
             
-            # Stocker le client dans active_connections pour éviter les conflits
-            from bot.connection import active_connections
-            active_connections[user_id] = {
-                'client': client,
-                'phone': self._get_user_phone_from_redirections(redirections),
-                'active': True
-            }
+            # Enregistrer le client du compte (sans écraser les autres numéros de l'utilisateur)
+            from bot.connection import connection_registry
+            entry = connection_registry.set(user_id, phone_number, client=client, status='connected', active=True)
             
+            dispatcher = get_dispatcher(client)
             for name, redir_data in redirections.items():
                 source_id = int(redir_data['source_id'])
                 destination_id = int(redir_data['destination_id'])
                 
-                # Créer le gestionnaire de messages
-                @client.on(events.NewMessage(chats=source_id))
-                async def message_handler(event, dest_id=destination_id, redirect_name=name, u_id=user_id):
-                    try:
-                        await self._forward_message(event, dest_id, redirect_name, u_id)
-                    except Exception as e:
-                        logger.error(f"Erreur redirection {redirect_name}: {e}")
-                
-                # Créer le gestionnaire d'édition
-                @client.on(events.MessageEdited(chats=source_id))
-                async def edit_handler(event, dest_id=destination_id, redirect_name=name, u_id=user_id):
-                    try:
-                        await self._forward_message(event, dest_id, redirect_name, u_id, is_edit=True)
-                    except Exception as e:
-                        logger.error(f"Erreur édition {redirect_name}: {e}")
+                # Une règle dans le dispatcher partagé du client (un seul handler par client)
+                dispatcher.add_rule(name, source_id, destination_id, self._dispatch_rule, user_id=user_id,
+                                    batch_forward=redir_data.get('batch_forward', False))
+                entry['handlers'].add(name)
                 
                 logger.info(f"Gestionnaire configuré: {name} ({source_id} → {destination_id})")
                 
         except Exception as e:
             logger.error(f"Erreur configuration gestionnaires: {e}")
     
-    def _get_user_phone_from_redirections(self, redirections):
-        """Obtient le numéro de téléphone depuis les redirections"""
-        for redir_data in redirections.values():
-            if redir_data.get('phone'):
-                return redir_data['phone']
-        return None
+    async def _dispatch_rule(self, event, rule, is_edit):
+        """Callback du dispatcher pour une redirection"""
+        try:
+            await self._forward_message(event, rule['destination_id'], rule['name'], rule['user_id'], is_edit=is_edit,
+                                        batch_forward=rule.get('batch_forward', False))
+        except Exception as e:
+            action = "édition" if is_edit else "redirection"
+            logger.error(f"Erreur {action} {rule['name']}: {e}")
     
-    async def _forward_message(self, event, destination_id, redirect_name, user_id, is_edit=False):
+    async def _forward_message(self, event, destination_id, redirect_name, user_id, is_edit=False, batch_forward=False):
         """Transfère un message"""
         try:
-            message = event.message
-            original_msg_id = message.id
-            mapping_key = f"{event.chat_id}_{original_msg_id}_{destination_id}"
-            
-            if is_edit:
-                # Vérifier si nous avons une correspondance pour ce message
-                if mapping_key in self.message_mapping:
-                    redirected_msg_id = self.message_mapping[mapping_key]
-                    try:
-                        # Modifier le message existant
-                        if message.text:
-                            await event.client.edit_message(int(destination_id), redirected_msg_id, message.text)
-                            logger.info(f"Message modifié: {redirect_name}")
-                            return
-                        elif message.media:
-                            # Pour les médias modifiés, supprimer et renvoyer
-                            try:
-                                await event.client.delete_messages(int(destination_id), redirected_msg_id)
-                            except:
-                                pass
-                            # Continuer pour envoyer le nouveau message
-                        else:
-                            # Message supprimé, supprimer aussi le message redirigé
-                            try:
-                                await event.client.delete_messages(int(destination_id), redirected_msg_id)
-                                del self.message_mapping[mapping_key]
-                                logger.info(f"Message supprimé: {redirect_name}")
-                                return
-                            except:
-                                return
-                    except Exception as edit_error:
-                        # Si l'édition échoue, continuer pour envoyer un nouveau message
-                        if "Content of the message was not modified" in str(edit_error):
-                            logger.info(f"Contenu inchangé pour {redirect_name}")
-                            return
-                        logger.warning(f"Échec édition message {redirected_msg_id}: {edit_error}")
-                else:
-                    # Édition d'un message non mappé, ne rien faire
-                    logger.info(f"Édition d'un message non mappé: {original_msg_id}")
-                    return
-            
-            # Envoyer un nouveau message (première fois ou remplacement)
-            sent_message = None
-            if message.text:
-                sent_message = await event.client.send_message(int(destination_id), message.text)
-            elif message.media:
-                sent_message = await event.client.forward_messages(int(destination_id), message)
-            else:
-                return
-            
-            # Stocker la correspondance pour les futures éditions
-            if sent_message and not is_edit:
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            elif sent_message and is_edit:
-                # Mettre à jour la correspondance pour les remplacements de médias
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            
-            action = "modifié et redirigé" if is_edit else "transféré"
-            logger.info(f"Message {action}: {redirect_name}")
-            
+            await forward_message(event, destination_id, redirect_name, user_id, self.message_mapping,
+                                  is_edit=is_edit, batch_forward=batch_forward)
         except Exception as e:
             logger.error(f"Erreur transfert message: {e}")
     
     async def _get_channel_name(self, client, chat_id):
         """Obtient le nom d'un canal"""
-        try:
-            entity = await client.get_entity(chat_id)
-            return getattr(entity, 'title', getattr(entity, 'username', str(chat_id)))
-        except:
-            return str(chat_id)
+        return await get_entity_cache(client).get_name(chat_id)
 
 # Instance globale
 simple_restorer = SimpleRedirectionRestorer()
\ No newline at end of file
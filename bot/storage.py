@@ -0,0 +1,541 @@
+"""
+Storage backends for user data
+JSON file (default) or embedded SQLite with indexed tables
+"""
+
+import logging
+import json
+import os
+import asyncio
+import atexit
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Sections stored as one JSON document per user in SQLite
+DOCUMENT_SECTIONS = ("transformations", "whitelists", "blacklists", "chats")
+
+def default_data():
+    """Return an empty data structure"""
+    return {
+        "licenses": {},
+        "connections": {},
+        "redirections": {},
+        "transformations": {},
+        "whitelists": {},
+        "blacklists": {},
+        "chats": {}
+    }
+
+class StorageBackend:
+    """Interface implemented by every storage backend (user ids are strings)"""
+
+    def load_all(self):
+        """Return the full data set in the user_data.json layout"""
+        raise NotImplementedError
+
+    def save_all(self, data):
+        """Replace the full data set"""
+        raise NotImplementedError
+
+    def get_license(self, user_id):
+        raise NotImplementedError
+
+    def set_license(self, user_id, record):
+        raise NotImplementedError
+
+    def get_connections(self, user_id):
+        """Return the user's connections, oldest first"""
+        raise NotImplementedError
+
+    def store_connection(self, user_id, record):
+        """Add a connection, replacing any existing one for the same phone"""
+        raise NotImplementedError
+
+    def get_redirections(self, user_id, phone_number=None):
+        """Return {name: record} for a user, optionally for one phone only"""
+        raise NotImplementedError
+
+    def get_redirections_by_source(self, source_id):
+        """Return [(user_id, record)] for every redirection reading source_id"""
+        raise NotImplementedError
+
+    def set_redirection(self, user_id, name, record):
+        raise NotImplementedError
+
+    def delete_redirection(self, user_id, name):
+        raise NotImplementedError
+
+    def get_document(self, section, user_id):
+        """Return a free-form per-user document (transformations, whitelists...)"""
+        raise NotImplementedError
+
+    def set_document(self, section, user_id, value):
+        raise NotImplementedError
+
+    def reload(self):
+        """Pick up changes written by another process (live backends read them anyway)"""
+        pass
+
+    def flush(self):
+        """Persist pending changes immediately"""
+        pass
+
+    async def flush_async(self):
+        """flush() for async callers, without blocking the event loop"""
+        self.flush()
+
+class JsonStorage(StorageBackend):
+    """In-memory copy of user_data.json with write-behind persistence"""
+
+    def __init__(self, path, flush_delay=1.0):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.data = None
+        self.dirty = False
+        self.flush_count = 0
+        self._flush_task = None
+        self._write_lock = threading.Lock()
+        # One writer thread: async writes land in the order they were snapshotted
+        self._executor = None
+        self._generation = 0  # of the last snapshot
+        self._written = 0  # generation of the file on disk
+
+    def load(self):
+        """Load data from disk once, then serve it from memory"""
+        if self.data is None:
+            self.data = self._read_file()
+        return self.data
+
+    def _read_file(self):
+        """Read and normalize the data file"""
+        data = default_data()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data.update(json.load(f))
+            except Exception as e:
+                logger.error(f"Error loading data: {e}")
+                return default_data()
+        # Ensure all required keys exist
+        for key, value in default_data().items():
+            data.setdefault(key, value)
+        # Pending redirections now live in the conversation state (bot.conversation)
+        data.pop("pending_redirections", None)
+        return data
+
+    def mark_dirty(self):
+        """Record a mutation and schedule a batched flush"""
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, shutdown): write synchronously
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        """Wait for more mutations, then write them all at once off the event loop"""
+        await asyncio.sleep(self.flush_delay)
+        while self.dirty:
+            await self._write_async(self._snapshot())
+            if self.dirty:
+                # Mutated during the write (mark_dirty saw this task running) or the write failed
+                await asyncio.sleep(self.flush_delay)
+
+    async def _write_async(self, payload):
+        """_write(payload) on the storage's single writer thread"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-writer")
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, payload)
+
+    def _snapshot(self):
+        """Serialize current data as (generation, json); must run on the thread that mutates it"""
+        self.dirty = False
+        self._generation += 1
+        return self._generation, json.dumps(self.data, indent=2)
+
+    def _write(self, payload):
+        """Write payload atomically (temp file + rename), unless a newer one is already on disk"""
+        generation, text = payload
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with self._write_lock:
+                if generation <= self._written:
+                    return  # a synchronous flush() got a newer snapshot out first
+                with open(tmp_path, 'w') as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._written = generation
+                self.flush_count += 1
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Error saving data: {e}")
+
+    def flush(self):
+        """Write pending changes to disk immediately"""
+        if self.data is not None and self.dirty:
+            self._write(self._snapshot())
+
+    async def flush_async(self):
+        """flush() with the file write off the event loop (queued behind in-flight writes)"""
+        if self.data is not None and self.dirty:
+            await self._write_async(self._snapshot())
+
+    def reload(self):
+        """Drop the in-memory copy and re-read the file"""
+        self.flush()
+        self.data = None
+        return self.load()
+
+    def load_all(self):
+        return self.load()
+
+    def save_all(self, data):
+        self.data = data
+        self.mark_dirty()
+
+    def get_license(self, user_id):
+        return self.load()["licenses"].get(user_id)
+
+    def set_license(self, user_id, record):
+        self.load()["licenses"][user_id] = record
+        self.mark_dirty()
+
+    def get_connections(self, user_id):
+        return self.load()["connections"].get(user_id, [])
+
+    def store_connection(self, user_id, record):
+        connections = self.load()["connections"]
+        connections[user_id] = [
+            conn for conn in connections.get(user_id, [])
+            if conn["phone"] != record["phone"]
+        ]
+        connections[user_id].append(record)
+        self.mark_dirty()
+
+    def get_redirections(self, user_id, phone_number=None):
+        user_redirections = self.load()["redirections"].get(user_id, {})
+        if phone_number is None:
+            return user_redirections
+        return {
+            name: redir for name, redir in user_redirections.items()
+            if redir.get("phone") == phone_number
+        }
+
+    def get_redirections_by_source(self, source_id):
+        matches = []
+        for user_id, user_redirections in self.load()["redirections"].items():
+            for redir in user_redirections.values():
+                if str(redir.get("source_id")) == str(source_id):
+                    matches.append((user_id, redir))
+        return matches
+
+    def set_redirection(self, user_id, name, record):
+        self.load()["redirections"].setdefault(user_id, {})[name] = record
+        self.mark_dirty()
+
+    def delete_redirection(self, user_id, name):
+        user_redirections = self.load()["redirections"].get(user_id, {})
+        if name in user_redirections:
+            del user_redirections[name]
+            self.mark_dirty()
+
+    def get_document(self, section, user_id):
+        return self.load()[section].get(user_id)
+
+    def set_document(self, section, user_id, value):
+        documents = self.load()[section]
+        if value is None:
+            documents.pop(user_id, None)
+        else:
+            documents[user_id] = value
+        self.mark_dirty()
+
+class SQLiteStorage(StorageBackend):
+    """Embedded SQLite (WAL mode) backend with one row per record"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS licenses (
+            user_id TEXT PRIMARY KEY,
+            license TEXT,
+            validated_at TEXT,
+            active INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE TABLE IF NOT EXISTS connections (
+            user_id TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            connected_at TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            replaced_at TEXT,
+            PRIMARY KEY (user_id, phone)
+        );
+        CREATE TABLE IF NOT EXISTS redirections (
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            phone TEXT,
+            source_id TEXT,
+            destination_id TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            extra TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (user_id, name)
+        );
+        CREATE INDEX IF NOT EXISTS idx_redirections_user_phone ON redirections (user_id, phone);
+        CREATE INDEX IF NOT EXISTS idx_redirections_source ON redirections (source_id);
+        -- Pending redirections now live in the conversation state (bot.conversation)
+        DROP TABLE IF EXISTS pending_redirections;
+        CREATE TABLE IF NOT EXISTS documents (
+            section TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (section, user_id)
+        );
+    """
+
+    # Redirection fields with their own column; everything else goes to 'extra'
+    REDIRECTION_COLUMNS = ("phone", "source_id", "destination_id", "active")
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            return self.conn.execute(query, params)
+
+    def _fetchall(self, query, params=()):
+        with self._lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def _fetchone(self, query, params=()):
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()
+
+    def is_empty(self):
+        """True if no user data has been stored yet"""
+        for table in ("licenses", "connections", "redirections", "documents"):
+            if self._fetchone(f"SELECT 1 FROM {table} LIMIT 1"):
+                return False
+        return True
+
+    def get_meta(self, key):
+        row = self._fetchone("SELECT value FROM meta WHERE key = ?", (key,))
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _license_record(row):
+        return {
+            "license": row["license"],
+            "validated_at": row["validated_at"],
+            "active": bool(row["active"])
+        }
+
+    @staticmethod
+    def _connection_record(row):
+        return {
+            "phone": row["phone"],
+            "connected_at": row["connected_at"],
+            "active": bool(row["active"]),
+            "replaced_at": row["replaced_at"]
+        }
+
+    @staticmethod
+    def _redirection_record(row):
+        record = json.loads(row["extra"])
+        record.update({
+            "phone": row["phone"],
+            "source_id": row["source_id"],
+            "destination_id": row["destination_id"],
+            "active": bool(row["active"])
+        })
+        return record
+
+    def load_all(self):
+        data = default_data()
+        for row in self._fetchall("SELECT * FROM licenses"):
+            data["licenses"][row["user_id"]] = self._license_record(row)
+        for row in self._fetchall("SELECT * FROM connections ORDER BY rowid"):
+            data["connections"].setdefault(row["user_id"], []).append(self._connection_record(row))
+        for row in self._fetchall("SELECT * FROM redirections ORDER BY rowid"):
+            data["redirections"].setdefault(row["user_id"], {})[row["name"]] = self._redirection_record(row)
+        for row in self._fetchall("SELECT * FROM documents"):
+            data.setdefault(row["section"], {})[row["user_id"]] = json.loads(row["payload"])
+        return data
+
+    def save_all(self, data):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for table in ("licenses", "connections", "redirections", "documents"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self._import(data)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _import(self, data):
+        """Insert a user_data.json document (caller holds the lock and transaction)"""
+        for user_id, record in data.get("licenses", {}).items():
+            self._insert_license(str(user_id), record)
+        for user_id, user_connections in data.get("connections", {}).items():
+            for record in user_connections:
+                self._insert_connection(str(user_id), record)
+        for user_id, user_redirections in data.get("redirections", {}).items():
+            for name, record in user_redirections.items():
+                self._insert_redirection(str(user_id), name, record)
+        for section in DOCUMENT_SECTIONS:
+            for user_id, value in data.get(section, {}).items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents (section, user_id, payload) VALUES (?, ?, ?)",
+                    (section, str(user_id), json.dumps(value))
+                )
+
+    def _insert_license(self, user_id, record):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO licenses (user_id, license, validated_at, active) VALUES (?, ?, ?, ?)",
+            (user_id, record.get("license"), record.get("validated_at"), int(bool(record.get("active", False))))
+        )
+
+    def _insert_connection(self, user_id, record):
+        # Delete first so the replacement gets a new rowid (keeps "most recent last" order)
+        self.conn.execute("DELETE FROM connections WHERE user_id = ? AND phone = ?", (user_id, record["phone"]))
+        self.conn.execute(
+            "INSERT INTO connections (user_id, phone, connected_at, active, replaced_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, record["phone"], record.get("connected_at"), int(bool(record.get("active", True))),
+             record.get("replaced_at"))
+        )
+
+    def _insert_redirection(self, user_id, name, record):
+        extra = {k: v for k, v in record.items() if k not in self.REDIRECTION_COLUMNS}
+        source_id = record.get("source_id")
+        destination_id = record.get("destination_id")
+        self.conn.execute(
+            """INSERT OR REPLACE INTO redirections (user_id, name, phone, source_id, destination_id, active, extra)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (user_id, name, record.get("phone"),
+             str(source_id) if source_id is not None else None,
+             str(destination_id) if destination_id is not None else None,
+             int(bool(record.get("active", True))), json.dumps(extra))
+        )
+
+    def get_license(self, user_id):
+        row = self._fetchone("SELECT * FROM licenses WHERE user_id = ?", (user_id,))
+        return self._license_record(row) if row else None
+
+    def set_license(self, user_id, record):
+        with self._lock:
+            self._insert_license(user_id, record)
+
+    def get_connections(self, user_id):
+        rows = self._fetchall("SELECT * FROM connections WHERE user_id = ? ORDER BY rowid", (user_id,))
+        return [self._connection_record(row) for row in rows]
+
+    def store_connection(self, user_id, record):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self._insert_connection(user_id, record)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def get_redirections(self, user_id, phone_number=None):
+        if phone_number is None:
+            rows = self._fetchall("SELECT * FROM redirections WHERE user_id = ? ORDER BY rowid", (user_id,))
+        else:
+            rows = self._fetchall(
+                "SELECT * FROM redirections WHERE user_id = ? AND phone = ? ORDER BY rowid",
+                (user_id, phone_number)
+            )
+        return {row["name"]: self._redirection_record(row) for row in rows}
+
+    def get_redirections_by_source(self, source_id):
+        rows = self._fetchall("SELECT * FROM redirections WHERE source_id = ?", (str(source_id),))
+        return [(row["user_id"], self._redirection_record(row)) for row in rows]
+
+    def set_redirection(self, user_id, name, record):
+        with self._lock:
+            self._insert_redirection(user_id, name, record)
+
+    def delete_redirection(self, user_id, name):
+        self._execute("DELETE FROM redirections WHERE user_id = ? AND name = ?", (user_id, name))
+
+    def get_document(self, section, user_id):
+        row = self._fetchone("SELECT payload FROM documents WHERE section = ? AND user_id = ?", (section, user_id))
+        return json.loads(row["payload"]) if row else None
+
+    def set_document(self, section, user_id, value):
+        if value is None:
+            self._execute("DELETE FROM documents WHERE section = ? AND user_id = ?", (section, user_id))
+        else:
+            self._execute(
+                "INSERT OR REPLACE INTO documents (section, user_id, payload) VALUES (?, ?, ?)",
+                (section, user_id, json.dumps(value))
+            )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+def migrate_json_to_sqlite(json_path, sqlite_storage):
+    """One-shot import of user_data.json into an SQLite backend"""
+    if not os.path.exists(json_path):
+        logger.info(f"No {json_path} to migrate")
+        return False
+    data = JsonStorage(json_path).load()
+    with sqlite_storage._lock:
+        sqlite_storage.conn.execute("BEGIN")
+        try:
+            sqlite_storage._import(data)
+            sqlite_storage.conn.execute("COMMIT")
+        except Exception:
+            sqlite_storage.conn.execute("ROLLBACK")
+            raise
+    sqlite_storage.set_meta("migrated_from", json_path)
+    logger.info(f"Migrated {json_path} to SQLite {sqlite_storage.path}")
+    return True
+
+def create_storage(backend, json_path, sqlite_path, flush_delay=1.0):
+    """Build the configured storage backend"""
+    if backend == "sqlite":
+        storage = SQLiteStorage(sqlite_path)
+        # First start on SQLite: import the existing JSON data once
+        if storage.get_meta("migrated_from") is None and storage.is_empty():
+            try:
+                migrate_json_to_sqlite(json_path, storage)
+            except Exception as e:
+                logger.error(f"Error migrating {json_path} to SQLite: {e}")
+        return storage
+    if backend != "json":
+        logger.warning(f"Unknown storage backend '{backend}', using json")
+    storage = JsonStorage(json_path, flush_delay)
+    atexit.register(storage.flush)
+    return storage
+
+if __name__ == "__main__":
+    # python -m bot.storage [user_data.json] [user_data.db]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    source = sys.argv[1] if len(sys.argv) > 1 else "user_data.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else "user_data.db"
+    migrate_json_to_sqlite(source, SQLiteStorage(target))
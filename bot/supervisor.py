@@ -0,0 +1,211 @@
+"""
+Supervision des clients Telegram des comptes connectés
+Chaque client du registre est sondé périodiquement ; un client déconnecté est
+reconnecté avec un backoff exponentiel et ses redirections sont rattachées.
+Uptime et nombre de reconnexions sont suivis par compte
+"""
+
+import logging
+import os
+import time
+import random
+import asyncio
+from bot.connection import connection_registry
+
+logger = logging.getLogger(__name__)
+
+SUPERVISOR_INTERVAL = float(os.getenv("SUPERVISOR_INTERVAL", "30"))  # seconds between health probes
+SUPERVISOR_PROBE_TIMEOUT = float(os.getenv("SUPERVISOR_PROBE_TIMEOUT", "10"))
+RECONNECT_BACKOFF_MIN = float(os.getenv("RECONNECT_BACKOFF_MIN", "5"))  # first retry delay, doubled per failure
+RECONNECT_BACKOFF_MAX = float(os.getenv("RECONNECT_BACKOFF_MAX", "600"))
+
+def format_duration(seconds):
+    """'3j 4h', '2h 05min', '12min', '40s'"""
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return f"{days}j {hours}h"
+    if hours:
+        return f"{hours}h {minutes:02d}min"
+    if minutes:
+        return f"{minutes}min"
+    return f"{seconds}s"
+
+class ClientSupervisor:
+    """Probes every connected account of the registry and reconnects dead clients"""
+
+    def __init__(self, registry, interval=SUPERVISOR_INTERVAL, probe_timeout=SUPERVISOR_PROBE_TIMEOUT,
+                 backoff_min=RECONNECT_BACKOFF_MIN, backoff_max=RECONNECT_BACKOFF_MAX):
+        self.registry = registry
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.health = {}  # registry key -> {'up_since', 'down_since', 'reconnects', 'failures', 'last_error'}
+        self._reconnecting = {}  # registry key -> reconnect task
+        self._task = None
+
+    def start(self):
+        """Start the probe loop (once) on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Client supervisor started (probe every {self.interval:.0f}s)")
+
+    async def stop(self):
+        tasks = [task for task in (self._task, *self._reconnecting.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._reconnecting.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"Error in client supervisor: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _health(self, key):
+        health = self.health.get(key)
+        if health is None:
+            health = {'up_since': None, 'down_since': None, 'reconnects': 0, 'failures': 0, 'last_error': None}
+            self.health[key] = health
+        return health
+
+    async def check_all(self):
+        """Probe every connected account once; start a reconnect for each dead one"""
+        items = [(key, entry) for key, entry in self.registry.items() if entry['status'] == 'connected']
+        # Forget accounts that left the registry
+        for key in set(self.health) - {key for key, _ in items}:
+            del self.health[key]
+        items = [(key, entry) for key, entry in items if key not in self._reconnecting]
+        results = await asyncio.gather(*(self.probe(entry.get('client')) for _, entry in items))
+        for (key, entry), error in zip(items, results):
+            health = self._health(key)
+            if error is None:
+                if health['up_since'] is None:
+                    health['up_since'] = time.monotonic()
+                    health['down_since'] = None
+                continue
+            health['up_since'] = None
+            health['down_since'] = health['down_since'] or time.monotonic()
+            health['last_error'] = error
+            logger.warning(f"Client {key[0]}:{entry.get('phone')} unhealthy ({error}), reconnecting")
+            task = asyncio.get_running_loop().create_task(self._reconnect(key, entry))
+            self._reconnecting[key] = task
+            task.add_done_callback(lambda _, key=key: self._reconnecting.pop(key, None))
+
+    async def probe(self, client):
+        """None if the client answers a cheap API call in time, else the error text"""
+        if client is None:
+            return "no client"
+        if not client.is_connected():
+            return "disconnected"
+        from telethon.tl.functions.updates import GetStateRequest
+        try:
+            await asyncio.wait_for(client(GetStateRequest()), self.probe_timeout)
+            return None
+        except asyncio.TimeoutError:
+            return f"no answer in {self.probe_timeout:.0f}s"
+        except Exception as e:
+            return str(e) or type(e).__name__
+
+    def _backoff(self, failures):
+        # Exponent clamped: a float power overflows after ~1000 failures
+        delay = min(self.backoff_max, self.backoff_min * 2 ** min(failures, 16))
+        # Jitter so accounts dropped together don't reconnect in lockstep
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _reconnect(self, key, entry):
+        """Reconnect until it works, the session is revoked or the account is removed"""
+        user_id, _ = key
+        client = entry['client']
+        health = self._health(key)
+        health['failures'] = 0
+        while self.registry.entries.get(key) is entry:
+            try:
+                if client.is_connected():
+                    await client.disconnect()
+                await client.connect()
+                if not await client.is_user_authorized():
+                    logger.warning(f"Session of {user_id}:{entry.get('phone')} is no longer authorized")
+                    from bot.session_manager import session_manager
+                    await session_manager.deactivate_session(user_id, entry.get('phone'))
+                    return
+                error = await self.probe(client)
+                if error is None:
+                    await self._reattach(key, entry)
+                    health['reconnects'] += 1
+                    health['failures'] = 0
+                    health['up_since'] = time.monotonic()
+                    health['down_since'] = None
+                    logger.info(f"Client {user_id}:{entry.get('phone')} reconnected ({health['reconnects']} reconnects)")
+                    return
+                raise ConnectionError(error)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                health['last_error'] = str(e) or type(e).__name__
+                delay = self._backoff(health['failures'])
+                health['failures'] += 1
+                logger.warning(f"Reconnect {health['failures']} of {user_id}:{entry.get('phone')} failed: {e}; retry in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    async def _reattach(self, key, entry):
+        """Make sure every redirection of the account is routed by the client again"""
+        from bot.dispatcher import get_dispatcher
+        dispatcher = get_dispatcher(entry['client'])
+        if dispatcher.rules:
+            # detach/attach registers the shared handlers exactly once
+            dispatcher.detach()
+            dispatcher.attach()
+        missing = entry['handlers'] - set(dispatcher.rules)
+        if not missing:
+            return
+        from bot.database import storage
+        from bot.message_handler import message_redirector
+        user_redirections = storage.get_redirections(str(key[0]))
+        for name in sorted(missing):
+            redir_data = user_redirections.get(name)
+            if not redir_data or not redir_data.get('active', True):
+                entry['handlers'].discard(name)
+                continue
+            await message_redirector.add_redirection_handler(
+                key[0], name, redir_data['source_id'], redir_data['destination_id'],
+                batch_forward=redir_data.get('batch_forward', False), phone_number=entry.get('phone')
+            )
+        logger.info(f"Re-attached {len(missing)} redirections of {key[0]}:{entry.get('phone')}")
+
+    def stats(self):
+        """Per account: phone, state, uptime / downtime (s), reconnects, last error"""
+        now = time.monotonic()
+        accounts = []
+        for key, entry in self.registry.items():
+            if entry['status'] != 'connected':
+                continue
+            health = self.health.get(key, {})
+            up_since = health.get('up_since')
+            down_since = health.get('down_since')
+            if key in self._reconnecting:
+                state = 'reconnecting'
+            elif up_since is not None:
+                state = 'up'
+            else:
+                state = 'unknown' if down_since is None else 'down'
+            accounts.append({
+                'user_id': key[0],
+                'phone': entry.get('phone'),
+                'state': state,
+                'uptime': now - up_since if up_since is not None else 0.0,
+                'downtime': now - down_since if down_since is not None else 0.0,
+                'reconnects': health.get('reconnects', 0),
+                'last_error': health.get('last_error'),
+            })
+        return accounts
+
+# Watches every account of connection_registry
+client_supervisor = ClientSupervisor(connection_registry)
@@ -0,0 +1,164 @@
+"""
+Pipeline de transformations par redirection (power, removeLines, format)
+Chaque redirection est compilée une fois en une chaîne d'opérations texte,
+mise en cache par version de règle et exécutée avant chaque envoi
+"""
+
+import logging
+import re
+from bot.filters import trie_pattern
+
+logger = logging.getLogger(__name__)
+
+TRANSFORMATION_TYPES = ("format", "power", "removeLines")
+
+# Placeholder replaced by the message text in a format template
+TEXT_PLACEHOLDER = "[[Message.Text]]"
+
+# Steps always run in this order: replacements, then line removal, then the template
+PIPELINE_ORDER = ("power", "removeLines", "format")
+
+def parse_transformation_config(transform_type, text):
+    """Validate and normalise the configuration of one transformation
+
+    format       template containing [[Message.Text]]
+    power        'ancien => nouveau; regex:motif => remplacement; ...'
+    removeLines  'mot, autre mot, ...' (lines containing one are removed)
+
+    Raises ValueError with a user-facing message.
+    """
+    text = text.strip()
+    if not text:
+        raise ValueError("configuration manquante")
+    if transform_type == "format":
+        if TEXT_PLACEHOLDER not in text:
+            raise ValueError(f"le modèle doit contenir {TEXT_PLACEHOLDER}")
+        return text
+    if transform_type == "power":
+        replacements = []
+        for rule in text.split(";"):
+            if not rule.strip():
+                continue
+            if "=>" not in rule:
+                raise ValueError(f"remplacement invalide `{rule.strip()}` (format : ancien => nouveau)")
+            old, new = (part.strip() for part in rule.split("=>", 1))
+            if old.startswith("regex:"):
+                try:
+                    re.compile(old[len("regex:"):])
+                except re.error as e:
+                    raise ValueError(f"regex invalide `{old}` : {e}")
+            elif not old:
+                raise ValueError("texte à remplacer vide")
+            replacements.append([old, new])
+        if not replacements:
+            raise ValueError("aucun remplacement")
+        return replacements
+    if transform_type == "removeLines":
+        keywords = [keyword.strip().lower() for keyword in text.split(",") if keyword.strip()]
+        if not keywords:
+            raise ValueError("aucun mot-clé")
+        return keywords
+    raise ValueError(f"type inconnu `{transform_type}`")
+
+def _compile_power(replacements):
+    """Literal replacements in one pass, then regex replacements in order"""
+    table = {old: new for old, new in replacements if not old.startswith("regex:")}
+    regexes = [(re.compile(old[len("regex:"):]), new) for old, new in replacements if old.startswith("regex:")]
+    # Prefix-factored alternation: one scan whatever the number of literals (longest match wins)
+    literal = re.compile(trie_pattern(table)) if table else None
+
+    def power(text):
+        if literal is not None:
+            text = literal.sub(lambda match: table[match.group(0)], text)
+        for pattern, new in regexes:
+            text = pattern.sub(new, text)
+        return text
+    return power
+
+def _compile_remove_lines(keywords):
+    # Keywords are stored lowercased: search the lowercased text (re.IGNORECASE is much slower)
+    matcher = re.compile(trie_pattern(sorted(set(keywords))))
+
+    def remove_lines(text):
+        if not matcher.search(text.lower()):
+            return text
+        return "\n".join(line for line in text.split("\n") if not matcher.search(line.lower()))
+    return remove_lines
+
+def _compile_format(template):
+    before, _, after = template.partition(TEXT_PLACEHOLDER)
+    after = after.replace(TEXT_PLACEHOLDER, "")
+
+    def format_text(text):
+        return before + text + after
+    return format_text
+
+COMPILERS = {
+    "power": _compile_power,
+    "removeLines": _compile_remove_lines,
+    "format": _compile_format,
+}
+
+class Pipeline:
+    """Precompiled chain of text operations for one redirection"""
+
+    def __init__(self, steps):
+        self.types = [step for step in PIPELINE_ORDER if step in steps]
+        self.operations = [COMPILERS[step](steps[step]) for step in self.types]
+
+    def apply(self, text):
+        for operation in self.operations:
+            text = operation(text)
+        return text
+
+class TransformationEngine:
+    """Compiled pipelines per user, reused across reloads while the rule version is unchanged"""
+
+    def __init__(self):
+        self.compiled = {}  # user_id -> {redirection name: (version, Pipeline)}
+        self.previous = {}  # invalidated pipelines, reused if their version is unchanged
+
+    def _user_pipelines(self, user_id):
+        user_id = str(user_id)
+        pipelines = self.compiled.get(user_id)
+        if pipelines is None:
+            from bot.database import storage
+            document = storage.get_document("transformations", user_id) or {}
+            previous = self.previous.pop(user_id, {})
+            pipelines = {}
+            for name, rules in document.items():
+                version = rules.get("version", 0)
+                cached = previous.get(name)
+                if cached is not None and cached[0] == version:
+                    pipelines[name] = cached
+                else:
+                    try:
+                        pipelines[name] = (version, Pipeline(rules.get("steps", {})))
+                    except Exception as e:
+                        logger.error(f"Error compiling transformations for {name}: {e}")
+            self.compiled[user_id] = pipelines
+        return pipelines
+
+    def invalidate(self, user_id):
+        """Reload a user's rules on next use (unchanged versions keep their pipeline)"""
+        pipelines = self.compiled.pop(str(user_id), None)
+        if pipelines is not None:
+            self.previous[str(user_id)] = pipelines
+
+    def has_transformations(self, user_id, redirection_name):
+        """True if the redirection rewrites text (its messages must be copied, not forwarded)"""
+        return redirection_name in self._user_pipelines(user_id)
+
+    def apply(self, user_id, redirection_name, text):
+        """Transformed text for a redirection (unchanged if it has no transformations)"""
+        if not text:
+            return text
+        try:
+            entry = self._user_pipelines(user_id).get(redirection_name)
+            return entry[1].apply(text) if entry else text
+        except Exception as e:
+            logger.error(f"Error applying transformations for {redirection_name}: {e}")
+            return text
+
+# Shared by MessageRedirector and SimpleRedirectionRestorer
+transformation_engine = TransformationEngine()
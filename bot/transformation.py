@@ -1,4 +1,5 @@
 import logging
+from bot.transform_pipeline import parse_transformation_config, TRANSFORMATION_TYPES
 
 logger = logging.getLogger(__name__)
 
@@ -15,17 +16,20 @@ async def handle_transformation_command(event, client):
             usage_message = """
 🧩 **Utilisation de /transformation :**
 
-`/transformation add format|power|removeLines NOM on NUMERO`
-`/transformation remove ...`
-`/transformation clear ...`
+`/transformation add format|power|removeLines NOM on NUMERO configuration`
+`/transformation remove format|power|removeLines NOM on NUMERO`
+`/transformation clear on NUMERO`
 
 **Types de transformation :**
-• **format** - Modifier le format des messages
-• **power** - Appliquer des transformations avancées
-• **removeLines** - Supprimer certaines lignes
+• **format** - Modifier le format des messages (modèle contenant `[[Message.Text]]`)
+• **power** - Appliquer des transformations avancées (`ancien => nouveau; regex:motif => remplacement`)
+• **removeLines** - Supprimer les lignes contenant certains mots (`mot1, mot2`)
+
+Les transformations s'appliquent dans l'ordre power → removeLines → format.
 
 **Exemple :**
-`/transformation add format groupe1 on 229900112233`
+`/transformation add format groupe1 on 229900112233 📢 [[Message.Text]]`
+`/transformation add power groupe1 on 229900112233 t.me/ancien => t.me/nouveau`
             """
             await event.respond(usage_message)
             return
@@ -37,8 +41,9 @@ async def handle_transformation_command(event, client):
             return
         
         # Handle different transformation actions
-        if parts[1] == "add" and len(parts) == 6 and parts[4] == "on":
-            await add_transformation(event, client, parts[2], parts[3], parts[5])
+        if parts[1] == "add" and len(parts) >= 6 and parts[4] == "on":
+            config = message_text.split(None, 6)[6] if len(parts) > 6 else ""
+            await add_transformation(event, client, parts[2], parts[3], parts[5], config)
         elif parts[1] == "remove" and len(parts) == 6 and parts[4] == "on":
             await remove_transformation(event, client, parts[2], parts[3], parts[5])
         elif parts[1] == "clear" and len(parts) == 4 and parts[2] == "on":
@@ -50,7 +55,7 @@ async def handle_transformation_command(event, client):
         logger.error(f"Error in transformation command: {e}")
         await event.respond("❌ Erreur lors de la gestion des transformations. Veuillez réessayer.")
 
-async def add_transformation(event, client, transform_type, name, phone_number):
+async def add_transformation(event, client, transform_type, name, phone_number, config):
     """Add a new transformation"""
     try:
         user_id = event.sender_id
@@ -61,13 +66,18 @@ async def add_transformation(event, client, transform_type, name, phone_number):
             return
         
         # Validate transformation type
-        valid_types = ["format", "power", "removeLines"]
-        if transform_type not in valid_types:
-            await event.respond(f"❌ Type de transformation invalide. Types supportés : {', '.join(valid_types)}")
+        if transform_type not in TRANSFORMATION_TYPES:
+            await event.respond(f"❌ Type de transformation invalide. Types supportés : {', '.join(TRANSFORMATION_TYPES)}")
+            return
+        
+        # Validate configuration, then store transformation
+        try:
+            config = parse_transformation_config(transform_type, config)
+        except ValueError as e:
+            await event.respond(f"❌ Configuration invalide : {e}")
             return
         
-        # Store transformation
-        await store_transformation(user_id, transform_type, name, phone_number, "add")
+        await store_transformation(user_id, transform_type, name, phone_number, "add", config)
         
         success_message = f"""
 ✅ **Transformation ajoutée**
@@ -98,7 +108,9 @@ async def remove_transformation(event, client, transform_type, name, phone_numbe
             return
         
         # Remove transformation
-        await store_transformation(user_id, transform_type, name, phone_number, "remove")
+        if not await store_transformation(user_id, transform_type, name, phone_number, "remove"):
+            await event.respond(f"❌ Aucune transformation {transform_type} pour **{name}** sur {phone_number}.")
+            return
         
         success_message = f"""
 ✅ **Transformation supprimée**
@@ -152,14 +164,17 @@ async def is_premium_user(user_id):
     from bot.database import is_user_licensed
     return await is_user_licensed(user_id)
 
-async def store_transformation(user_id, transform_type, name, phone_number, action):
+async def store_transformation(user_id, transform_type, name, phone_number, action, config=None):
     """Store transformation in database"""
+    from bot import database
     logger.info(f"Transformation {action} for user {user_id}: {transform_type} {name} on {phone_number}")
-    # In real implementation, save to database
-    pass
+    if action == "remove":
+        return await database.remove_transformation(user_id, name, phone_number, transform_type)
+    await database.store_transformation(user_id, name, phone_number, transform_type, config)
+    return True
 
 async def clear_user_transformations(user_id, phone_number):
     """Clear all transformations for a user and phone number"""
-    logger.info(f"Transformations cleared for user {user_id} on {phone_number}")
-    # In real implementation, clear from database
-    pass
\ No newline at end of file
+    from bot import database
+    removed = await database.clear_transformations(user_id, phone_number)
+    logger.info(f"Transformations cleared for user {user_id} on {phone_number}: {removed} redirections")
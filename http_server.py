@@ -1,7 +1,9 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
+import asyncio
 import threading
 import time
 import os
+import hmac
 from datetime import datetime
 import logging
 
@@ -11,6 +13,10 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# /metrics exposes user ids and redirection names: only served with this token
+# (Authorization: Bearer <token>), disabled when empty
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 # Variables globales pour le statut
 server_status = {
     "last_activity": time.time(),
@@ -88,6 +94,27 @@ def health():
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/metrics')
+def metrics():
+    """Histogrammes de latence des redirections (format Prometheus)"""
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Métriques désactivées"}), 404
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return jsonify({"error": "Non autorisé"}), 401
+    
+    from bot import metrics as forwarding
+    
+    snapshots = [forwarding.forwarding_metrics.snapshot()]
+    if forwarding.bot_loop is not None:
+        # Workers' histograms are collected on the bot's event loop
+        try:
+            snapshots = asyncio.run_coroutine_threadsafe(forwarding.collect_snapshots(), forwarding.bot_loop).result(15)
+        except Exception as e:
+            logger.warning(f"Métriques des workers indisponibles: {e}")
+    
+    return Response(forwarding.render_prometheus(forwarding.merge_snapshots(*snapshots)),
+                    mimetype="text/plain; version=0.0.4")
+
 @app.route('/send-message', methods=['POST'])
 def send_message():
     """Endpoint pour que le serveur envoie un message via le bot"""
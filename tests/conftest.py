@@ -0,0 +1,10 @@
+import os
+import sys
+
+# config.settings exits without Telegram credentials: give the imports dummy ones
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("ADMIN_ID", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+import bot.database
+from bot.command_router import CommandRouter, CommandTrie, RateLimiter, Route, parse_command
+
+ADMIN = 1
+
+class FakeEvent:
+    def __init__(self, text, sender_id=5):
+        self.raw_text = text
+        self.sender_id = sender_id
+        self.responses = []
+
+    async def respond(self, text):
+        self.responses.append(text)
+
+def test_parse_command():
+    assert parse_command("/payer@TeleFeedBot un  mois") == ["/payer", "un", "mois"]
+    assert parse_command("/help") == ["/help"]
+    assert parse_command("bonjour /help") is None
+    assert parse_command("") is None
+    assert parse_command(None) is None
+
+def test_trie_returns_the_longest_registered_path():
+    trie = CommandTrie()
+    for path in ("/payer", "/payer un mois", "/payer une semaine", "/railway", "/railway test"):
+        trie.add(Route(path, None))
+    assert trie.match(["/payer", "un", "mois"]).path == "/payer un mois"
+    assert trie.match(["/payer", "un", "an"]).path == "/payer"
+    assert trie.match(["/payer"]).path == "/payer"
+    assert trie.match(["/railway", "test", "now"]).path == "/railway test"
+    assert trie.match(["/unknown"]) is None
+    assert sorted(trie.paths()) == ["/payer", "/payer un mois", "/payer une semaine", "/railway", "/railway test"]
+    with pytest.raises(ValueError):
+        trie.add(Route("/payer", None))
+
+def make_router(calls, licensed_users=()):
+    router = CommandRouter(ADMIN, rate_limiter=RateLimiter(limit=3, window=60))
+
+    def record(name):
+        async def handler(event):
+            calls.append((name, event.raw_text))
+        return handler
+
+    router.command("/payer")(record("payer"))
+    router.command("/payer un mois")(record("payer un mois"))
+    router.command("/redirection", licensed=True)(record("redirection"))
+    router.command("/stats", admin_only=True)(record("stats"))
+    router.fallback(record("fallback"))
+    return router
+
+@pytest.fixture
+def licences(monkeypatch):
+    licensed = set()
+
+    async def is_user_licensed(user_id):
+        return user_id in licensed
+
+    monkeypatch.setattr(bot.database, "is_user_licensed", is_user_licensed)
+    return licensed
+
+def dispatch(router, *events):
+    async def scenario():
+        for event in events:
+            await router.dispatch(event)
+    asyncio.run(scenario())
+
+def test_each_message_runs_exactly_one_handler(licences):
+    calls = []
+    router = make_router(calls)
+    dispatch(router, FakeEvent("/payer un mois"), FakeEvent("/payer"), FakeEvent("salut"), FakeEvent("/inconnue"))
+    assert calls == [("payer un mois", "/payer un mois"), ("payer", "/payer"),
+                     ("fallback", "salut"), ("fallback", "/inconnue")]
+
+def test_licence_is_required_for_arguments_only(licences):
+    calls = []
+    router = make_router(calls)
+    usage, denied = FakeEvent("/redirection"), FakeEvent("/redirection add r1 on 123")
+    dispatch(router, usage, denied)
+    assert calls == [("redirection", "/redirection")]
+    assert denied.responses and "premium" in denied.responses[0]
+
+    licences.add(5)
+    dispatch(router, FakeEvent("/redirection add r1 on 123"))
+    assert calls[-1] == ("redirection", "/redirection add r1 on 123")
+
+def test_admin_only_commands(licences):
+    calls = []
+    router = make_router(calls)
+    refused = FakeEvent("/stats")
+    dispatch(router, refused, FakeEvent("/stats", sender_id=ADMIN))
+    assert calls == [("stats", "/stats")]
+    assert refused.responses
+
+def test_rate_limit_warns_once_and_spares_the_admin(licences):
+    calls = []
+    router = make_router(calls)
+    events = [FakeEvent("/payer") for _ in range(6)]
+    dispatch(router, *events, *(FakeEvent("/payer", sender_id=ADMIN) for _ in range(6)), FakeEvent("plain text"))
+    assert len(calls) == 3 + 6 + 1  # plain text is not rate limited
+    assert sum(len(event.responses) for event in events) == 1
+
+def test_middleware_can_stop_a_message(licences):
+    calls = []
+    router = make_router(calls)
+    seen = []
+
+    @router.middleware
+    async def only_commands(event, command, route):
+        seen.append(route.path if route else None)
+        return command is not None
+
+    dispatch(router, FakeEvent("salut"), FakeEvent("/payer un mois"))
+    assert seen == [None, "/payer un mois"]
+    assert calls == [("payer un mois", "/payer un mois")]
@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot.connection
+from bot.connection import ConnectionRegistry, handle_verification_code
+from bot.conversation import ConversationStates, AWAITING_CODE, AWAITING_REDIRECTION_IDS, AWAITING_LICENSE
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def test_each_flow_keeps_its_own_step(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("bot.conversation.time", clock)
+    states = ConversationStates(ttl=60)
+    states.set(1, AWAITING_CODE, phone="+100")
+    states.set(1, AWAITING_REDIRECTION_IDS, name="r1", phone_number="100")
+    assert states.expect(1, AWAITING_CODE) == {"phone": "+100"}
+    assert states.pending(1) == {
+        AWAITING_CODE: {"phone": "+100"},
+        AWAITING_REDIRECTION_IDS: {"name": "r1", "phone_number": "100"},
+    }
+
+    states.clear(1, AWAITING_REDIRECTION_IDS)
+    assert states.pending(1) == {AWAITING_CODE: {"phone": "+100"}}
+    clock.now += 30
+    states.set(1, AWAITING_LICENSE)
+    clock.now += 31
+    assert states.pending(1) == {AWAITING_LICENSE: {}}  # the code step expired
+    states.clear(1)
+    assert len(states) == 0
+
+class FakeClient:
+    def __init__(self):
+        self.codes = []
+
+    async def sign_in(self, phone, code, phone_code_hash=None):
+        self.codes.append((phone, code))
+        raise ValueError("PHONE_CODE_INVALID")
+
+def make_event(text, answers):
+    async def respond(message):
+        answers.append(message)
+    return SimpleNamespace(sender_id=1, text=text, respond=respond)
+
+@pytest.fixture
+def pending_connections(monkeypatch):
+    registry = ConnectionRegistry()
+    states = ConversationStates()
+    monkeypatch.setattr(bot.connection, "connection_registry", registry)
+    monkeypatch.setattr(bot.connection, "conversations", states)
+    return registry, states
+
+def test_code_goes_to_the_number_that_asked_for_it(pending_connections):
+    registry, states = pending_connections
+    clients = {}
+    for phone in ("+100", "+200"):
+        clients[phone] = FakeClient()
+        registry.set(1, phone, client=clients[phone], status='code_sent', phone_code_hash="h", session_name="s")
+    states.set(1, AWAITING_CODE, phone="+200")
+    states.set(1, AWAITING_REDIRECTION_IDS, name="r1", phone_number="200")  # doesn't drop the code step
+    answers = []
+
+    assert asyncio.run(handle_verification_code(make_event("aa12345", answers), None))
+    assert clients["+100"].codes == []
+    assert clients["+200"].codes == [("+200", "12345")]
+    assert "incorrect" in answers[0]
+
+def test_code_without_pending_client_asks_to_connect_again(pending_connections):
+    registry, states = pending_connections
+    states.set(1, AWAITING_CODE, phone="+100")
+    answers = []
+
+    assert asyncio.run(handle_verification_code(make_event("aa12345", answers), None))
+    assert "/connect" in answers[0]
+    assert states.expect(1, AWAITING_CODE) is None
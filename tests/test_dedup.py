@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import bot.dedup
+from bot.dedup import DedupCache, content_fingerprint
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def test_fingerprint_ignores_case_and_whitespace_but_not_media():
+    photo = SimpleNamespace(photo=SimpleNamespace(id=7), document=None)
+    other_photo = SimpleNamespace(photo=SimpleNamespace(id=8), document=None)
+    assert content_fingerprint("Hello  World\n") == content_fingerprint("hello world")
+    assert content_fingerprint("hello", [photo]) != content_fingerprint("hello")
+    assert content_fingerprint("", [photo]) != content_fingerprint("", [other_photo])
+    assert content_fingerprint("  ") is None
+
+def test_same_content_is_sent_once_per_destination_and_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.dedup, "time", clock)
+    cache = DedupCache(window=60, max_entries=100)
+    fingerprint = content_fingerprint("breaking news")
+
+    assert cache.claim(-100, fingerprint)
+    assert not cache.claim(-100, fingerprint)
+    assert cache.claim(-200, fingerprint)  # other destination
+    clock.now += 61
+    assert cache.claim(-100, fingerprint)  # window elapsed
+    assert cache.stats()['skipped'] == 1
+
+def test_released_fingerprint_can_be_sent_again():
+    cache = DedupCache(window=60)
+    fingerprint = content_fingerprint("retry me")
+    assert cache.claim(-100, fingerprint)
+    cache.release(-100, fingerprint)  # the send failed
+    assert cache.claim(-100, fingerprint)
+
+def test_entries_per_destination_are_bounded():
+    cache = DedupCache(window=3600, max_entries=3)
+    fingerprints = [content_fingerprint(f"message {i}") for i in range(5)]
+    for fingerprint in fingerprints:
+        assert cache.claim(-100, fingerprint)
+    assert cache.stats()['entries'] == 3
+    assert cache.claim(-100, fingerprints[0])  # evicted, oldest first
+    assert not cache.claim(-100, fingerprints[4])
+
+def test_disabled_window_and_empty_fingerprint_always_pass():
+    disabled = DedupCache(window=0)
+    assert disabled.claim(-100, b"x") and disabled.claim(-100, b"x")
+    cache = DedupCache(window=60)
+    assert cache.claim(-100, None) and cache.claim(-100, None)
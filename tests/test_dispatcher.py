@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.dispatcher import RedirectionDispatcher, source_peer_ids
+
+class FakeClient:
+    def __init__(self):
+        self.handlers = []
+
+    def add_event_handler(self, callback, event):
+        self.handlers.append(callback)
+
+    def remove_event_handler(self, callback):
+        self.handlers.remove(callback)
+
+def recorder(calls):
+    async def callback(event, rule, is_edit):
+        calls.append((rule['name'], event.chat_id, is_edit))
+    return callback
+
+def test_source_peer_ids():
+    assert source_peer_ids(-1001234) == {-1001234}
+    assert source_peer_ids(1234) == {1234, -1234, -1000000001234}
+
+def test_updates_reach_only_the_rules_of_their_source():
+    client = FakeClient()
+    dispatcher = RedirectionDispatcher(client)
+    calls = []
+    dispatcher.add_rule("a", -1001, -2001, recorder(calls))
+    dispatcher.add_rule("b", -1001, -2002, recorder(calls))
+    dispatcher.add_rule("c", -1002, -2003, recorder(calls))
+
+    async def scenario():
+        await dispatcher.dispatch(SimpleNamespace(chat_id=-1001))
+        await dispatcher.dispatch(SimpleNamespace(chat_id=-1002), is_edit=True)
+        await dispatcher.dispatch(SimpleNamespace(chat_id=-1003))
+
+    asyncio.run(scenario())
+    assert calls == [("a", -1001, False), ("b", -1001, False), ("c", -1002, True)]
+    assert len(client.handlers) == 2  # one NewMessage and one MessageEdited handler for every rule
+
+def test_positive_source_id_matches_channel_updates():
+    dispatcher = RedirectionDispatcher(FakeClient())
+    calls = []
+    dispatcher.add_rule("a", 2759205517, -2001, recorder(calls))
+    asyncio.run(dispatcher.dispatch(SimpleNamespace(chat_id=-1002759205517)))
+    assert calls == [("a", -1002759205517, False)]
+
+def test_replaced_and_removed_rules_are_unindexed():
+    dispatcher = RedirectionDispatcher(FakeClient())
+    calls = []
+    dispatcher.add_rule("a", -1001, -2001, recorder(calls))
+    dispatcher.add_rule("a", -1002, -2001, recorder(calls))  # same name: replaces the first rule
+    assert dispatcher.get_rules(-1001) == []
+    assert [rule['name'] for rule in dispatcher.get_rules(-1002)] == ["a"]
+    assert dispatcher.remove_rule("a")
+    assert not dispatcher.remove_rule("a")
+    assert dispatcher.rules_by_source == {}
+
+def test_failing_callback_does_not_stop_the_others():
+    dispatcher = RedirectionDispatcher(FakeClient())
+    calls = []
+
+    async def failing(event, rule, is_edit):
+        raise RuntimeError("boom")
+
+    dispatcher.add_rule("a", -1001, -2001, failing)
+    dispatcher.add_rule("b", -1001, -2002, recorder(calls))
+    asyncio.run(dispatcher.dispatch(SimpleNamespace(chat_id=-1001)))
+    assert calls == [("b", -1001, False)]
@@ -0,0 +1,46 @@
+import bot.database
+from bot.entitlements import LicenceEntitlements
+
+class FakeStorage:
+    def __init__(self, licences):
+        self.licences = licences
+        self.reads = 0
+
+    def get_license(self, user_id):
+        self.reads += 1
+        return self.licences.get(user_id)
+
+def make_entitlements(monkeypatch, licences, **kwargs):
+    storage = FakeStorage(licences)
+    monkeypatch.setattr(bot.database, "storage", storage)
+    entitlements = LicenceEntitlements(**kwargs)
+    entitlements._admin_id = "1"
+    return entitlements, storage
+
+def test_status_is_read_once(monkeypatch):
+    entitlements, storage = make_entitlements(monkeypatch, {"5": {"active": True}})
+    assert entitlements.is_licensed(5) and entitlements.is_licensed("5")
+    assert not entitlements.is_licensed(6) and not entitlements.is_licensed(6)
+    assert storage.reads == 2
+    assert entitlements.is_licensed(1)  # the admin, never cached
+
+def test_cache_is_bounded(monkeypatch):
+    entitlements, storage = make_entitlements(monkeypatch, {}, max_size=100)
+    for user_id in range(1000, 2000):
+        entitlements.is_licensed(user_id)
+    assert len(entitlements.licensed) == 100
+    assert list(entitlements.licensed)[0] == "1900"  # least recently used first
+
+def test_entries_expire(monkeypatch):
+    entitlements, storage = make_entitlements(monkeypatch, {}, ttl=-1)
+    entitlements.is_licensed(5)
+    storage.licences["5"] = {"active": True}  # licence bought, invalidation missed
+    assert entitlements.is_licensed(5)
+    assert storage.reads == 2
+
+def test_invalidate_forgets_the_user(monkeypatch):
+    entitlements, storage = make_entitlements(monkeypatch, {})
+    assert not entitlements.is_licensed(5)
+    storage.licences["5"] = {"active": True}
+    entitlements.invalidate(5)
+    assert entitlements.is_licensed(5)
@@ -0,0 +1,32 @@
+import gc
+import asyncio
+from types import SimpleNamespace
+
+from bot.entity_cache import get_entity_cache, prewarm_entity_cache
+
+class FakeClient:
+    def __init__(self, dialogs):
+        self.dialogs = dialogs
+        self.walks = 0
+
+    async def iter_dialogs(self, limit=None):
+        self.walks += 1
+        for dialog in self.dialogs[:limit]:
+            await asyncio.sleep(0)
+            gc.collect()  # an unreferenced task would be collected here
+            yield dialog
+
+def test_prewarm_runs_once_in_the_background():
+    client = FakeClient([SimpleNamespace(id=-100 - i, entity=SimpleNamespace(title=f"Chat {i}")) for i in range(5)])
+
+    async def scenario():
+        cache = prewarm_entity_cache(client)
+        assert prewarm_entity_cache(client) is cache  # already running: not started twice
+        await cache.prewarm_task
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.prewarmed
+    assert client.walks == 1
+    assert cache.stats()['size'] == 5
+    assert get_entity_cache(client) is cache
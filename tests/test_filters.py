@@ -0,0 +1,97 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import bot.database
+from bot.filters import CompiledFilter, FilterEngine, format_rules, parse_filter_terms, trie_pattern
+
+def message(text="", sender_id=None, username=None, **media):
+    sender = SimpleNamespace(username=username) if username else None
+    return SimpleNamespace(text=text, sender_id=sender_id, sender=sender, **media)
+
+def test_trie_pattern_factors_common_prefixes():
+    assert trie_pattern(["chat", "chaton", "chien"]) == "ch(?:at(?:on)?|ien)"
+    assert trie_pattern([]) == ""
+
+@pytest.mark.parametrize("words", [
+    ["a", "ab", "abc", "b"],
+    ["promo", "promotion", "prix", "c++", "1.5"],
+    ["vente", "ventes", "événement"],
+])
+def test_trie_pattern_matches_the_same_words_as_an_alternation(words):
+    trie = re.compile(f"^(?:{trie_pattern(words)})$")
+    for word in words:
+        assert trie.match(word)
+    for other in ["", "abcd", "c+", "1x5", "vent", "promotio"]:
+        assert bool(trie.match(other)) == (other in words)
+
+def test_parse_filter_terms():
+    rules = parse_filter_terms("Promo, regex:^\\d+, from:@Alice, media:Photo, ")
+    assert rules == {"keywords": ["promo"], "regexes": ["^\\d+"], "senders": ["alice"], "media": ["photo"]}
+    with pytest.raises(ValueError):
+        parse_filter_terms("regex:(")
+    with pytest.raises(ValueError):
+        parse_filter_terms("media:hologram")
+
+def test_compiled_filter_matches_text_sender_and_media():
+    compiled = CompiledFilter(parse_filter_terms("promo, regex:^\\d{4}$, from:alice, from:42, media:photo"))
+    assert compiled.size == 5
+    assert compiled.matches(message("Grosse PROMO ce soir"))
+    assert compiled.matches(message("2024"))
+    assert not compiled.matches(message("20245"))
+    assert compiled.matches(message("hello", username="Alice"))
+    assert compiled.matches(message("hello", sender_id=42))
+    assert compiled.matches(message("", photo=object()))
+    assert not compiled.matches(message("hello", sender_id=7))
+
+def test_regex_with_inline_flags_is_compiled_separately():
+    compiled = CompiledFilter(parse_filter_terms("promo, regex:(?i)^urgent"))
+    assert len(compiled.text_matchers) == 1  # the user regex, alone: it has inline flags
+    assert compiled.matches(message("URGENT: lire"))
+    assert compiled.matches(message("une promo"))
+
+def test_regex_with_commas_one_term_per_line_or_escaped():
+    expected = {"keywords": ["promo"], "regexes": ["\\d{2,4}"], "senders": [], "media": []}
+    assert parse_filter_terms("promo\nregex:\\d{2,4}") == expected
+    assert parse_filter_terms("promo, regex:\\d{2\\,4}") == expected
+    assert parse_filter_terms(format_rules(expected)) == expected
+    assert parse_filter_terms("a\\, b, c") == {"keywords": ["a, b", "c"], "regexes": [], "senders": [], "media": []}
+
+def test_regexes_with_backreferences_keep_their_group_numbers():
+    compiled = CompiledFilter(parse_filter_terms("regex:(a)b, regex:(\\w)\\1, regex:(?P<d>\\d)(?P=d)"))
+    assert len(compiled.text_matchers) == 3  # the first one combined, the two others alone
+    assert compiled.matches(message("xx"))
+    assert compiled.matches(message("77"))
+    assert compiled.matches(message("ab"))
+    assert not compiled.matches(message("xy 78"))
+
+class FakeStorage:
+    def __init__(self, documents):
+        self.documents = documents
+        self.reads = 0
+
+    def get_document(self, section, user_id):
+        self.reads += 1
+        return self.documents.get(section, {}).get(user_id)
+
+def test_filter_engine_whitelist_blacklist_and_albums(monkeypatch):
+    storage = FakeStorage({
+        "whitelists": {"1": {"r1": parse_filter_terms("promo, media:photo")}},
+        "blacklists": {"1": {"r1": parse_filter_terms("casino")}},
+    })
+    monkeypatch.setattr(bot.database, "storage", storage)
+    engine = FilterEngine()
+
+    assert engine.allows(1, "r1", message("promo du jour"))
+    assert not engine.allows(1, "r1", message("bonjour"))
+    assert not engine.allows(1, "r1", message("promo casino"))
+    assert engine.allows(1, "r2", message("casino"))  # no filter on r2
+    # Album: whitelisted if any item matches, rejected if any item is blacklisted
+    assert engine.allows(1, "r1", message("", photo=object()), message("légende"))
+    assert not engine.allows(1, "r1", message("", photo=object()), message("casino"))
+    assert storage.reads == 2  # compiled once per user and kind
+
+    storage.documents["blacklists"]["1"]["r1"] = parse_filter_terms("promo")
+    engine.invalidate(1)
+    assert not engine.allows(1, "r1", message("promo du jour"))
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot.forwarding as forwarding
+
+class FakeScheduler:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, destination_id, text, timings=None):
+        self.calls.append(("send", destination_id, text))
+        return SimpleNamespace(id=500)
+
+    async def edit_message(self, destination_id, message_id, text, timings=None):
+        self.calls.append(("edit", destination_id, message_id, text))
+
+    async def delete_messages(self, destination_id, message_id, timings=None):
+        self.calls.append(("delete", destination_id, message_id))
+
+class FakeMapping:
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+
+    def get(self, chat_id, message_id, destination_id):
+        return self.entries.get((chat_id, message_id, destination_id))
+
+    def set(self, chat_id, message_id, destination_id, redirected_id):
+        self.entries[(chat_id, message_id, destination_id)] = redirected_id
+
+    def delete(self, chat_id, message_id, destination_id):
+        self.entries.pop((chat_id, message_id, destination_id), None)
+
+class FakeTransformations:
+    def __init__(self, result):
+        self.result = result
+
+    def has_transformations(self, user_id, redirection_name):
+        return True
+
+    def apply(self, user_id, redirection_name, text):
+        return self.result(text)
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(forwarding, "get_send_scheduler", lambda client: scheduler)
+    scheduler.routes = []
+
+    async def route_names(client, source_id, destination_id):
+        scheduler.routes.append((source_id, destination_id))
+        return f"{source_id} to {destination_id}"
+
+    monkeypatch.setattr(forwarding, "_route_names", route_names)
+    return scheduler
+
+def make_event(text, message_id=10, chat_id=-100):
+    message = SimpleNamespace(id=message_id, text=text, media=None, grouped_id=None)
+    return SimpleNamespace(client=object(), message=message, chat_id=chat_id)
+
+def test_edit_empty_after_transformations_is_not_applied(scheduler, monkeypatch):
+    monkeypatch.setattr(forwarding, "transformation_engine", FakeTransformations(lambda text: "  "))
+    mapping = FakeMapping({(-100, 10, "-200"): 77})
+
+    asyncio.run(forwarding.forward_message(make_event("only a link"), "-200", "r1", 1, mapping, is_edit=True))
+
+    assert scheduler.calls == []
+    assert mapping.entries == {(-100, 10, "-200"): 77}
+
+def test_edit_is_mirrored_with_transformed_text(scheduler, monkeypatch):
+    monkeypatch.setattr(forwarding, "transformation_engine", FakeTransformations(str.upper))
+    mapping = FakeMapping({(-100, 10, "-200"): 77})
+
+    asyncio.run(forwarding.forward_message(make_event("hello"), "-200", "r1", 1, mapping, is_edit=True))
+
+    assert scheduler.calls == [("edit", -200, 77, "HELLO")]
+
+def test_new_message_is_sent_and_mapped(scheduler, monkeypatch):
+    monkeypatch.setattr(forwarding, "transformation_engine", FakeTransformations(str.upper))
+    monkeypatch.setattr(forwarding.filter_engine, "allows", lambda *args: True)
+    mapping = FakeMapping()
+
+    asyncio.run(forwarding.forward_message(make_event("fresh text 1"), "-201", "r1", 1, mapping))
+
+    assert scheduler.calls == [("send", -201, "FRESH TEXT 1")]
+    assert mapping.entries == {(-100, 10, "-201"): 500}
+
+def test_route_names_are_not_resolved_for_dropped_lines(scheduler, monkeypatch):
+    monkeypatch.setattr(forwarding, "transformation_engine", FakeTransformations(str.upper))
+    monkeypatch.setattr(forwarding.filter_engine, "allows", lambda *args: True)
+    drop = lambda record: False
+    forwarding.message_logger.addFilter(drop)
+    try:
+        asyncio.run(forwarding.forward_message(make_event("fresh text 2"), "-202", "r1", 1, FakeMapping()))
+    finally:
+        forwarding.message_logger.removeFilter(drop)
+
+    assert scheduler.calls == [("send", -202, "FRESH TEXT 2")]
+    assert scheduler.routes == []
@@ -0,0 +1,15 @@
+import http_server
+
+def test_metrics_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(http_server, "METRICS_TOKEN", "")
+    response = http_server.app.test_client().get("/metrics")
+    assert response.status_code == 404
+
+def test_metrics_require_the_token(monkeypatch):
+    monkeypatch.setattr(http_server, "METRICS_TOKEN", "s3cret")
+    client = http_server.app.test_client()
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
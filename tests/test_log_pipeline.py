@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+import bot.log_pipeline
+from bot.log_pipeline import HotPathFilter, log_lazy
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def record(name="bot.forwarding.messages", level=logging.INFO, redirection="1:r1"):
+    entry = logging.LogRecord(name, level, __file__, 1, "message forwarded", None, None)
+    if redirection is not None:
+        entry.redirection = redirection
+    return entry
+
+def test_lines_are_limited_per_redirection_and_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.log_pipeline, "time", clock)
+    hot_filter = HotPathFilter(sample=1.0, limit=3, window=60)
+
+    assert [hot_filter.filter(record()) for _ in range(5)] == [True, True, True, False, False]
+    assert hot_filter.filter(record(redirection="1:r2"))  # other redirection, own budget
+    assert hot_filter.filter(record(level=logging.WARNING))  # warnings always pass
+    assert hot_filter.suppressed == 2
+    assert hot_filter.stats()['noisy'] == [["1:r1", 2]]
+
+    clock.now += 61
+    assert hot_filter.filter(record())
+
+def test_suppressed_count_is_logged_when_the_next_window_starts(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.log_pipeline, "time", clock)
+    hot_filter = HotPathFilter(sample=1.0, limit=1, window=60)
+    name = "tests.hot_path.messages"
+    summaries = []
+    handler = logging.Handler()
+    handler.emit = summaries.append
+    logger = logging.getLogger(name)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    try:
+        for _ in range(4):
+            hot_filter.filter(record(name))
+        clock.now += 60
+        assert hot_filter.filter(record(name))
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+    assert [entry.getMessage() for entry in summaries] == ["3 log lines suppressed for 1:r1 in the last 60s"]
+
+def test_sampling_per_logger(monkeypatch):
+    monkeypatch.setattr(bot.log_pipeline.random, "random", lambda: 0.5)
+    hot_filter = HotPathFilter(sample=1.0, limit=0, window=60)
+    hot_filter.configure(sample=0.1, logger_name="noisy.messages")
+    assert not hot_filter.filter(record("noisy.messages"))
+    assert hot_filter.filter(record("quiet.messages"))
+    assert hot_filter.sampled_out == 1
+
+    hot_filter.configure(sample=0.6)  # a global rate resets the per-logger ones
+    assert hot_filter.filter(record("noisy.messages"))
+    assert hot_filter.settings() == {'sample': 0.6, 'samples': {}, 'limit': 0, 'window': 60}
+
+def test_zero_limit_disables_rate_limiting():
+    hot_filter = HotPathFilter(sample=1.0, limit=0, window=60)
+    assert all(hot_filter.filter(record()) for _ in range(100))
+
+def test_lazy_line_is_only_built_when_emitted():
+    hot_filter = HotPathFilter(sample=1.0, limit=1, window=60)
+    emitted = []
+    handler = logging.Handler()
+    handler.emit = emitted.append
+    logger = logging.getLogger("tests.lazy.messages")
+    logger.addFilter(hot_filter)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    built = []
+
+    async def build():
+        built.append(1)
+        return "resolved name"
+
+    async def scenario():
+        for _ in range(3):
+            await log_lazy(logger, logging.INFO, build, extra={'redirection': "1:r1"})
+        await log_lazy(logger, logging.DEBUG, build)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        logger.removeFilter(hot_filter)
+        logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+    assert len(built) == 1
+    assert [entry.getMessage() for entry in emitted] == ["resolved name"]
+    assert emitted[0].redirection == "1:r1"
+    assert emitted[0].funcName == "scenario"
+    assert hot_filter.suppressed == 2
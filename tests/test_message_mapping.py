@@ -0,0 +1,60 @@
+import asyncio
+import sqlite3
+
+from bot.message_mapping import MessageMappingStore
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT source_chat, source_msg, dest_chat, dest_msg FROM message_mapping").fetchall()
+    finally:
+        conn.close()
+
+def test_index_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "mapping.db"
+    store = MessageMappingStore(str(path))
+    assert not path.exists()
+    assert store.get(1, 2, 3) is None
+    assert path.exists()
+    store.close()
+
+def test_mappings_are_written_in_one_batch(tmp_path):
+    path = str(tmp_path / "mapping.db")
+    store = MessageMappingStore(path, flush_delay=0.05)
+
+    async def scenario():
+        for i in range(100):
+            store.set(-100, i, -200, 1000 + i)
+        assert store.flush_count == 0  # nothing written on the event loop
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert store.flush_count == 1
+    assert len(rows(path)) == 100
+    store.close()
+
+def test_delete_before_the_write_is_not_resurrected(tmp_path):
+    path = str(tmp_path / "mapping.db")
+    store = MessageMappingStore(path, max_entries=1, flush_delay=0.05)
+
+    async def scenario():
+        store.set(-100, 1, -200, 11)
+        store.set(-100, 2, -200, 12)  # evicts message 1 from memory before it is written
+        assert store.get(-100, 1, -200) == 11
+        store.delete(-100, 2, -200)
+        assert store.get(-100, 2, -200) is None
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert rows(path) == [(-100, 1, -200, 11)]
+    store.close()
+
+def test_mappings_survive_a_restart(tmp_path):
+    path = str(tmp_path / "mapping.db")
+    store = MessageMappingStore(path)
+    store.set(-100, 1, -200, 11)  # no event loop: written synchronously
+    store.close()
+
+    reopened = MessageMappingStore(path)
+    assert reopened.get(-100, 1, -200) == 11
+    reopened.close()
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+from telethon.errors import FloodWaitError
+
+import bot.send_queue as send_queue
+from bot.send_queue import SendScheduler, TokenBucket, PRIORITY_EDIT
+
+def flood_wait(seconds):
+    error = FloodWaitError(request=None, capture=1)
+    error.seconds = seconds  # sub-second pauses keep the tests fast
+    return error
+
+def test_token_bucket_limits_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=100, capacity=1)
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The first token is the burst, the 10 others come at 100 per second
+    assert asyncio.run(scenario()) >= 0.09
+
+def test_edits_jump_ahead_of_queued_sends():
+    calls = []
+
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        release = asyncio.Event()
+
+        async def blocking():
+            calls.append("first")
+            await release.wait()
+
+        def call(name):
+            async def run():
+                calls.append(name)
+            return run
+
+        first = asyncio.create_task(scheduler.submit(blocking, 1))
+        while not calls:
+            await asyncio.sleep(0)
+        # Queued while the worker is busy with the first send
+        rest = [
+            asyncio.create_task(scheduler.submit(call("send 1"), 1)),
+            asyncio.create_task(scheduler.submit(call("send 2"), 1)),
+            asyncio.create_task(scheduler.submit(call("edit"), 1, PRIORITY_EDIT)),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first, *rest), 1)
+
+    asyncio.run(scenario())
+    assert calls == ["first", "edit", "send 1", "send 2"]
+
+def test_flood_wait_pauses_the_account_and_retries():
+    errors = [flood_wait(0.05)]
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if errors:
+            raise errors.pop()
+        return "sent"
+
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        result = await asyncio.wait_for(scheduler.submit(call, 1), 1)
+        return scheduler, result
+
+    scheduler, result = asyncio.run(scenario())
+    assert result == "sent"
+    assert attempts[1] - attempts[0] >= 0.04
+    assert scheduler.stats['flood_waits'] == 1
+    assert scheduler.stats['sent'] == 1
+
+def test_flood_wait_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(send_queue, "FLOOD_WAIT_MAX_RETRIES", 2)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise flood_wait(0)
+
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        with pytest.raises(FloodWaitError):
+            await asyncio.wait_for(scheduler.submit(call, 1), 1)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert len(attempts) == 3
+    assert scheduler.stats['failed'] == 1
+
+def test_flood_wait_too_long_is_not_retried():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise flood_wait(send_queue.FLOOD_WAIT_MAX_SECONDS + 1)
+
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        with pytest.raises(FloodWaitError):
+            await asyncio.wait_for(scheduler.submit(call, 1), 1)
+
+    asyncio.run(scenario())
+    assert len(attempts) == 1
+
+def test_idle_worker_is_dropped_and_recreated(monkeypatch):
+    monkeypatch.setattr(send_queue, "WORKER_IDLE_TIMEOUT", 0.01)
+
+    async def call():
+        return "sent"
+
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        assert await scheduler.submit(call, 1) == "sent"
+        await asyncio.sleep(0.05)
+        dest = scheduler.destinations[1]
+        assert dest['worker'] is None
+        bucket = dest['bucket']
+        assert await asyncio.wait_for(scheduler.submit(call, 1), 1) == "sent"
+        assert dest['worker'] is not None
+        assert dest['bucket'] is bucket
+
+    asyncio.run(scenario())
+
+def test_cancelled_call_resolves_the_caller_and_keeps_the_worker():
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def call():
+        return "sent"
+
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(scheduler.submit(cancelled, 1), 1)
+        assert await asyncio.wait_for(scheduler.submit(call, 1), 1) == "sent"
+        assert scheduler.stats['failed'] == 1
+
+    asyncio.run(scenario())
+
+def test_cancelled_worker_resolves_every_queued_send():
+    async def scenario():
+        scheduler = SendScheduler(client=None)
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        sends = [asyncio.create_task(scheduler.submit(hang, 1)) for _ in range(3)]
+        await started.wait()
+        scheduler.destinations[1]['worker'].cancel()
+        done, pending = await asyncio.wait(sends, timeout=1)
+        assert not pending
+        assert all(task.cancelled() for task in done)
+
+    asyncio.run(scenario())
@@ -0,0 +1,129 @@
+import gc
+import os
+import asyncio
+from datetime import datetime
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+import psycopg2.errors
+import psycopg2.extensions
+
+from bot.session_db import PostgresSessionDatabase
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        verb, name = sql.split()[:2]
+        if verb == "PREPARE":
+            self.conn.server_prepared.add(name)
+        elif verb == "EXECUTE" and name not in self.conn.server_prepared:
+            self.conn.log['unknown'] += 1
+            raise psycopg2.errors.InvalidSqlStatementName(f'prepared statement "{name}" does not exist')
+        self.conn.log['statements'].append(verb)
+
+    def fetchall(self):
+        return []
+
+class FakeConnection:
+    """Stand-in for a psycopg2 connection: tracks what the server has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        self.closed = 0
+        self.info = self
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.server_prepared = set()
+        self.log = {'unknown': 0, 'statements': []}  # outlives the connection
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def fake_connections(monkeypatch):
+    created = []
+
+    def connect(*args, **kwargs):
+        conn = FakeConnection()
+        created.append(conn.log)
+        return conn
+
+    monkeypatch.setattr(psycopg2, "connect", connect)
+    return created
+
+def test_new_pooled_connection_prepares_its_statements(fake_connections):
+    # minconn < maxconn: the pool closes surplus connections on putconn, and a
+    # new connection can land at the address (id) of a closed one
+    db = PostgresSessionDatabase("dbname=test", min_connections=1, max_connections=3)
+    try:
+        db._get_user_sessions(1)  # prepares get_user_sessions on the first connection
+        for _ in range(20):
+            held = [db.pool.getconn(), db.pool.getconn()]
+            for conn in held:
+                db.pool.putconn(conn)  # the second one is closed and dropped
+            del held, conn
+            gc.collect()
+            kept = db.pool.getconn()
+            db._get_user_sessions(1)  # runs on a brand new connection
+            db.pool.putconn(kept)
+            del kept
+            gc.collect()
+    finally:
+        db.close()
+
+    assert len(fake_connections) > 2
+    for log in fake_connections:
+        assert log['unknown'] == 0
+        assert log['statements'].count("PREPARE") <= 1
+
+def test_statement_dropped_by_server_is_prepared_again(fake_connections):
+    db = PostgresSessionDatabase("dbname=test", min_connections=1, max_connections=2)
+    try:
+        db._deactivate_session(1, "+100")
+        conn = db.pool.getconn()
+        conn.server_prepared.clear()  # DISCARD ALL, or a pooler handing over another backend
+        db.pool.putconn(conn)
+        db._deactivate_session(1, "+100")
+    finally:
+        db.close()
+
+    assert conn.log['unknown'] == 1
+    assert conn.log['statements'] == ["PREPARE", "EXECUTE", "PREPARE", "EXECUTE"]
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+def test_postgres_pool_round_trip():
+    db = PostgresSessionDatabase(os.environ["TEST_DATABASE_URL"], min_connections=1, max_connections=4)
+
+    async def scenario():
+        db.init_schema()
+        now = datetime.now().replace(microsecond=0)
+        # More concurrent queries than minconn: surplus connections are opened and closed
+        await asyncio.gather(*(
+            db.upsert_session(900000 + i, f"+{i}", f"session_{i}", now) for i in range(20)
+        ))
+        sessions = await asyncio.gather(*(db.get_user_sessions(900000 + i) for i in range(20)))
+        await asyncio.gather(*(db.deactivate_session(900000 + i, f"+{i}") for i in range(20)))
+        return sessions
+
+    try:
+        sessions = asyncio.run(scenario())
+    finally:
+        db.close()
+    assert [rows[0][0] for rows in sessions] == [f"+{i}" for i in range(20)]
@@ -0,0 +1,63 @@
+import asyncio
+
+from bot.session_manager import SessionManager
+
+def test_session_database_is_opened_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    manager = SessionManager()
+    assert list(tmp_path.iterdir()) == []
+    assert manager.db is not None
+    assert (tmp_path / "sessions.db").exists()
+    manager.close()
+
+class FlakyClient:
+    """TelegramClient whose first connect() fails with a network error"""
+    attempts = 0
+
+    def __init__(self, *args):
+        self.connected = False
+
+    async def connect(self):
+        FlakyClient.attempts += 1
+        if FlakyClient.attempts == 1:
+            raise ConnectionError("Connection to Telegram failed 5 time(s)")
+        self.connected = True
+
+    async def is_user_authorized(self):
+        return True
+
+    async def disconnect(self):
+        self.connected = False
+
+def test_transient_restore_failure_is_retried_not_deactivated(tmp_path, monkeypatch):
+    import bot.session_manager
+    import bot.entity_cache
+    from bot.connection import connection_registry
+    from bot.parallel_restore import restore_concurrently
+
+    monkeypatch.setattr(bot.session_manager, "TelegramClient", FlakyClient)
+    monkeypatch.setattr(bot.entity_cache, "prewarm_entity_cache", lambda client: None)
+    session_file = tmp_path / "session_1_100.session"
+    session_file.touch()
+    manager = SessionManager()
+    deactivated = []
+
+    async def deactivate_session(user_id, phone_number):
+        deactivated.append((user_id, phone_number))
+
+    async def update_session_activity(user_id, phone_number):
+        pass
+
+    monkeypatch.setattr(manager, "deactivate_session", deactivate_session)
+    monkeypatch.setattr(manager, "update_session_activity", update_session_activity)
+    try:
+        report = asyncio.run(restore_concurrently(
+            "test", [(1, "100", str(session_file))], manager._restore_session, retries=1
+        ))
+        assert report['retried'] == 1
+        assert report['succeeded'] == 1
+        assert deactivated == []
+        assert connection_registry.get_client(1, "100").connected
+    finally:
+        connection_registry.remove(1, "100")
@@ -0,0 +1,141 @@
+import json
+import time
+import asyncio
+
+from bot.storage import JsonStorage
+
+def read_file(path):
+    with open(path) as f:
+        return json.load(f)
+
+def test_mutations_are_coalesced_into_one_write(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"), flush_delay=0.05)
+
+    async def scenario():
+        for i in range(50):
+            storage.set_license(str(i), {"active": True})
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert storage.flush_count == 1
+    assert not storage.dirty
+    assert len(read_file(storage.path)["licenses"]) == 50
+
+def test_mutation_during_write_is_flushed(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"), flush_delay=0.01)
+    write = storage._write
+    writing = []
+
+    def slow_write(payload):
+        writing.append(True)
+        time.sleep(0.1)
+        write(payload)
+
+    storage._write = slow_write
+
+    async def scenario():
+        storage.set_license("1", {"active": True})
+        while not writing:
+            await asyncio.sleep(0.005)
+        # The first write is in the executor: this change is not in its payload
+        storage.set_license("2", {"active": True})
+        await asyncio.sleep(0.4)
+
+    asyncio.run(scenario())
+    assert not storage.dirty
+    assert set(read_file(storage.path)["licenses"]) == {"1", "2"}
+
+def test_failed_write_is_retried(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"), flush_delay=0.01)
+    write = storage._write
+    attempts = []
+
+    def flaky_write(payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            storage.dirty = True  # what _write does when the disk write fails
+            return
+        write(payload)
+
+    storage._write = flaky_write
+
+    async def scenario():
+        storage.set_license("1", {"active": True})
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert len(attempts) == 2
+    assert not storage.dirty
+    assert read_file(storage.path)["licenses"] == {"1": {"active": True}}
+
+def test_flush_without_event_loop_writes_synchronously(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"))
+    storage.set_license("1", {"active": True})
+    assert storage.flush_count == 1
+    assert read_file(storage.path)["licenses"] == {"1": {"active": True}}
+
+def test_flush_async_writes_pending_changes_now(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"), flush_delay=60)
+
+    async def scenario():
+        storage.set_license("1", {"active": True})
+        await storage.flush_async()
+        return read_file(storage.path)
+
+    assert asyncio.run(scenario())["licenses"] == {"1": {"active": True}}
+    assert not storage.dirty
+
+def slow_first_write(storage, writing):
+    write = storage._write
+
+    def slow_write(payload):
+        if not writing:
+            writing.append(True)
+            time.sleep(0.1)
+        write(payload)
+
+    storage._write = slow_write
+
+def test_flush_async_during_write_keeps_the_newest_data(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"), flush_delay=0.01)
+    writing = []
+    slow_first_write(storage, writing)
+
+    async def scenario():
+        storage.set_license("1", {"active": True})
+        while not writing:
+            await asyncio.sleep(0.005)
+        # The older payload is still being written when this one is flushed
+        storage.set_license("2", {"active": True})
+        await storage.flush_async()
+        flushed = read_file(storage.path)
+        await asyncio.sleep(0.1)
+        return flushed
+
+    flushed = asyncio.run(scenario())
+    assert set(flushed["licenses"]) == {"1", "2"}
+    assert set(read_file(storage.path)["licenses"]) == {"1", "2"}
+    assert not storage.dirty
+
+def test_sync_flush_during_write_is_not_overwritten(tmp_path):
+    storage = JsonStorage(str(tmp_path / "data.json"), flush_delay=0.01)
+    writing = []
+    slow_first_write(storage, writing)
+
+    async def scenario():
+        storage.set_license("1", {"active": True})
+        while not writing:
+            await asyncio.sleep(0.005)
+        storage.set_license("2", {"active": True})
+        storage.flush()  # e.g. reload() before the in-flight write lands
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert set(read_file(storage.path)["licenses"]) == {"1", "2"}
+    assert not storage.dirty
+
+def test_legacy_pending_redirections_are_dropped(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps({"licenses": {}, "pending_redirections": {"1": {"name": "r1"}}}))
+    storage = JsonStorage(str(path))
+    assert "pending_redirections" not in storage.load_all()
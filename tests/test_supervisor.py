@@ -0,0 +1,7 @@
+from bot.supervisor import ClientSupervisor
+
+def test_backoff_is_capped_after_many_failures():
+    supervisor = ClientSupervisor(registry=None, backoff_min=5.0, backoff_max=600)
+    assert 4 <= supervisor._backoff(0) <= 6
+    for failures in (20, 1100, 10 ** 6):
+        assert 480 <= supervisor._backoff(failures) <= 720
@@ -0,0 +1,72 @@
+import pytest
+
+import bot.database
+from bot.transform_pipeline import Pipeline, TransformationEngine, parse_transformation_config
+
+def test_steps_run_in_pipeline_order_whatever_the_stored_order():
+    steps = {
+        "format": parse_transformation_config("format", "📢 [[Message.Text]]\n— via TeleFeed"),
+        "removeLines": parse_transformation_config("removeLines", "publicité"),
+        "power": parse_transformation_config("power", "promo => offre; regex:\\d{2,} => #"),
+    }
+    pipeline = Pipeline(steps)
+    assert pipeline.types == ["power", "removeLines", "format"]
+    text = "Grosse promo -50\nPUBLICITÉ : lien\nfin"
+    assert pipeline.apply(text) == "📢 Grosse offre -#\nfin\n— via TeleFeed"
+
+def test_power_literals_prefer_the_longest_match():
+    pipeline = Pipeline({"power": parse_transformation_config("power", "chat => cat; chaton => kitten")})
+    assert pipeline.apply("un chaton et un chat") == "un kitten et un cat"
+
+def test_remove_lines_ignores_case():
+    pipeline = Pipeline({"removeLines": parse_transformation_config("removeLines", "Lien, t.me")})
+    assert pipeline.apply("a\nLIEN: x\nvoir t.me/abc\nb") == "a\nb"
+    assert pipeline.apply("rien à retirer") == "rien à retirer"
+
+@pytest.mark.parametrize("transform_type, text", [
+    ("format", "sans texte"),
+    ("power", "pas de flèche"),
+    ("power", "regex:( => x"),
+    ("removeLines", " , "),
+    ("inconnu", "x"),
+])
+def test_invalid_configurations_are_rejected(transform_type, text):
+    with pytest.raises(ValueError):
+        parse_transformation_config(transform_type, text)
+
+class FakeStorage:
+    def __init__(self, document):
+        self.document = document
+        self.reads = 0
+
+    def get_document(self, section, user_id):
+        self.reads += 1
+        return self.document
+
+def rules(version, steps):
+    return {"version": version, "steps": steps}
+
+def test_unchanged_versions_reuse_their_compiled_pipeline(monkeypatch):
+    storage = FakeStorage({
+        "r1": rules(1, {"power": [["a", "b"]]}),
+        "r2": rules(1, {"power": [["x", "y"]]}),
+    })
+    monkeypatch.setattr(bot.database, "storage", storage)
+    engine = TransformationEngine()
+
+    assert engine.apply(1, "r1", "abc") == "bbc"
+    assert engine.apply(1, "r2", "xyz") == "yyz"
+    assert engine.apply(1, "r3", "abc") == "abc"
+    assert not engine.has_transformations(1, "r3")
+    first = dict(engine._user_pipelines(1))
+    assert storage.reads == 1
+
+    storage.document = {
+        "r1": rules(1, {"power": [["a", "b"]]}),
+        "r2": rules(2, {"power": [["x", "z"]]}),
+    }
+    engine.invalidate(1)
+    assert engine.apply(1, "r2", "xyz") == "zyz"
+    assert storage.reads == 2
+    assert engine._user_pipelines(1)["r1"] is first["r1"]  # same version: not recompiled
+    assert engine._user_pipelines(1)["r2"] is not first["r2"]